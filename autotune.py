@@ -0,0 +1,333 @@
+import argparse
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cascade_controller import PROFILES, CascadeController
+from simulator import BallBeam, SimCamera, SimServo, model_plant, simulate
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CACHE_FILE = os.path.join(DATA_DIR, 'autotune_cache.jsonl')
+GAINS_FILE = os.path.join(DATA_DIR, 'tuned_gains.json')
+
+# 搜索的参数: (下限, 上限, 是否按对数均匀取值)，积分项为0，积分限幅沿用CascadeController的默认值
+SEARCH_SPACE = {
+    'pos_kp': (0.5, 10.0, True),
+    'pos_kd': (0.0, 2.0, False),
+    'degree_kp': (0.05, 1.0, True),
+    'degree_kd': (0.0, 0.05, False),
+    'fine_kp': (0.01, 0.5, True),
+    'fine_kd': (0.0, 0.02, False),
+}
+DEFAULT_GAINS = {'pos_kp': 4, 'pos_kd': 0.6, 'degree_kp': 0.22, 'degree_kd': 0.01, 'fine_kp': 0.05, 'fine_kd': 0.005}
+
+# 评估场景: (初始位置 mm, 目标位置 mm, 噪声种子)
+SCENARIOS = [(-120.0, 0.0, 0), (120.0, 0.0, 1), (-100.0, 50.0, 2), (100.0, -50.0, 3)]
+
+# 题目指标: 10 s内稳定，超调不大于10 mm，误差不大于3 mm
+MAX_SETTLE = 10.0
+MAX_OVERSHOOT = 10.0
+MAX_ERROR = 3.0
+# 代价和达标判断的版本，修改evaluate的评分方法时加1，使缓存中的旧结果失效
+SCORE_VERSION = 1
+
+
+def controller_kwargs(gains):
+    """把搜索参数换成CascadeController的参数"""
+    return {
+        'pos_gains': (gains['pos_kp'], 0, gains['pos_kd'], 30),
+        'degree_gains': (gains['degree_kp'], 0, gains['degree_kd'], 10000),
+        'fine_tune_gains': (gains['fine_kp'], 0, gains['fine_kd'], 5),
+    }
+
+
+def evaluate(gains, scenarios=SCENARIOS, duration=MAX_SETTLE + 2.0, table='main', model=None):
+    """
+    在仿真模型上评估一组参数（进程池中运行）
+
+    Args:
+        gains: {参数名: 值}
+        scenarios: 评估场景
+        duration: 每个场景的仿真时长 (s)，比稳定时间上限多留2 s用于确认已稳定
+        table: 模式切换阈值表，ModeTable或PROFILES中的名称
+        model: system_id.PlantModel，使用辨识的轨道参数和纯滞后，None时使用仿真器的默认参数
+
+    Returns:
+        {'cost': 代价, 'passed': 满足全部指标的场景数, 'settle': 最长稳定时间,
+         'overshoot': 最大超调, 'error': 最大最终误差}
+    """
+    costs, settles, overshoots, errors = [], [], [], []
+    passed = 0
+    for initial, target, seed in scenarios:
+        plant, camera = None, SimCamera(seed=seed)
+        if model is not None:
+            plant, latency = model_plant(model)
+            camera = SimCamera(latency=latency, seed=seed)
+        result = simulate(CascadeController(table=table, **controller_kwargs(gains)), duration=duration,
+                          target=target, initial_position=initial, plant=plant, camera=camera)
+        settle = result.settle_time if result.settle_time is not None else duration
+        # 代价: 稳定时间，加上超出指标部分的惩罚
+        cost = settle + max(0.0, settle - MAX_SETTLE) * 5
+        cost += max(0.0, result.overshoot - MAX_OVERSHOOT) * 0.5
+        cost += max(0.0, result.final_error - MAX_ERROR) * 2
+        if result.settle_time is not None and settle <= MAX_SETTLE and \
+                result.overshoot <= MAX_OVERSHOOT and result.final_error <= MAX_ERROR:
+            passed += 1
+        costs.append(cost)
+        settles.append(settle)
+        overshoots.append(result.overshoot)
+        errors.append(result.final_error)
+    return {'cost': float(np.mean(costs)), 'passed': passed, 'settle': max(settles),
+            'overshoot': max(overshoots), 'error': max(errors)}
+
+
+def _defaults(func):
+    """函数的默认参数 {参数名: 默认值}"""
+    return {name: p.default for name, p in inspect.signature(func).parameters.items()
+            if p.default is not inspect.Parameter.empty and isinstance(p.default, (int, float, str, type(None)))}
+
+
+def config_hash(scenarios=SCENARIOS, duration=MAX_SETTLE + 2.0, table='main', model=None):
+    """
+    评估条件的摘要：场景、仿真时长、阈值表、仿真器和模型参数、评分版本，
+    其中任何一项改变后缓存中的旧结果不会被误用
+    """
+    table = PROFILES[table] if isinstance(table, str) else table
+    config = {
+        'score_version': SCORE_VERSION,
+        'scenarios': scenarios,
+        'duration': duration,
+        'table': table._asdict(),
+        'model': model._asdict() if model is not None else None,
+        'plant': _defaults(BallBeam.__init__),
+        'servo': _defaults(SimServo.__init__),
+        'camera': _defaults(SimCamera.__init__),
+        'simulate': _defaults(simulate),
+        'model_plant': _defaults(model_plant),
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cache_key(gains, config):
+    """参数按6位有效数字取整，连同评估条件的摘要 (config_hash) 作为缓存的键"""
+    return json.dumps({'gains': {k: float(f"{gains[k]:.6g}") for k in sorted(gains)}, 'config': config})
+
+
+def load_cache(path):
+    """读取已评估的结果 {键: 结果}，文件末尾写到一半的行被忽略"""
+    cache = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                cache[entry['key']] = entry
+    except OSError:
+        pass
+    return cache
+
+
+def _scale(name, u):
+    """把[0, 1]中的值映射到参数范围"""
+    low, high, log = SEARCH_SPACE[name]
+    if log:
+        return math.exp(math.log(low) + u * (math.log(high) - math.log(low)))
+    return low + u * (high - low)
+
+
+def _unscale(name, value):
+    low, high, log = SEARCH_SPACE[name]
+    if log:
+        return (math.log(value) - math.log(low)) / (math.log(high) - math.log(low))
+    return (value - low) / (high - low)
+
+
+def grid_candidates(levels):
+    """每个参数取levels个等间距值的全部组合"""
+    names = list(SEARCH_SPACE)
+    points = [i / (levels - 1) for i in range(levels)] if levels > 1 else [0.5]
+    return [{name: _scale(name, u) for name, u in zip(names, combo)}
+            for combo in itertools.product(points, repeat=len(names))]
+
+
+def random_candidates(n, rng):
+    """在参数范围内均匀（对数参数按对数均匀）随机取n组"""
+    return [{name: _scale(name, rng.random()) for name in SEARCH_SPACE} for _ in range(n)]
+
+
+def refine_candidates(results, n, spread, rng, top=5):
+    """
+    在当前最好的top组参数附近按正态分布取n组（归一化空间中标准差为spread）
+
+    Args:
+        results: [(gains, 结果), ...]，按排名排序
+    """
+    parents = [gains for gains, _ in results[:top]]
+    candidates = []
+    for i in range(n):
+        parent = parents[i % len(parents)]
+        candidates.append({name: _scale(name, min(1.0, max(0.0, _unscale(name, parent[name]) + rng.normal(0, spread))))
+                           for name in SEARCH_SPACE})
+    return candidates
+
+
+def rank(results):
+    """按满足指标的场景数从多到少、代价从小到大排序"""
+    return sorted(results, key=lambda item: (-item[1]['passed'], item[1]['cost']))
+
+
+class AutoTuner:
+    """
+    PID参数自动整定
+    候选参数在进程池中并行评估，每个结果立即追加到缓存文件，中断后重新运行会跳过已评估的参数
+    """
+    def __init__(self, workers=None, cache_file=CACHE_FILE, table='main', model=None, scenarios=SCENARIOS,
+                 duration=MAX_SETTLE + 2.0):
+        """
+        Args:
+            workers: 进程数，None时使用全部CPU
+            cache_file: 结果缓存文件 (JSON Lines)，None时不缓存
+            table, model, scenarios, duration: 评估条件，见evaluate
+        """
+        self.workers = workers or os.cpu_count()
+        self.table = table
+        self.model = model
+        self.scenarios = scenarios
+        self.duration = duration
+        self.config = config_hash(scenarios, duration, table, model)
+        self.cache_file = cache_file
+        self.cache = load_cache(cache_file) if cache_file else {}
+        self.evaluated = 0  # 本次实际运行的评估数
+        self.cached = 0     # 从缓存中取得的评估数
+
+    def run(self, candidates):
+        """
+        评估一批候选参数
+
+        Returns:
+            [(gains, 结果), ...]，与candidates顺序一致
+        """
+        keys = [cache_key(gains, self.config) for gains in candidates]
+        todo = {}
+        for key, gains in zip(keys, candidates):
+            if key in self.cache:
+                self.cached += 1
+            else:
+                todo[key] = gains
+        if todo:
+            if self.cache_file:
+                os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            out = open(self.cache_file, 'a', encoding='utf-8') if self.cache_file else None
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    futures = {pool.submit(evaluate, gains, self.scenarios, self.duration, self.table, self.model): key
+                               for key, gains in todo.items()}
+                    for future in as_completed(futures):
+                        key = futures[future]
+                        entry = {'key': key, 'gains': todo[key], 'result': future.result()}
+                        self.cache[key] = entry
+                        self.evaluated += 1
+                        if out is not None:
+                            out.write(json.dumps(entry) + '\n')
+                            out.flush()
+            finally:
+                if out is not None:
+                    out.close()
+        return [(self.cache[key]['gains'], self.cache[key]['result']) for key in keys]
+
+    def search(self, method='refine', samples=200, levels=3, rounds=4, seed=0):
+        """
+        搜索参数
+
+        Args:
+            method: 'grid' 网格搜索，'random' 随机搜索，或 'refine' 随机搜索后在最好的参数附近逐轮缩小范围
+            samples: random的总数，refine每轮的数量
+            levels: grid每个参数的取值个数
+            rounds: refine的轮数（含第一轮随机搜索）
+            seed: 随机数种子
+
+        Returns:
+            排好序的 [(gains, 结果), ...]
+        """
+        rng = np.random.default_rng(seed)
+        if method == 'grid':
+            results = self.run(grid_candidates(levels))
+        elif method == 'random':
+            results = self.run([dict(DEFAULT_GAINS)] + random_candidates(samples, rng))
+        elif method == 'refine':
+            results = self.run([dict(DEFAULT_GAINS)] + random_candidates(samples, rng))
+            spread = 0.15
+            for _ in range(rounds - 1):
+                results = rank(results)
+                results += self.run(refine_candidates(results, samples, spread, rng))
+                spread /= 2
+        else:
+            raise ValueError(f"未知的搜索方法: {method}")
+        return rank(results)
+
+
+def print_table(results, top=10):
+    """打印排名表"""
+    names = list(SEARCH_SPACE)
+    print(f"{'排名':>4} {'达标':>4} {'代价':>7} {'稳定(s)':>8} {'超调(mm)':>9} {'误差(mm)':>9}  " +
+          ' '.join(f"{name:>10}" for name in names))
+    for i, (gains, r) in enumerate(results[:top], 1):
+        print(f"{i:>4} {r['passed']:>2}/{len(SCENARIOS)} {r['cost']:>7.2f} {r['settle']:>8.2f} "
+              f"{r['overshoot']:>9.1f} {r['error']:>9.2f}  " + ' '.join(f"{gains[name]:>10.4g}" for name in names))
+
+
+def save_gains(gains, result, path=GAINS_FILE, **attrs):
+    """保存参数文件，可用cascade_controller.load_gains读取，attrs为附加的评估条件"""
+    data = dict(controller_kwargs(gains))
+    data['metrics'] = result
+    data['scenarios'] = SCENARIOS
+    data.update(attrs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+if __name__ == "__main__":
+    # 用法: python autotune.py [--method refine|random|grid] [--samples 200] [--levels 3] [--rounds 4]
+    #                          [--table main] [--model data/plant_model.json]
+    # 结果缓存在 data/autotune_cache.jsonl，中断后重新运行同样的命令会接着算；最好的参数保存到 data/tuned_gains.json
+    parser = argparse.ArgumentParser(description='在仿真模型上自动整定级联PID参数')
+    parser.add_argument('--method', default='refine', choices=['grid', 'random', 'refine'])
+    parser.add_argument('--samples', type=int, default=200, help='random的总数，refine每轮的数量')
+    parser.add_argument('--levels', type=int, default=3, help='grid每个参数的取值个数')
+    parser.add_argument('--rounds', type=int, default=4, help='refine的轮数')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认使用全部CPU')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--table', default='main', choices=sorted(PROFILES), help='模式切换阈值表')
+    parser.add_argument('--model', default=None, help='system_id.py保存的模型文件，在辨识的模型上整定')
+    parser.add_argument('--top', type=int, default=10, help='显示的排名数')
+    parser.add_argument('--no-cache', action='store_true', help='不读写缓存')
+    parser.add_argument('--out', default=GAINS_FILE, help='参数文件路径')
+    args = parser.parse_args()
+
+    plant_model = None
+    if args.model:
+        from system_id import load_model
+        plant_model = load_model(args.model)
+    tuner = AutoTuner(args.workers, None if args.no_cache else CACHE_FILE, args.table, plant_model)
+    start = time.perf_counter()
+    results = tuner.search(args.method, args.samples, args.levels, args.rounds, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"评估 {tuner.evaluated} 组，缓存命中 {tuner.cached} 组，{tuner.workers} 个进程，耗时 {elapsed:.1f} s")
+    print_table(results, args.top)
+
+    default = tuner.run([dict(DEFAULT_GAINS)])[0][1]
+    print(f"当前手调参数: 达标 {default['passed']}/{len(SCENARIOS)}, 代价 {default['cost']:.2f}, "
+          f"稳定 {default['settle']:.2f} s, 超调 {default['overshoot']:.1f} mm, 误差 {default['error']:.2f} mm")
+    best_gains, best = results[0]
+    save_gains(best_gains, best, args.out, table=args.table, model=args.model)
+    print(f"最好的参数已保存到 {args.out}")
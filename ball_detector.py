@@ -0,0 +1,354 @@
+import math
+
+import cv2
+import numpy as np
+
+from color_lut import LutSegmenter
+
+
+# 红色在HSV色相环的两端，需要两段范围
+RED_HSV_RANGES = [
+    ((0, 120, 70), (10, 255, 255)),
+    ((170, 120, 70), (180, 255, 255)),
+]
+
+# 绿色的HSV范围
+GREEN_HSV_RANGES = [
+    ((35, 100, 50), (85, 255, 255)),
+]
+
+
+def locate_contour(mask):
+    """
+    用轮廓+最小外接圆定位最大色块（原有方法）
+
+    Returns:
+        (x, y, area, radius)，没有色块时返回None
+    """
+    # 只需要外轮廓，不需要层级结构
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return None
+
+    # 找到最大轮廓并获取最小外接圆
+    c = max(contours, key=cv2.contourArea)
+    ((x, y), radius) = cv2.minEnclosingCircle(c)
+    return x, y, cv2.contourArea(c), radius
+
+
+def locate_components(mask):
+    """
+    用连通域统计一次性定位最大色块
+    质心为亚像素精度，半径取与色块面积相同的圆的等效半径
+
+    Returns:
+        (x, y, area, radius)，没有色块时返回None
+    """
+    n, _, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if n <= 1:  # 只有背景
+        return None
+
+    # 第0个连通域是背景
+    i = 1 + int(stats[1:, cv2.CC_STAT_AREA].argmax())
+    area = float(stats[i, cv2.CC_STAT_AREA])
+    x, y = centroids[i]
+    return float(x), float(y), area, math.sqrt(area / math.pi)
+
+
+def locate_strip(mask, min_fill=0.25):
+    """
+    把轨道条带内的掩码投影到x轴，在一维分布上定位小球
+    取投影最大的列，向两侧扩展到低于峰值min_fill倍的位置，在该区间内求质心
+
+    Returns:
+        (x, area, radius)，没有色块时返回None
+    """
+    profile = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    peak = int(profile.argmax())
+    if profile[peak] == 0:
+        return None
+
+    above = profile >= max(1, profile[peak] * min_fill)
+    left = peak
+    while left > 0 and above[left - 1]:
+        left -= 1
+    right = peak + 1
+    while right < len(profile) and above[right]:
+        right += 1
+
+    weights = profile[left:right]
+    total = float(weights.sum())
+    x = float(np.dot(np.arange(left, right), weights)) / total
+    return x, total / 255, (right - left) / 2
+
+
+LOCATORS = {
+    'contour': locate_contour,
+    'components': locate_components,
+}
+
+
+class BallDetector:
+    """
+    小球检测器
+    找到小球后进入跟踪模式，后续帧只对预测位置附近的ROI做颜色转换和阈值处理，
+    ROI内丢失小球时自动退回全画面搜索。
+    条带模式下只处理覆盖轨道的水平条带，条带标定无效时退回二维检测
+    """
+    def __init__(self, hsv_ranges=RED_HSV_RANGES, min_radius=10, roi_tracking=True,
+                 roi_margin=40, roi_scale=2.0, use_lut=False, lut_bits=6, locator='components',
+                 mode='2d', band=None, band_scale=1.5):
+        """
+        初始化小球检测器
+
+        Args:
+            hsv_ranges: HSV阈值范围列表，形如 [((h, s, v), (h, s, v)), ...]
+            min_radius: 最小半径，小于等于该值的轮廓视为噪点
+            roi_tracking: 是否启用ROI跟踪模式
+            roi_margin: ROI在预测位置外额外扩展的像素数
+            roi_scale: ROI半宽相对小球半径的倍数
+            use_lut: 是否使用预计算的BGR查找表代替HSV转换和阈值处理（红色两段阈值时约快三成，单段阈值的绿色没有加速）
+            lut_bits: 查找表每个颜色通道的量化位数，位数越多越接近HSV阈值（范围内颜色的误判率5位约3.5%、6位约1.7%、8位为0），
+                查表速度相同，但8位建表约需2.4 s
+            locator: 色块定位方法，'components'为连通域质心，'contour'为轮廓外接圆
+            mode: 检测模式，'2d'为二维色块检测，'strip'为只处理轨道条带的一维投影检测
+            band: 轨道条带的纵坐标范围 (y0, y1)，为None时由第一次二维检测结果自动标定
+            band_scale: 自动标定时条带半高相对小球半径的倍数
+        """
+        self.hsv_ranges = hsv_ranges
+        self.min_radius = min_radius
+        self.roi_tracking = roi_tracking
+        self.roi_margin = roi_margin
+        self.roi_scale = roi_scale
+        self.segmenter = LutSegmenter(hsv_ranges, bits=lut_bits) if use_lut else None
+        self.locate = LOCATORS[locator]
+        self.mode = mode
+        self.band = band
+        self.band_scale = band_scale
+        self.reset()
+
+    def set_band(self, band):
+        """设置轨道条带的纵坐标范围 (y0, y1)，None表示重新自动标定"""
+        self.band = band
+
+    def band_valid(self, frame_shape):
+        """条带标定是否可用（在画面内且至少能容纳一个最小尺寸的小球）"""
+        if self.band is None:
+            return False
+        y0, y1 = self.band
+        return 0 <= y0 and y1 <= frame_shape[0] and y1 - y0 > 2 * self.min_radius
+
+    def set_hsv_ranges(self, hsv_ranges):
+        """修改HSV阈值范围，使用查找表时同时重建查找表"""
+        self.hsv_ranges = hsv_ranges
+        if self.segmenter is not None:
+            self.segmenter.set_ranges(hsv_ranges)
+
+    def reset(self):
+        """重置跟踪状态，下一帧进行全画面搜索"""
+        self.last_ball = None
+        self.last_area = 0.0
+        self.velocity = (0.0, 0.0)  # 像素/帧
+        self.roi_count = 0    # ROI内检测成功次数
+        self.full_count = 0   # 全画面搜索次数
+        self.lost_count = 0   # 全画面也未找到的次数
+        self.strip_count = 0  # 条带内检测成功次数
+
+    def make_mask(self, hsv):
+        """根据HSV范围生成二值掩码"""
+        mask = None
+        for lower, upper in self.hsv_ranges:
+            part = cv2.inRange(hsv, lower, upper)
+            mask = part if mask is None else cv2.bitwise_or(mask, part)
+        return mask
+
+    def segment(self, image):
+        """将BGR图像转换为二值掩码"""
+        if self.segmenter is not None:
+            return self.segmenter.segment(image)
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        return self.make_mask(hsv)
+
+    def find_ball(self, image):
+        """
+        在BGR图像中查找最大的小球色块
+
+        Returns:
+            ((x, y), radius, area)，未找到时返回None
+        """
+        blob = self.locate(self.segment(image))
+        if blob is None:
+            return None
+
+        x, y, area, radius = blob
+        if radius <= self.min_radius:  # 过滤小噪点
+            return None
+        return ((x, y), radius, area)
+
+    def find_ball_strip(self, frame):
+        """
+        只在轨道条带内用一维投影查找小球
+
+        Returns:
+            ((x, y), radius, area)，未找到时返回None
+        """
+        y0, y1 = self.band
+        blob = locate_strip(self.segment(frame[y0:y1]))
+        if blob is None:
+            return None
+
+        x, area, radius = blob
+        if radius <= self.min_radius:  # 过滤小噪点
+            return None
+        return ((x, (y0 + y1) / 2), radius, area)
+
+    def calibrate_band(self, ball, frame_shape):
+        """根据二维检测到的小球自动标定轨道条带"""
+        (_, y), radius, _ = ball
+        half = radius * self.band_scale
+        self.band = (max(0, int(y - half)), min(frame_shape[0], int(y + half) + 1))
+        print(f"轨道条带已标定: y = {self.band[0]} ~ {self.band[1]}")
+
+    def predict_roi(self, frame_shape):
+        """
+        根据上一帧位置和速度计算本帧的ROI
+
+        Returns:
+            (x0, y0, x1, y1)
+        """
+        (x, y), radius = self.last_ball
+        vx, vy = self.velocity
+        px = x + vx
+        py = y + vy
+
+        half = int(radius * self.roi_scale + self.roi_margin + max(abs(vx), abs(vy)))
+        height, width = frame_shape[:2]
+        x0 = max(0, int(px) - half)
+        y0 = max(0, int(py) - half)
+        x1 = min(width, int(px) + half)
+        y1 = min(height, int(py) + half)
+        return x0, y0, x1, y1
+
+    def detect(self, frame):
+        """
+        检测一帧中的小球
+
+        Args:
+            frame: BGR图像
+
+        Returns:
+            ((x, y), radius)，以整幅图像为坐标系；未找到时返回None
+        """
+        if self.mode == 'strip' and self.band_valid(frame.shape):
+            ball = self.find_ball_strip(frame)
+            if ball is not None:
+                self.strip_count += 1
+                return self.accept(ball)
+
+        # 条带标定无效或条带内未找到时使用二维检测
+        ball = self.detect_2d(frame)
+        if ball is None:
+            self.lost_count += 1
+            self.last_ball = None
+            self.velocity = (0.0, 0.0)
+            return None
+
+        if self.mode == 'strip' and self.band is None:
+            self.calibrate_band(ball, frame.shape)
+        return self.accept(ball)
+
+    def detect_2d(self, frame):
+        """
+        二维色块检测，跟踪模式下优先搜索ROI
+
+        Returns:
+            ((x, y), radius, area)，未找到时返回None
+        """
+        ball = None
+
+        if self.roi_tracking and self.last_ball is not None:
+            x0, y0, x1, y1 = self.predict_roi(frame.shape)
+            if x1 > x0 and y1 > y0:
+                found = self.find_ball(frame[y0:y1, x0:x1])
+                if found is not None:
+                    (rx, ry), radius, area = found
+                    # 外接圆贴到ROI边缘说明小球可能被截断，改用全画面结果
+                    inside = (rx - radius > 0 or x0 == 0) and (ry - radius > 0 or y0 == 0) \
+                        and (rx + radius < x1 - x0 or x1 == frame.shape[1]) \
+                        and (ry + radius < y1 - y0 or y1 == frame.shape[0])
+                    if inside:
+                        ball = ((rx + x0, ry + y0), radius, area)
+                        self.roi_count += 1
+
+        if ball is None:
+            # 未跟踪或ROI内丢失，退回全画面搜索
+            self.full_count += 1
+            ball = self.find_ball(frame)
+        return ball
+
+    def accept(self, ball):
+        """记录检测结果，更新跟踪状态"""
+        (x, y), radius, self.last_area = ball
+        if self.last_ball is not None:
+            (lx, ly), _ = self.last_ball
+            self.velocity = (x - lx, y - ly)
+        self.last_ball = ((x, y), radius)
+        return self.last_ball
+
+
+if __name__ == "__main__":
+    # 速度测试：可传入录制的视频文件，否则使用640x480的合成画面
+    import sys
+    import time
+
+    frames = []
+    if len(sys.argv) > 1:
+        cap = cv2.VideoCapture(sys.argv[1])
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    else:
+        rng = np.random.default_rng(0)
+        for i in range(200):
+            frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+            cv2.circle(frame, (100 + 2 * i, 240), 20, (0, 0, 255), -1)
+            # 加入少量噪点，模拟真实画面中的边缘抖动
+            noise = rng.integers(-40, 40, frame.shape, dtype=np.int16)
+            frames.append(np.clip(frame + noise, 0, 255).astype(np.uint8))
+    n = len(frames)
+    print(f"共 {n} 帧")
+
+    # 只比较色块定位本身的耗时
+    reference = BallDetector(RED_HSV_RANGES)
+    masks = [reference.make_mask(cv2.cvtColor(f, cv2.COLOR_BGR2HSV)) for f in frames]
+    for locator in LOCATORS:
+        start = time.perf_counter()
+        ys = []
+        for mask in masks:
+            blob = LOCATORS[locator](mask)
+            if blob is not None:
+                ys.append(blob[1])
+        elapsed = time.perf_counter() - start
+        print(f"定位方法 {locator}: {elapsed / n * 1000:.3f} ms/帧, 纵坐标抖动(标准差) {np.std(ys):.3f} px")
+
+    detector = BallDetector(RED_HSV_RANGES, mode='strip')
+    start = time.perf_counter()
+    for frame in frames:
+        detector.detect(frame)
+    elapsed = time.perf_counter() - start
+    print(f"轨道条带: {elapsed / n * 1000:.3f} ms/帧 "
+          f"(条带 {detector.strip_count}, 全画面 {detector.full_count}, 丢失 {detector.lost_count})")
+
+    for roi_tracking, use_lut in ((False, False), (True, False), (True, True)):
+        for locator in LOCATORS:
+            detector = BallDetector(RED_HSV_RANGES, roi_tracking=roi_tracking, use_lut=use_lut, locator=locator)
+            start = time.perf_counter()
+            for frame in frames:
+                detector.detect(frame)
+            elapsed = time.perf_counter() - start
+            mode = ("ROI跟踪" if roi_tracking else "全画面") + ("+查找表" if use_lut else "") + f" ({locator})"
+            print(f"{mode}: {elapsed / n * 1000:.3f} ms/帧 "
+                  f"(ROI {detector.roi_count}, 全画面 {detector.full_count}, 丢失 {detector.lost_count})")
@@ -0,0 +1,343 @@
+import argparse
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from cascade_controller import PROFILES, CascadeController, load_gains
+from simulator import G, STEP_ANGLE
+
+BatchResult = namedtuple('BatchResult', ['scenarios', 'settle_time', 'overshoot', 'final_error'])
+BatchResult.__doc__ = """
+批量仿真的结果，每个字段是长度为场景数的numpy数组
+scenarios: 各场景的参数 {名称: 数组}
+settle_time: 误差进入并保持在容差内的时刻 (s)，没有稳定时为nan
+overshoot: 越过目标位置的最大距离 (mm)
+final_error: 结束时的误差绝对值 (mm)
+"""
+
+# 随机场景各参数的取值范围 (下限, 上限)，均匀分布
+DEFAULT_RANGES = {
+    'fps': (25.0, 35.0),          # 相机帧率
+    'latency': (0.03, 0.10),      # 相机采集到控制循环取到帧的延迟 (s)
+    'noise': (0.5, 2.0),          # 像素噪声标准差 (px)
+    'beam_ratio': (0.45, 0.65),   # 连杆比例，同时代表小球转动惯量不同带来的加速度差异
+    'damping': (0.1, 0.6),        # 滚动阻力系数 (1/s)
+    'level': (2080.0, 2120.0),    # 轨道实际水平时的舵机位置，控制器按2100计算 (green_ball_tracker.py中为2080)
+    'initial': (80.0, 140.0),     # 小球初始位置距目标的距离 (mm)，左右随机
+    'target': (-50.0, 50.0),      # 目标位置 (mm)
+}
+
+
+def sample_scenarios(n, seed=None, **ranges):
+    """
+    随机生成n个场景
+
+    Args:
+        n: 场景数
+        seed: 随机数种子
+        ranges: 覆盖DEFAULT_RANGES中的范围，如 latency=(0.05, 0.05) 固定延迟
+
+    Returns:
+        {参数名: 长度为n的数组}
+    """
+    rng = np.random.default_rng(seed)
+    limits = dict(DEFAULT_RANGES, **ranges)
+    scenarios = {name: rng.uniform(low, high, n) for name, (low, high) in limits.items()}
+    scenarios['initial'] = scenarios['target'] + scenarios['initial'] * rng.choice((-1.0, 1.0), n)
+    return scenarios
+
+
+class BatchPID:
+    """
+    一组相互独立的PID，与pid.PID的算法相同，状态为数组
+    """
+    def __init__(self, n, Kp, Ki, Kd, lim):
+        self.Kp = Kp
+        self.Ki = Ki
+        self.Kd = Kd
+        self.lim = lim
+        self.prev_error = np.zeros(n)
+        self.integral = np.zeros(n)
+
+    def update(self, idx, setpoint, measured_value, dt):
+        """
+        更新idx中的PID
+
+        Args:
+            idx: 要更新的PID序号数组
+            setpoint, measured_value, dt: 与idx等长的数组
+
+        Returns:
+            控制输出数组
+        """
+        error = setpoint - measured_value
+        integral = self.integral[idx] + np.where(np.abs(error) > self.lim, 0.0, error * dt)
+        self.integral[idx] = integral
+        derivative = (error - self.prev_error[idx]) / dt
+        self.prev_error[idx] = error
+        return self.Kp * error + self.Ki * integral + self.Kd * derivative
+
+
+def batch_simulate(scenarios, controller=None, duration=10.0, max_speed=3400, servo_tau=0.03, half_length=150.0,
+                   measurement_noise=1.0, process_noise=2e4, command_latency=0.005, physics_dt=0.002,
+                   tolerance=3.0, seed=None):
+    """
+    同时仿真多个相互独立的小球-轨道闭环，模型与simulator.simulate相同，但所有实例以numpy数组一起推进
+
+    Args:
+        scenarios: {参数名: 数组}，参数见DEFAULT_RANGES，可用sample_scenarios生成
+        controller: CascadeController，只使用其PID参数和模式阈值表，None时使用默认参数
+        duration: 仿真时长 (s)
+        max_speed, servo_tau: 舵机最大速度 (步/s) 和一阶滞后时间常数 (s)
+        half_length: 轨道有效长度的一半 (mm)
+        measurement_noise, process_noise: 卡尔曼滤波器('cv')的参数，与state_estimator.KalmanFilter相同
+        command_latency: 舵机指令从发送到生效的延迟 (s)
+        physics_dt: 物理仿真步长 (s)
+        tolerance: 判断稳定的误差容差 (mm)
+        seed: 相机噪声的随机数种子
+
+    Returns:
+        BatchResult
+    """
+    controller = controller or CascadeController()
+    rng = np.random.default_rng(seed)
+    s = {name: np.asarray(value, dtype=np.float64) for name, value in scenarios.items()}
+    n = len(s['fps'])
+    period = 1.0 / s['fps']
+    latency = s['latency']
+    target = s['target']
+    table = controller.table
+    center = table.center
+    pos_pid, degree_pid, fine_tune_pid = (
+        BatchPID(n, pid.Kp, pid.Ki, pid.Kd, pid.lim)
+        for pid in (controller.pos_pid, controller.degree_pid, controller.fine_tune_pid))
+    acc_gain = 5.0 / 7.0 * G
+
+    # 小球、舵机
+    position = s['initial'].copy()
+    speed = np.zeros(n)
+    servo = np.full(n, float(center))
+    goal = servo.copy()
+    speed_limit = np.full(n, float(max_speed))
+    # 最近的小球位置，帧在采集后latency才被处理，处理时从这里取采集时刻的位置
+    history_len = int(math.ceil(latency.max() / physics_dt)) + 2
+    history = np.empty((history_len, n))
+    # 相机帧: 下一个要处理的帧序号
+    frame = np.zeros(n, dtype=np.int64)
+    # 卡尔曼滤波器状态
+    est_x = np.zeros(n)
+    est_v = np.zeros(n)
+    P00 = np.zeros(n)
+    P01 = np.zeros(n)
+    P11 = np.zeros(n)
+    est_time = np.full(n, np.nan)
+    # 模式切换状态，与CascadeController相同
+    status = np.zeros(n, dtype=bool)
+    locked = np.zeros(n, dtype=bool)
+    precision_count = np.zeros(n, dtype=np.int64)
+    unlock_count = np.zeros(n, dtype=np.int64)
+    fine_count = np.zeros(n, dtype=np.int64)
+    # 等待生效的舵机指令（帧间隔远大于指令延迟，每个实例最多一条）
+    pending_time = np.full(n, np.inf)
+    pending_goal = np.zeros(n)
+    pending_speed = np.zeros(n)
+    # 结果统计
+    side = np.where(s['initial'] <= target, 1.0, -1.0)
+    overshoot = np.zeros(n)
+    last_outside = np.full(n, -np.inf)
+    final_error = np.full(n, np.nan)
+    last_capture = np.zeros(n)
+    next_capture = np.zeros(n)
+
+    steps = int(round(duration / physics_dt))
+    for i in range(steps):
+        t = i * physics_dt
+        history[i % history_len] = position
+
+        # 按采集时刻的真实位置统计结果，与simulate相同
+        cap = np.nonzero(next_capture <= t + 1e-12)[0]
+        if len(cap):
+            offset = position[cap] - target[cap]
+            error = np.abs(offset)
+            overshoot[cap] = np.maximum(overshoot[cap], offset * side[cap])
+            last_outside[cap] = np.where(error > tolerance, t, last_outside[cap])
+            final_error[cap] = error
+            last_capture[cap] = t
+            next_capture[cap] += period[cap]
+
+        # 处理已取到的帧；帧k在第一个不早于k*period的物理步采集
+        capture_step = np.ceil(frame * period / physics_dt - 1e-9)
+        idx = np.nonzero(capture_step * physics_dt + latency <= t + 1e-12)[0]
+        if len(idx):
+            cap_step = capture_step[idx].astype(np.int64)
+            capture_time = cap_step * physics_dt
+            true_pos = history[cap_step % history_len, idx]
+            frame[idx] += 1
+
+            z = true_pos + s['noise'][idx] * rng.standard_normal(len(idx))
+            prev_time = est_time[idx]
+            first = np.isnan(prev_time)
+            # 第一帧只初始化滤波器，与simulate相同不做控制
+            init = idx[first]
+            est_x[init] = z[first]
+            est_v[init] = 0.0
+            P00[init] = measurement_noise
+            P01[init] = 0.0
+            P11[init] = 1e6
+            est_time[init] = capture_time[first]
+
+            run = ~first
+            j = idx[run]
+            if len(j):
+                z = z[run]
+                t_cap = capture_time[run]
+                dt = t_cap - prev_time[run]
+                # 预测
+                x0 = est_x[j] + est_v[j] * dt
+                x1 = est_v[j]
+                p00 = P00[j] + 2 * dt * P01[j] + dt * dt * P11[j] + process_noise * dt ** 3 / 3
+                p01 = P01[j] + dt * P11[j] + process_noise * dt ** 2 / 2
+                p11 = P11[j] + process_noise * dt
+                # 更新
+                k0 = p00 / (p00 + measurement_noise)
+                k1 = p01 / (p00 + measurement_noise)
+                innovation = z - x0
+                est_x[j] = cur_pos = x0 + k0 * innovation
+                est_v[j] = cur_speed = x1 + k1 * innovation
+                P00[j] = p00 - k0 * p00
+                P01[j] = p01 - k0 * p01
+                P11[j] = p11 - k1 * p01
+                est_time[j] = t_cap
+
+                # 级联控制，逻辑与CascadeController.step相同
+                tar = target[j]
+                tar_speed = pos_pid.update(j, tar, cur_pos, dt)
+                tar_degree = degree_pid.update(j, tar_speed, cur_speed, dt)
+                servo_angle = np.clip(center + np.trunc(tar_degree), center - table.track_limit,
+                                      center + table.track_limit)
+                current_error = np.abs(tar - cur_pos)
+                abs_speed = np.abs(cur_speed)
+
+                # 按阈值表切换模式，与CascadeController._update_mode相同
+                st = status[j]
+                lk = locked[j]
+                pc = precision_count[j]
+                over = lk & (current_error > table.unlock_error)
+                uc = unlock_count[j] + over
+                unlock = over & (uc >= table.unlock_frames)
+                lk = lk & ~unlock
+                pc = np.where(unlock, 0, pc)
+                st = st & ~unlock
+                free = ~lk if table.hold_locked else np.ones(len(j), dtype=bool)
+                enter = free & (abs_speed < table.enter_speed) & (current_error < table.enter_error)
+                st = st | enter
+                pc = pc + enter
+                if table.lock_after is None:
+                    new_lock = np.zeros(len(j), dtype=bool)
+                else:
+                    new_lock = enter & ~lk & (pc >= table.lock_after)
+                lk = lk | new_lock
+                uc = np.where(new_lock, 0, uc)
+                leave = free & ~new_lock & ((abs_speed > table.exit_speed) | (current_error > table.exit_error))
+                st = st & ~leave
+                pc = np.where(leave, 0, pc)
+                status[j] = st
+                locked[j] = lk
+                precision_count[j] = pc
+                unlock_count[j] = uc
+
+                new_goal = servo_angle
+                new_speed = np.full(len(j), float(table.track_speed))
+                fine_mask = st | lk
+                if fine_mask.any():
+                    f = j[fine_mask]
+                    fine = fine_tune_pid.update(f, tar[fine_mask], cur_pos[fine_mask], dt[fine_mask])
+                    fine_angle = np.clip(table.fine_center + np.trunc(fine), table.fine_center - table.fine_limit,
+                                         table.fine_center + table.fine_limit)
+                    # 锁定但不在精准模式的帧只微调，不计入完成帧数
+                    counting = st[fine_mask]
+                    fine_count[f[counting]] += 1
+                    done = counting & (fine_count[f] > table.done_after) & (abs_speed[fine_mask] < table.done_speed)
+                    if table.done_error is not None:
+                        done &= current_error[fine_mask] < table.done_error
+                    new_goal[fine_mask] = np.where(done, table.fine_center, fine_angle)
+                    new_speed[fine_mask] = np.where(done, float(table.done_servo_speed), float(table.fine_speed))
+                pending_time[j] = t + command_latency
+                pending_goal[j] = new_goal
+                pending_speed[j] = new_speed
+
+        # 舵机指令生效
+        due = pending_time <= t + 1e-12
+        if due.any():
+            goal[due] = pending_goal[due]
+            speed_limit[due] = np.minimum(pending_speed[due], max_speed)
+            pending_time[due] = np.inf
+
+        # 舵机一阶滞后+限速
+        move = np.clip((goal - servo) / servo_tau, -speed_limit, speed_limit) * physics_dt
+        servo = np.where(np.abs(move) >= np.abs(goal - servo), goal, servo + move)
+
+        # 小球
+        angle = (servo - s['level']) * (STEP_ANGLE * s['beam_ratio'])
+        acc = acc_gain * np.sin(angle) - s['damping'] * speed
+        speed += acc * physics_dt
+        position += speed * physics_dt
+        wall = np.abs(position) > half_length
+        if wall.any():
+            position[wall] = np.copysign(half_length, position[wall])
+            speed[wall] = 0.0
+
+    # 稳定时刻为最后一次超出容差之后的下一帧，最后一帧仍超出容差时未稳定
+    settle_time = np.where(np.isneginf(last_outside), 0.0, np.ceil((last_outside + period) / physics_dt - 1e-9) * physics_dt)
+    settle_time[last_outside >= last_capture] = np.nan
+    return BatchResult(s, settle_time, np.maximum(overshoot, 0.0), final_error)
+
+
+def summarize(result, max_settle=10.0, max_overshoot=10.0, max_error=3.0):
+    """
+    打印稳定时间、超调和误差的分布（未稳定的场景稳定时间记为inf），以及各参数取值偏低/偏高的一半场景的达标率
+
+    Returns:
+        每个场景是否达标的布尔数组
+    """
+    settle = result.settle_time
+    passed = (settle <= max_settle) & (result.overshoot <= max_overshoot) & (result.final_error <= max_error)
+    n = len(settle)
+    print(f"场景数 {n}, 达标 {passed.sum()} ({passed.mean() * 100:.1f}%), 未稳定 {np.isnan(settle).sum()}")
+    quantiles = (5, 25, 50, 75, 95)
+    print(f"{'':>10} " + ' '.join(f"{'p' + str(q):>8}" for q in quantiles) + f" {'最大':>8}")
+    for name, values in (('稳定(s)', np.where(np.isnan(settle), np.inf, settle)),
+                         ('超调(mm)', result.overshoot), ('误差(mm)', result.final_error)):
+        print(f"{name:>10} " + ' '.join(f"{v:>8.2f}" for v in np.percentile(values, quantiles, method='inverted_cdf')) +
+              f" {values.max():>8.2f}")
+    print(f"{'参数':>10} {'范围':>18} {'偏低一半达标':>10} {'偏高一半达标':>10}")
+    for name, values in result.scenarios.items():
+        if name == 'initial' or values.min() == values.max():
+            continue
+        low = values <= np.median(values)
+        print(f"{name:>10} {values.min():>8.4g} - {values.max():<8.4g}"
+              f" {passed[low].mean() * 100:>13.1f}% {passed[~low].mean() * 100:>13.1f}%")
+    return passed
+
+
+if __name__ == "__main__":
+    # 用法: python batch_simulator.py [--runs 10000] [--duration 10] [--gains data/tuned_gains.json]
+    # 在随机的延迟、帧率、小球和轨道参数下评估一组控制参数，输出稳定时间、超调和误差的分布
+    parser = argparse.ArgumentParser(description='小球-轨道批量蒙特卡洛仿真')
+    parser.add_argument('--runs', type=int, default=10000, help='场景数')
+    parser.add_argument('--duration', type=float, default=10.0, help='仿真时长 (s)')
+    parser.add_argument('--gains', default=None, help='autotune.py保存的参数文件，默认使用CascadeController的参数')
+    parser.add_argument('--table', default='main', choices=sorted(PROFILES), help='模式切换阈值表')
+    parser.add_argument('--dt', type=float, default=0.002, help='物理仿真步长 (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    gains = load_gains(args.gains) if args.gains else {}
+    scenarios = sample_scenarios(args.runs, args.seed)
+    start = time.perf_counter()
+    result = batch_simulate(scenarios, CascadeController(table=args.table, **gains), args.duration, physics_dt=args.dt, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"耗时 {elapsed:.2f} s ({args.runs * args.duration / elapsed:.0f} 个仿真秒/s)")
+    summarize(result)
@@ -0,0 +1,296 @@
+import csv
+import json
+import os
+import struct
+import sys
+from datetime import datetime
+
+import numpy as np
+
+# 文件格式:
+#   'BLOG' + 版本号(uint32)
+#   表头长度(uint32) + JSON表头（各列的名称、dtype、单位和说明），补齐到8字节
+#   若干数据块: 行数(uint32) + 保留(uint32)，然后按列依次存放该块的数据，每列补齐到8字节
+# 所有数值为小端序。每个块是独立的列式数据，追加写入不需要回头修改文件，
+# 程序中途退出时最后一个不完整的块在读取时被忽略
+# CSV日志的表头另存为同名的.json文件，格式与二进制表头相同
+MAGIC = b'BLOG'
+VERSION = 1
+EXTENSION = '.blog'
+HEADER_EXTENSION = '.json'
+
+
+def _padding(n):
+    return (-n) % 8
+
+
+def make_header(columns, attrs=None):
+    """
+    生成日志表头
+
+    Args:
+        columns: [(列名, dtype[, 单位[, 说明]]), ...]
+        attrs: 附加在表头中的其他信息 (dict)
+
+    Returns:
+        表头 (dict)
+    """
+    infos = []
+    for column in columns:
+        name, dtype = column[0], column[1]
+        info = {'name': name, 'dtype': np.dtype(dtype).newbyteorder('<').str}
+        if len(column) > 2 and column[2]:
+            info['unit'] = column[2]
+        if len(column) > 3 and column[3]:
+            info['description'] = column[3]
+        infos.append(info)
+    header = {'columns': infos, 'created': datetime.now().isoformat(timespec='seconds')}
+    if attrs:
+        header.update(attrs)
+    return header
+
+
+def write_csv_header(csv_path, columns, attrs=None):
+    """把CSV日志的表头写入同名的.json文件，参数与make_header相同"""
+    path = os.path.splitext(csv_path)[0] + HEADER_EXTENSION
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(make_header(columns, attrs), f, ensure_ascii=False, indent=2)
+
+
+class BinaryLogWriter:
+    """二进制列式日志写入器"""
+    def __init__(self, path, columns, attrs=None):
+        """
+        创建日志文件并写入表头
+
+        Args:
+            path: 文件路径
+            columns: [(列名, dtype[, 单位[, 说明]]), ...]，如 [('Time (s)', '<f8', 's'), ('Current Position', '<f4', 'px')]
+            attrs: 附加在表头中的其他信息 (dict)
+        """
+        self.path = path
+        header = make_header(columns, attrs)
+        self.columns = [(c['name'], np.dtype(c['dtype'])) for c in header['columns']]
+        data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + struct.pack('<II', VERSION, len(data)))
+        self.file.write(data + b'\0' * _padding(len(data)))
+        self.file.flush()
+        self.rows = 0
+
+    def write_rows(self, rows):
+        """
+        写入若干行，作为一个数据块
+
+        Args:
+            rows: 行的列表，每行的值与columns一一对应，浮点列中的None记为nan
+        """
+        if not rows:
+            return
+        self.write_columns([np.asarray(values, dtype=dtype)
+                            for values, (_, dtype) in zip(zip(*rows), self.columns)])
+
+    def write_columns(self, arrays):
+        """
+        按列写入一个数据块
+
+        Args:
+            arrays: 与columns一一对应的一维数组，长度相同
+        """
+        n = len(arrays[0])
+        parts = [struct.pack('<II', n, 0)]
+        for array, (name, dtype) in zip(arrays, self.columns):
+            data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+            if len(data) != n * dtype.itemsize:
+                raise ValueError(f"列 '{name}' 的长度与其他列不一致")
+            parts.append(data + b'\0' * _padding(len(data)))
+        self.file.write(b''.join(parts))
+        self.file.flush()
+        self.rows += n
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != MAGIC:
+            raise ValueError(f"{path} 不是二进制日志文件")
+        _, length = struct.unpack('<II', head[4:])
+        header = json.loads(f.read(length).decode('utf-8'))
+    return header, 12 + length + _padding(length)
+
+
+def read_header(path):
+    """
+    读取日志文件的表头
+
+    Returns:
+        表头 (dict)。CSV日志读取同名的.json文件，没有时只包含CSV首行中的列名
+    """
+    if path.endswith(EXTENSION):
+        return _read_header(path)[0]
+    try:
+        with open(os.path.splitext(path)[0] + HEADER_EXTENSION, encoding='utf-8') as f:
+            return json.load(f)
+    except OSError:
+        with open(path, newline='') as f:
+            names = next(csv.reader(f), [])
+        return {'columns': [{'name': name} for name in names]}
+
+
+def read_binary_log(path):
+    """
+    用numpy.memmap读取二进制日志
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        {列名: 一维数组}，按表头中的列顺序排列。只有一个数据块时数组直接映射文件，不复制数据
+    """
+    header, offset = _read_header(path)
+    columns = [(c['name'], np.dtype(c['dtype'])) for c in header['columns']]
+
+    mm = np.memmap(path, dtype=np.uint8, mode='r')
+    parts = {name: [] for name, _ in columns}
+    while offset + 8 <= len(mm):
+        n = int(mm[offset:offset + 4].view('<u4')[0])
+        start = offset + 8
+        size = sum(n * dtype.itemsize + _padding(n * dtype.itemsize) for _, dtype in columns)
+        if start + size > len(mm):
+            break  # 写到一半的数据块
+        for name, dtype in columns:
+            nbytes = n * dtype.itemsize
+            parts[name].append(mm[start:start + nbytes].view(dtype))
+            start += nbytes + _padding(nbytes)
+        offset = start
+
+    result = {}
+    for name, dtype in columns:
+        chunks = parts[name]
+        if len(chunks) == 1:
+            result[name] = chunks[0]
+        elif chunks:
+            result[name] = np.concatenate(chunks)
+        else:
+            result[name] = np.empty(0, dtype=dtype)
+    return result
+
+
+def load_log(path):
+    """按扩展名读取CSV或二进制日志，返回pandas.DataFrame"""
+    import pandas as pd
+    if path.endswith(EXTENSION):
+        return pd.DataFrame(read_binary_log(path))
+    return pd.read_csv(path)
+
+
+def read_log_columns(path):
+    """
+    按扩展名读取CSV或二进制日志，不依赖pandas
+
+    Returns:
+        {列名: 一维数组}，CSV中的空值为nan
+    """
+    if path.endswith(EXTENSION):
+        return read_binary_log(path)
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        names = next(reader, [])
+        rows = [row for row in reader if row]
+    result = {}
+    for i, name in enumerate(names):
+        values = [row[i] if i < len(row) and row[i] != '' else 'nan' for row in rows]
+        result[name] = np.array(values, dtype=np.float64)
+    return result
+
+
+def csv_to_binary(csv_path, out_path=None, dtypes=None, default_dtype='<f4'):
+    """
+    把CSV日志转换为二进制日志
+
+    Args:
+        csv_path: CSV文件路径
+        out_path: 输出路径，None时替换扩展名
+        dtypes: {列名: dtype}，未列出的列使用CSV表头中的dtype，没有表头时使用default_dtype，时间列默认使用float64
+        default_dtype: 默认dtype（float32约有7位有效数字）
+
+    Returns:
+        输出文件路径
+    """
+    out_path = out_path or os.path.splitext(csv_path)[0] + EXTENSION
+    infos = {c['name']: c for c in read_header(csv_path)['columns']}
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        names = next(reader)
+        rows = [row for row in reader if row]
+    columns = []
+    for name in names:
+        info = infos.get(name, {})
+        default = '<f8' if name == 'Time (s)' else default_dtype
+        dtype = (dtypes or {}).get(name) or info.get('dtype') or default
+        columns.append((name, dtype, info.get('unit'), info.get('description')))
+    arrays = []
+    for i, (name, dtype, _, _) in enumerate(columns):
+        values = [row[i] if i < len(row) and row[i] != '' else 'nan' for row in rows]
+        arrays.append(np.array(values, dtype=np.float64).astype(dtype))
+    writer = BinaryLogWriter(out_path, columns, {'source': os.path.basename(csv_path)})
+    writer.write_columns(arrays)
+    writer.close()
+    return out_path
+
+
+def binary_to_csv(bin_path, out_path=None):
+    """
+    把二进制日志转换为CSV，浮点数按各自精度输出最短的表示，nan输出为空，表头写入同名的.json文件
+
+    Returns:
+        输出文件路径
+    """
+    out_path = out_path or os.path.splitext(bin_path)[0] + '.csv'
+    header = read_header(bin_path)
+    data = read_binary_log(bin_path)
+    columns = []
+    for values in data.values():
+        if values.dtype.kind == 'f':
+            # float32经由同精度的numpy标量转字符串，避免输出成一长串float64的数字
+            fmt = repr if values.dtype.itemsize == 8 else (lambda v, cast=values.dtype.type: str(cast(v)))
+            columns.append(['' if v != v else fmt(v) for v in values.tolist()])
+        else:
+            columns.append([str(v) for v in values.tolist()])
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(data.keys()))
+        writer.writerows(zip(*columns))
+    write_csv_header(out_path, [(c['name'], c['dtype'], c.get('unit'), c.get('description'))
+                                for c in header['columns']], {'source': os.path.basename(bin_path)})
+    return out_path
+
+
+if __name__ == "__main__":
+    # 用法: python binary_log.py [文件...]
+    # .csv 转为 .blog，.blog 转为 .csv；不带参数时把data目录中还没有二进制版本的CSV日志全部转换
+    import time
+
+    paths = sys.argv[1:]
+    if not paths:
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        paths = [os.path.join(data_dir, f) for f in sorted(os.listdir(data_dir))
+                 if f.startswith('data_log_') and f.endswith('.csv')
+                 and not os.path.exists(os.path.join(data_dir, f[:-4] + EXTENSION))]
+
+    for path in paths:
+        start = time.perf_counter()
+        if path.endswith(EXTENSION):
+            out = binary_to_csv(path)
+        else:
+            out = csv_to_binary(path)
+        elapsed = time.perf_counter() - start
+        print(f"{os.path.basename(path)} ({os.path.getsize(path) / 1024:.1f} KB) -> "
+              f"{os.path.basename(out)} ({os.path.getsize(out) / 1024:.1f} KB), {elapsed * 1000:.0f} ms")
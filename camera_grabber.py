@@ -0,0 +1,113 @@
+import threading
+
+import cv2
+
+import clock
+
+
+class FrameGrabber:
+    """
+    后台取帧器
+    在独立线程中不断调用cap.read()，只保留最新的一帧，
+    控制循环每次拿到的都是最新画面，旧帧直接丢弃并计数；
+    每帧带有采集时间戳（clock模块的单调时钟）和帧序号，速度、dt和日志都以采集时刻计算
+    """
+    def __init__(self, cap, driver_timestamp=True, max_driver_age=0.5):
+        """
+        初始化取帧器
+
+        Args:
+            cap: 已打开的cv2.VideoCapture对象
+            driver_timestamp: 是否优先使用驱动给出的帧时间戳 (CAP_PROP_POS_MSEC)
+            max_driver_age: 驱动时间戳早于读取完成时刻的最大合理值 (s)，超出时认为不是同一个时钟
+        """
+        self.cap = cap
+        self.driver_timestamp = driver_timestamp
+        self.max_driver_age_ns = int(max_driver_age * 1e9)
+        # 尽量减小驱动内部的缓冲，部分后端不支持时忽略
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.cond = threading.Condition()
+        self.frame = None
+        self.timestamp_ns = None  # 采集时间戳 (ns)
+        self.driver_frames = 0  # 使用驱动时间戳的帧数
+        self.seq = 0            # 帧序号，从1开始
+        self.read_seq = 0       # 控制循环最后取走的帧序号
+        self.dropped = 0        # 未被取走就被覆盖的帧数
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """启动取帧线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._grab_loop)
+        self.thread.daemon = True  # 设置为守护线程，随主线程退出
+        self.thread.start()
+        return self
+
+    def _grab_loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            timestamp_ns = clock.now_ns()
+            if ret:
+                timestamp_ns = self._capture_time_ns(timestamp_ns)
+            with self.cond:
+                if not ret:
+                    self.running = False
+                    self.cond.notify_all()
+                    break
+                if self.seq > self.read_seq:
+                    self.dropped += 1
+                self.frame = frame
+                self.timestamp_ns = timestamp_ns
+                self.seq += 1
+                self.cond.notify_all()
+
+    def _capture_time_ns(self, read_ns):
+        """
+        返回帧的采集时刻 (ns)
+        V4L2等后端的CAP_PROP_POS_MSEC是驱动记录的帧时间戳，与本机单调时钟一致，
+        不包含cap.read()的等待和解码时间；其他后端返回的是视频位置或0，此时使用读取完成的时刻
+        """
+        if not self.driver_timestamp:
+            return read_ns
+        driver_ns = int(self.cap.get(cv2.CAP_PROP_POS_MSEC) * 1e6)
+        if driver_ns > 0 and 0 <= read_ns - driver_ns <= self.max_driver_age_ns:
+            self.driver_frames += 1
+            return driver_ns
+        if self.seq >= 30 and self.driver_frames == 0:
+            self.driver_timestamp = False  # 驱动时间戳不可用，之后不再查询
+        return read_ns
+
+    @property
+    def timestamp(self):
+        """最新一帧的采集时刻 (s)"""
+        return None if self.timestamp_ns is None else self.timestamp_ns * 1e-9
+
+    def read(self, timeout=1.0):
+        """
+        取最新一帧，若最新帧已被取过则等待下一帧
+
+        Args:
+            timeout: 最长等待时间 (s)
+
+        Returns:
+            (ret, frame, timestamp, seq)，timestamp为采集时刻 (s，clock.now()的时钟)，seq为帧序号
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > self.read_seq or not self.running, timeout)
+            if self.seq <= self.read_seq:
+                return False, None, None, None
+            self.read_seq = self.seq
+            return True, self.frame, self.timestamp, self.seq
+
+    def stop(self):
+        """停止取帧线程"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def release(self):
+        """停止取帧线程并释放摄像头"""
+        self.stop()
+        self.cap.release()
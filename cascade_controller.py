@@ -0,0 +1,240 @@
+import json
+from collections import namedtuple
+
+from pid import PID
+
+ControlOutput = namedtuple('ControlOutput', ['goal', 'speed', 'tar_speed', 'tar_degree', 'fine_tune_angle', 'error',
+                                             'mode', 'done'])
+ControlOutput.__doc__ = """
+一次控制的结果（舵机指令和诊断量）
+goal, speed: 本周期的舵机目标位置和运行速度
+tar_speed: 位置环输出的目标速度，tar_degree: 速度环输出的角度
+fine_tune_angle: 精确定位模式的微调目标，其他模式为None
+error: 位置误差的绝对值
+mode: 0 跟踪模式, 1 精准模式, 2 精准模式且已锁定
+done: 精确定位是否完成（舵机回到中心位置）
+"""
+
+ModeTable = namedtuple('ModeTable', [
+    'center', 'track_limit', 'track_speed',
+    'fine_center', 'fine_limit', 'fine_speed',
+    'enter_speed', 'enter_error', 'exit_speed', 'exit_error',
+    'lock_after', 'unlock_error', 'unlock_frames', 'hold_locked',
+    'done_after', 'done_speed', 'done_error', 'done_servo_speed',
+], defaults=(
+    2100, 100, 500,
+    2100, 50, 200,
+    50, 10, 50, 10,
+    10, 15, 1, True,
+    10, 10, None, 100,
+))
+ModeTable.__doc__ = """
+跟踪/精准/锁定/完成模式切换的阈值表，位置和速度的单位与传给step的状态相同 (px, px/s)
+center, track_limit, track_speed: 跟踪模式舵机中心位置、相对中心的限幅 (步)、运行速度
+fine_center, fine_limit, fine_speed: 精准模式微调的中心位置、限幅、运行速度
+enter_speed, enter_error: 速度和误差都小于此值时进入精准模式
+exit_speed, exit_error: 速度或误差大于此值时退出精准模式（与进入阈值之差即回差）
+lock_after: 连续进入精准模式多少次后锁定，None时不锁定
+unlock_error, unlock_frames: 锁定后误差大于unlock_error累计unlock_frames帧时解除锁定
+hold_locked: 锁定时是否保持精准模式；为False时仍按进入/退出阈值切换，
+    锁定期间不满足精准条件的帧也使用微调PID，但不计入完成帧数
+done_after, done_speed, done_error: 精准模式累计超过done_after帧、速度小于done_speed
+    （且误差小于done_error，None时不判断）时精确定位完成
+done_servo_speed: 完成后舵机回到中心位置的运行速度
+"""
+
+# 各程序使用的模式参数，统一前各程序中阈值不同，保留原来的行为
+PROFILES = {
+    'main': ModeTable(),
+    'qt': ModeTable(),
+    'back': ModeTable(lock_after=None),
+    # tk_interface原来按毫米判断完成误差 (3 mm)，控制器使用像素，按负方向 150 mm/130 px 换算（正方向为3.2 px，取较严的值）
+    'tk': ModeTable(fine_limit=20, enter_error=8, unlock_error=10, done_speed=5, done_error=2.6),
+    'green': ModeTable(track_speed=1500, fine_center=2080, enter_error=20, exit_error=20,
+                       lock_after=1, unlock_error=20, unlock_frames=11, hold_locked=False),
+}
+
+# 模式
+TRACKING = 0
+PRECISION = 1
+LOCKED = 2
+
+
+def load_gains(path):
+    """
+    读取autotune.py保存的参数文件
+
+    Returns:
+        {'pos_gains': ..., 'degree_gains': ..., 'fine_tune_gains': ...}，可直接传给CascadeController
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {key: tuple(data[key]) for key in ('pos_gains', 'degree_gains', 'fine_tune_gains')}
+
+
+class CascadeController:
+    """
+    位置-速度-角度级联控制和跟踪/精准模式切换
+    只根据状态计算舵机指令，不操作舵机、不打印，实机循环、仿真器和日志回放共用
+    """
+    def __init__(self, pos_gains=(4, 0, 0.6, 30), degree_gains=(0.22, 0, 0.01, 10000),
+                 fine_tune_gains=(0.05, 0, 0.005, 5), target=0, table='main'):
+        """
+        Args:
+            pos_gains: 位置-速度PID参数 (Kp, Ki, Kd, lim)
+            degree_gains: 速度-角度PID参数
+            fine_tune_gains: 微调PID参数
+            target: 目标位置 (px，相对中心)
+            table: ModeTable，或PROFILES中的名称
+        """
+        self.pos_pid = PID(*pos_gains)
+        self.degree_pid = PID(*degree_gains)
+        self.fine_tune_pid = PID(*fine_tune_gains)
+        self.target = target
+        self.table = PROFILES[table] if isinstance(table, str) else table
+        self.reset()
+
+    @property
+    def center(self):
+        """跟踪模式的舵机中心位置"""
+        return self.table.center
+
+    def reset(self):
+        """重置PID和模式状态"""
+        self.pos_pid.reset()
+        self.degree_pid.reset()
+        self.fine_tune_pid.reset()
+        self.status = False                 # 是否处于精准模式
+        self.precision_mode_count = 0       # 连续进入精准模式的次数
+        self.precision_mode_locked = False  # 是否锁定在精准模式
+        self.unlock_count = 0               # 锁定后误差过大的帧数
+        self.count = 0                      # 精准模式的累计帧数
+        self.last_output = None             # 上一次的ControlOutput
+
+    @property
+    def mode(self):
+        """0 跟踪模式, 1 精准模式, 2 精准模式且已锁定"""
+        if self.precision_mode_locked:
+            return LOCKED
+        return PRECISION if self.status else TRACKING
+
+    def _update_mode(self, error, speed):
+        """按阈值表更新模式"""
+        table = self.table
+        if self.precision_mode_locked:
+            if error > table.unlock_error:
+                self.unlock_count += 1
+                if self.unlock_count >= table.unlock_frames:
+                    self.precision_mode_locked = False
+                    self.precision_mode_count = 0
+                    self.status = False
+            # 锁定时保持精准模式
+            if self.precision_mode_locked and table.hold_locked:
+                return
+
+        if abs(speed) < table.enter_speed and error < table.enter_error:
+            self.status = True
+            self.precision_mode_count += 1
+            if table.lock_after is not None and not self.precision_mode_locked and \
+                    self.precision_mode_count >= table.lock_after:
+                self.precision_mode_locked = True
+                self.unlock_count = 0
+                return
+        if abs(speed) > table.exit_speed or error > table.exit_error:
+            self.status = False
+            self.precision_mode_count = 0
+
+    def step(self, state, dt):
+        """
+        运行一次级联控制和模式切换
+
+        Args:
+            state: (当前位置 px，相对中心, 当前速度 px/s)
+            dt: 控制周期 (s)，不大于0时（重复的帧或时间戳倒退）不更新PID和模式，返回上一次的输出
+
+        Returns:
+            ControlOutput
+        """
+        cur_pos, cur_speed = state
+        table = self.table
+        tar_pos = self.target
+        if dt <= 0:
+            if self.last_output is not None:
+                return self.last_output
+            return ControlOutput(table.center, table.track_speed, 0.0, 0.0, None, abs(tar_pos - cur_pos),
+                                 self.mode, False)
+        # 位置闭环控制
+        tar_speed = self.pos_pid.update(tar_pos, cur_pos, dt)
+        # 角度闭环控制
+        tar_degree = self.degree_pid.update(tar_speed, cur_speed, dt)
+
+        error = abs(tar_pos - cur_pos)
+        self._update_mode(error, cur_speed)
+
+        fine_tune_angle = None
+        done = False
+        if self.status or self.precision_mode_locked:
+            # 使用微调PID进行更精确的控制，以更低的速度控制舵机
+            fine_tune_degree = self.fine_tune_pid.update(tar_pos, cur_pos, dt)
+            fine_tune_angle = table.fine_center + int(fine_tune_degree)
+            fine_tune_angle = max(table.fine_center - table.fine_limit,
+                                  min(table.fine_center + table.fine_limit, fine_tune_angle))
+            goal, speed = fine_tune_angle, table.fine_speed
+            if self.status:
+                self.count += 1
+                if self.count > table.done_after and abs(cur_speed) < table.done_speed and \
+                        (table.done_error is None or error < table.done_error):
+                    goal, speed = table.fine_center, table.done_servo_speed
+                    done = True
+        else:
+            # 将控制输出映射到舵机角度，限制在安全范围内
+            goal = table.center + int(tar_degree)
+            goal = max(table.center - table.track_limit, min(table.center + table.track_limit, goal))
+            speed = table.track_speed
+
+        self.last_output = ControlOutput(goal, speed, tar_speed, tar_degree, fine_tune_angle, error, self.mode, done)
+        return self.last_output
+
+
+if __name__ == "__main__":
+    # 用法: python cascade_controller.py [日志文件] [--table main]
+    # 不带文件时测量step的耗时；带文件时用日志中的位置、速度回放控制器，与记录的舵机指令比较
+    import argparse
+    import time
+
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description='级联控制器的耗时测试和日志回放')
+    parser.add_argument('file', nargs='?', help='日志文件 (.csv/.blog)')
+    parser.add_argument('--table', default='main', choices=sorted(PROFILES), help='模式参数')
+    args = parser.parse_args()
+
+    controller = CascadeController(table=args.table)
+    if args.file is None:
+        rng = np.random.default_rng(0)
+        states = list(zip(rng.normal(0, 30, 100000).tolist(), rng.normal(0, 60, 100000).tolist()))
+        start = time.perf_counter()
+        for state in states:
+            controller.step(state, 0.032)
+        elapsed = time.perf_counter() - start
+        print(f"step: {elapsed / len(states) * 1e6:.2f} us/次")
+    else:
+        from binary_log import read_log_columns
+
+        data = read_log_columns(args.file)
+        t = data['Time (s)']
+        positions = data['Current Position']
+        speeds = data['Current Speed']
+        commands = data.get('Servo Command')
+        goals = np.full(len(t), np.nan)
+        modes = np.zeros(len(t), dtype=np.int64)
+        for i in range(1, len(t)):
+            out = controller.step((positions[i], speeds[i]), t[i] - t[i - 1])
+            goals[i] = out.goal
+            modes[i] = out.mode
+        print(f"{len(t)} 行，各模式帧数: " +
+              ', '.join(f"{name} {np.sum(modes == m)}" for m, name in ((TRACKING, '跟踪'), (PRECISION, '精准'), (LOCKED, '锁定'))))
+        if commands is not None:
+            sent = ~np.isnan(commands)
+            match = np.sum(goals[sent] == commands[sent])
+            print(f"与记录的舵机指令一致 {match}/{np.sum(sent)}")
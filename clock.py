@@ -0,0 +1,15 @@
+import time
+
+# 流水线统一使用的单调时钟：帧采集时间戳、控制周期、舵机反馈和数据记录都以它为准，
+# 不受NTP等系统时间调整影响。Linux上perf_counter基于CLOCK_MONOTONIC，
+# 与V4L2驱动给出的帧时间戳是同一个时钟
+
+
+def now_ns():
+    """当前时刻 (ns，整数)"""
+    return time.perf_counter_ns()
+
+
+def now():
+    """当前时刻 (s)"""
+    return time.perf_counter_ns() * 1e-9
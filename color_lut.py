@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+
+class LutSegmenter:
+    """
+    查找表颜色分割器
+    根据HSV阈值范围预先计算 量化BGR -> 掩码 的查找表，
+    每帧只需一次查表即可得到掩码，省去cvtColor+inRange+bitwise_or
+    """
+    def __init__(self, hsv_ranges, bits=6):
+        """
+        初始化查找表分割器
+
+        Args:
+            hsv_ranges: HSV阈值范围列表，形如 [((h, s, v), (h, s, v)), ...]
+            bits: 每个颜色通道保留的位数 (1-8)，8为不量化
+        """
+        self.bits = bits
+        self.shift = 8 - bits
+        self.hsv_ranges = None
+        self.table = None
+        self.set_ranges(hsv_ranges)
+
+    def set_ranges(self, hsv_ranges):
+        """设置新的HSV阈值范围，范围变化时重建查找表"""
+        hsv_ranges = [(tuple(lower), tuple(upper)) for lower, upper in hsv_ranges]
+        if hsv_ranges != self.hsv_ranges:
+            self.hsv_ranges = hsv_ranges
+            self.build_table()
+
+    def build_table(self):
+        """
+        重建查找表
+        表的下标为 b + g*256 + r*65536（各通道已右移shift位），
+        与BGRA图像按uint32解释后的数值一致
+        """
+        levels = np.arange(1 << self.bits, dtype=np.uint32)
+        b, g, r = np.meshgrid(levels, levels, levels, indexing='ij')
+
+        # 每个量化区间取中心颜色代表整个区间
+        half = (1 << self.shift) >> 1
+        colors = np.stack([(b << self.shift) + half,
+                           (g << self.shift) + half,
+                           (r << self.shift) + half], axis=-1)
+        colors = colors.reshape(-1, 1, 3).astype(np.uint8)
+
+        hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+        mask = np.zeros(hsv.shape[:2], dtype=np.uint8)
+        for lower, upper in self.hsv_ranges:
+            mask |= cv2.inRange(hsv, lower, upper)
+
+        self.table = np.zeros(((1 << self.bits) - 1) * 65793 + 1, dtype=np.uint8)
+        self.table[(b + (g << 8) + (r << 16)).reshape(-1)] = mask.reshape(-1)
+
+    def segment(self, image):
+        """
+        将BGR图像转换为二值掩码
+
+        Args:
+            image: BGR图像
+
+        Returns:
+            与image同尺寸的uint8掩码 (0或255)
+        """
+        if self.shift:
+            image = np.right_shift(image, self.shift)
+        # 补一个通道后按uint32解释，每个像素正好得到一个表下标
+        bgra = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        index = bgra.view(np.uint32)[..., 0]
+        np.bitwise_and(index, 0xFFFFFF, out=index)  # 去掉alpha通道
+        return np.take(self.table, index)
+
+
+def hsv_segment(image, hsv_ranges):
+    """原有的cvtColor+inRange+bitwise_or分割流程，用于对比"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    mask = None
+    for lower, upper in hsv_ranges:
+        part = cv2.inRange(hsv, lower, upper)
+        mask = part if mask is None else cv2.bitwise_or(mask, part)
+    return mask
+
+
+def _ball_frames(count, seed=0):
+    """
+    生成带红色和绿色小球的640x480测试画面
+    背景为低饱和度的纹理，小球带明暗渐变和噪声，使阈值边缘附近也有像素
+    """
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:480, 0:640]
+    frames = []
+    for _ in range(count):
+        gray = cv2.GaussianBlur(rng.integers(60, 200, (480, 640), dtype=np.uint8), (15, 15), 0)
+        tint = rng.integers(-15, 16, 3)
+        frame = np.clip(gray[..., None].astype(np.int16) + tint, 0, 255).astype(np.float32)
+        for base in ((40, 40, 200), (50, 170, 60)):  # BGR: 红色、绿色
+            cx, cy = rng.uniform(60, 580), rng.uniform(60, 420)
+            radius = rng.uniform(25, 45)
+            d = np.hypot(xs - cx, ys - cy) / radius
+            inside = d < 1.0
+            # 中心亮、边缘暗，亮度在0.35到1.15之间
+            shade = 1.15 - 0.8 * d[inside] ** 2
+            color = np.asarray(base, dtype=np.float32) * shade[:, None] * rng.uniform(0.8, 1.2, 3)
+            frame[inside] = color + rng.normal(0, 8, color.shape)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def _errors(ref, mask):
+    """
+    Returns:
+        (范围内像素的漏检数, 范围外像素的误检数, 范围内像素数)
+    """
+    inside = ref > 0
+    return int(np.count_nonzero(inside & (mask == 0))), int(np.count_nonzero(~inside & (mask > 0))), \
+        int(np.count_nonzero(inside))
+
+
+if __name__ == "__main__":
+    # 在带红色和绿色小球的640x480画面上对比查找表分割与原有流程的耗时和精度；
+    # 精度按阈值范围内的像素统计（背景占画面的绝大部分，整体一致率没有意义），并遍历全部BGR颜色
+    import time
+    from ball_detector import RED_HSV_RANGES, GREEN_HSV_RANGES
+
+    frames = _ball_frames(20)
+    n = 200
+    # 全部 256^3 种BGR颜色排成一幅4096x4096的图像
+    all_colors = np.arange(1 << 24, dtype=np.uint32)
+    all_colors = np.stack([all_colors & 0xFF, (all_colors >> 8) & 0xFF, all_colors >> 16], axis=-1)
+    all_colors = all_colors.astype(np.uint8).reshape(4096, 4096, 3)
+
+    for name, ranges in (("红色", RED_HSV_RANGES), ("绿色", GREEN_HSV_RANGES)):
+        refs = [hsv_segment(f, ranges) for f in frames]
+        all_ref = hsv_segment(all_colors, ranges)
+        for bits in (5, 6, 8):
+            start = time.perf_counter()
+            segmenter = LutSegmenter(ranges, bits=bits)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(n):
+                hsv_segment(frames[i % len(frames)], ranges)
+            ref_time = (time.perf_counter() - start) / n
+
+            start = time.perf_counter()
+            for i in range(n):
+                segmenter.segment(frames[i % len(frames)])
+            lut_time = (time.perf_counter() - start) / n
+
+            missed, extra, inside = np.sum([_errors(ref, segmenter.segment(f)) for ref, f in zip(refs, frames)], axis=0)
+            all_missed, all_extra, all_inside = _errors(all_ref, segmenter.segment(all_colors))
+            print(f"{name} bits={bits}: 建表 {build_time * 1000:.1f} ms, "
+                  f"cvtColor+inRange {ref_time * 1000:.3f} ms/帧, 查找表 {lut_time * 1000:.3f} ms/帧; "
+                  f"画面中范围内像素 {inside}, 漏检 {missed / inside * 100:.2f}%, 误检 {extra / inside * 100:.2f}%; "
+                  f"全部颜色 漏检 {all_missed / all_inside * 100:.2f}%, 误检 {all_extra / all_inside * 100:.2f}%")
@@ -0,0 +1,159 @@
+import math
+import threading
+import time
+
+import clock
+
+
+class LatestState:
+    """
+    线程间共享的最新估计状态
+    视觉线程发布位置和速度，控制线程按需读取并外推到当前时刻
+    时刻均使用clock.now()的时钟，发布时为帧的采集时刻
+    """
+    def __init__(self, max_age=0.2):
+        """
+        Args:
+            max_age: 状态最长有效时间 (s)，超过后视为小球丢失
+        """
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.pos = None
+        self.speed = 0.0
+        self.timestamp = None
+
+    def publish(self, pos, speed, timestamp):
+        """发布一次新的估计状态"""
+        with self.lock:
+            self.pos = pos
+            self.speed = speed
+            self.timestamp = timestamp
+
+    def get(self, now):
+        """
+        读取外推到now时刻的状态
+
+        Returns:
+            (pos, speed)，没有状态或状态过旧时返回None
+        """
+        with self.lock:
+            if self.pos is None:
+                return None
+            age = now - self.timestamp
+            if age > self.max_age:
+                return None
+            return self.pos + self.speed * max(0.0, age), self.speed
+
+
+class ControlScheduler:
+    """
+    定频控制调度器
+    在独立线程中以固定周期调用控制函数，与相机帧率解耦，
+    并统计截止时间错过次数和唤醒抖动
+    """
+    def __init__(self, period, step, spin=0.0005):
+        """
+        初始化调度器
+
+        Args:
+            period: 控制周期 (s)
+            step: 控制函数，每个周期调用 step(dt)，dt固定为period
+            spin: 截止时间前最后这段时间改为忙等，减小sleep带来的抖动 (s)
+        """
+        self.period = period
+        self.step = step
+        self.spin = spin
+        self.running = False
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空统计数据"""
+        self.ticks = 0
+        self.deadline_misses = 0   # 控制函数执行超过截止时间而被跳过的周期数
+        self.jitter_sum = 0.0      # 唤醒时刻相对计划时刻的延迟
+        self.jitter_sq_sum = 0.0
+        self.jitter_max = 0.0
+        self.exec_sum = 0.0        # 控制函数执行耗时
+        self.exec_max = 0.0
+
+    def start(self):
+        """启动控制线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True  # 设置为守护线程，随主线程退出
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止控制线程"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        next_time = clock.now() + self.period
+        while self.running:
+            # 先sleep，临近截止时间再忙等
+            remaining = next_time - clock.now()
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+            while clock.now() < next_time:
+                pass
+
+            start = clock.now()
+            jitter = start - next_time
+            try:
+                self.step(self.period)
+            except Exception as e:
+                print(f'控制周期出错: {e}')
+            end = clock.now()
+
+            self.ticks += 1
+            self.jitter_sum += jitter
+            self.jitter_sq_sum += jitter * jitter
+            self.jitter_max = max(self.jitter_max, jitter)
+            self.exec_sum += end - start
+            self.exec_max = max(self.exec_max, end - start)
+
+            next_time += self.period
+            if end > next_time:
+                # 已经错过下一个截止时间，跳过错过的周期而不是连续补跑
+                missed = int((end - next_time) / self.period) + 1
+                self.deadline_misses += missed
+                next_time += missed * self.period
+
+    def stats(self):
+        """
+        返回统计数据
+
+        Returns:
+            dict，时间单位为毫秒
+        """
+        n = max(1, self.ticks)
+        mean = self.jitter_sum / n
+        std = math.sqrt(max(0.0, self.jitter_sq_sum / n - mean * mean))
+        return {
+            'ticks': self.ticks,
+            'deadline_misses': self.deadline_misses,
+            'jitter_mean_ms': mean * 1000,
+            'jitter_std_ms': std * 1000,
+            'jitter_max_ms': self.jitter_max * 1000,
+            'exec_mean_ms': self.exec_sum / n * 1000,
+            'exec_max_ms': self.exec_max * 1000,
+        }
+
+    def print_stats(self):
+        """打印统计数据"""
+        s = self.stats()
+        print(f"控制周期 {self.period * 1000:.1f} ms: 共 {s['ticks']} 次, 错过截止时间 {s['deadline_misses']} 次, "
+              f"抖动 平均 {s['jitter_mean_ms']:.3f} / 标准差 {s['jitter_std_ms']:.3f} / 最大 {s['jitter_max_ms']:.3f} ms, "
+              f"执行耗时 平均 {s['exec_mean_ms']:.3f} / 最大 {s['exec_max_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    # 空载测试调度精度
+    scheduler = ControlScheduler(0.005, lambda dt: None).start()
+    time.sleep(2)
+    scheduler.stop()
+    scheduler.print_stats()
@@ -3,14 +3,44 @@ import numpy as np
 import time
 import csv
 import os
+import atexit
+import threading
+from collections import deque, namedtuple
 from datetime import datetime
+from binary_log import BinaryLogWriter, write_csv_header, EXTENSION as BINARY_EXTENSION
+from series_buffer import SeriesBuffer
+import clock
+
+# 日志通道：名称、dtype、单位、说明，写入文件表头
+Channel = namedtuple('Channel', ['name', 'dtype', 'unit', 'description'])
+
+def _csv_row(row):
+    """CSV中缺失值(nan)留空"""
+    return ['' if v != v else v for v in row]
 
 class DataLogger:
-    def __init__(self, filename=None):
+    # 固定通道，依次对应log_data的参数，时间用float64，其余用float32
+    CHANNELS = [
+        Channel('Time (s)', '<f8', 's', '开始记录后的时间'),
+        Channel('Target Speed', '<f4', 'px/s', '位置环输出的目标速度'),
+        Channel('Current Position', '<f4', 'px', '小球位置（相对中心）'),
+        Channel('Current Speed', '<f4', 'px/s', '小球速度'),
+        Channel('Target Degree', '<f4', '', '速度环输出的角度'),
+        Channel('Servo Position', '<f4', 'step', '舵机反馈的当前位置'),
+    ]
+
+    def __init__(self, filename=None, file_format='csv', async_write=True, batch_size=200, flush_interval=0.5,
+                 max_pending=20000, history_seconds=None):
         """初始化数据记录器
         
         Args:
             filename: 保存数据的文件名，如果为None则自动生成
+            file_format: 'csv'，或 'binary' 二进制列式格式（见binary_log.py，文件更小、写入更快）
+            async_write: 是否由后台线程批量写入文件，为False时每条数据立即写入
+            batch_size: 积累多少行后唤醒写入线程
+            flush_interval: 最长写入间隔 (s)
+            max_pending: 待写入的最大行数，磁盘卡顿导致积压超过该值时丢弃新数据（内存中的数据不受影响）
+            history_seconds: 内存中只保留最近多少秒的数据（环形缓存），None时保留全部数据；文件中始终是完整数据
         """
         # 确保data目录存在
         self.data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
@@ -20,7 +50,8 @@ class DataLogger:
         if filename is None:
             # 使用当前时间创建文件名
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.filename = os.path.join(self.data_dir, f"data_log_{timestamp}.csv")
+            extension = BINARY_EXTENSION if file_format == 'binary' else '.csv'
+            self.filename = os.path.join(self.data_dir, f"data_log_{timestamp}{extension}")
         else:
             # 如果提供了文件名但没有包含路径，则添加data目录路径
             if os.path.dirname(filename) == '':
@@ -28,24 +59,103 @@ class DataLogger:
             else:
                 self.filename = filename
             
-        # 初始化数据列表
-        self.time_data = []
-        self.tar_speed_data = []
-        self.cur_pos_data = []
-        self.cur_speed_data = []
-        self.tar_degree_data = []  # 添加tar_degree数据列表
+        # 通道表，add_channel()添加的附加通道排在固定通道之后
+        self.channels = list(self.CHANNELS)
+        self.defaults = []  # 附加通道未设置时的值
+        self.row = None     # 正在记录的一行，下次log_data()时提交
+        self.row_lock = threading.Lock()  # 控制线程和视觉线程都会修改当前行
+        self.history_seconds = history_seconds
+        # 内存中的数据，按列存放在连续的数组中
+        self.series = SeriesBuffer([c.name for c in self.channels], window=history_seconds)
         self.start_time = None
         
-        # 创建CSV文件并写入表头
-        with open(self.filename, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Time (s)', 'Target Speed', 'Current Position', 'Current Speed', 'Target Degree'])
+        # 文件在第一次记录数据时创建，表头中包括全部通道
+        self.binary = file_format == 'binary'
+        self.file = None  # 保持打开的文件，同步写CSV时为None
+        self.opened = False
+
+        # 异步写入：控制循环只把数据行放入队列，写入线程按批次写入文件
+        self.async_write = async_write
+        self.closed = False
+        self.file_lock = threading.Lock()
+        if async_write:
+            self.batch_size = batch_size
+            self.flush_interval = flush_interval
+            self.max_pending = max_pending
+            self.pending = deque()  # deque的append和popleft是线程安全的，写数据时不需要加锁
+            self.dropped = 0        # 因积压过多而丢弃的行数
+            self.wakeup = threading.Event()
+            self.running = True
+            self.writer_thread = threading.Thread(target=self._writer_loop)
+            self.writer_thread.daemon = True
+            self.writer_thread.start()
+        atexit.register(self.close)  # 程序退出时写完剩余数据并关闭文件
     
-    def start(self):
-        """开始记录，重置开始时间"""
-        self.start_time = time.time()
+    def add_channel(self, name, dtype='<f4', unit='', description=''):
+        """注册附加通道，必须在第一次log_data()之前调用
+        
+        Args:
+            name: 通道名称（文件中的列名）
+            dtype: 数据类型，如 '<f4'、'<f8'、'<i4'
+            unit: 单位
+            description: 说明
+            
+        Returns:
+            通道号，用于set()
+        """
+        if self.opened:
+            raise RuntimeError("开始记录后不能再添加通道")
+        if any(c.name == name for c in self.channels):
+            raise ValueError(f"通道 '{name}' 已存在")
+        dtype = np.dtype(dtype).newbyteorder('<').str
+        self.channels.append(Channel(name, dtype, unit, description))
+        # 未设置时浮点通道记为nan，整数通道记为0
+        self.defaults.append(np.nan if np.dtype(dtype).kind == 'f' else 0)
+        self.series = SeriesBuffer([c.name for c in self.channels], window=self.history_seconds)
+        return len(self.channels) - 1
+
+    def set(self, index, value):
+        """设置当前行中附加通道的值
+        
+        log_data()开始新的一行，之后到下一次log_data()之前设置的值都记入这一行；
+        本行没有设置的通道记为缺失值（浮点为nan，整数为0）。可以在其他线程中调用
+        
+        Args:
+            index: add_channel()返回的通道号
+            value: 数值
+        """
+        with self.row_lock:
+            if self.row is not None:
+                self.row[index] = value
+
+    def _open(self):
+        """创建文件并写入表头"""
+        columns = [tuple(c) for c in self.channels]
+        if self.binary:
+            self.file = BinaryLogWriter(self.filename, columns)
+        else:
+            with open(self.filename, 'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow([c.name for c in self.channels])
+            write_csv_header(self.filename, columns)  # 单位和说明写入同名的.json文件
+            if self.async_write:
+                self.file = open(self.filename, 'a', newline='')
+                self.writer = csv.writer(self.file)
+        self.opened = True
+        if self.binary:
+            print(f"数据记录: {self.filename}（二进制格式，python binary_log.py 可转换为CSV，plot_data.py 可直接读取）")
+        else:
+            print(f"数据记录: {self.filename}（CSV格式）")
+
+    def start(self, timestamp=None):
+        """开始记录，重置开始时间
+        
+        Args:
+            timestamp: 开始时刻 (s，clock.now()的时钟)，None时使用当前时刻
+        """
+        self.start_time = clock.now() if timestamp is None else timestamp
     
-    def log_data(self, tar_speed, cur_pos, cur_speed, tar_degree=None):
+    def log_data(self, tar_speed, cur_pos, cur_speed, tar_degree=None, servo_pos=None, timestamp=None):
         """记录一组数据
         
         Args:
@@ -53,23 +163,118 @@ class DataLogger:
             cur_pos: 当前位置
             cur_speed: 当前速度
             tar_degree: 目标角度（可选）
+            servo_pos: 舵机反馈的当前位置（可选）
+            timestamp: 数据对应的时刻 (s，clock.now()的时钟)，一般为帧的采集时刻，None时使用当前时刻
         """
+        if timestamp is None:
+            timestamp = clock.now()
         if self.start_time is None:
-            self.start()  # 如果还没开始，则开始记录
+            self.start(timestamp)  # 如果还没开始，则开始记录
             
-        current_time = time.time() - self.start_time
-        
-        # 添加到内存中的数据列表
-        self.time_data.append(current_time)
-        self.tar_speed_data.append(tar_speed)
-        self.cur_pos_data.append(cur_pos)
-        self.cur_speed_data.append(cur_speed)
-        self.tar_degree_data.append(tar_degree if tar_degree is not None else 0)  # 添加tar_degree数据
+        current_time = timestamp - self.start_time
         
-        # 写入CSV文件
-        with open(self.filename, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow([current_time, tar_speed, cur_pos, cur_speed, tar_degree if tar_degree is not None else 0])
+        if tar_degree is None:
+            tar_degree = 0
+        # 没有舵机反馈时记为nan
+        row = [current_time, tar_speed, cur_pos, cur_speed, tar_degree,
+               servo_pos if servo_pos is not None else np.nan] + self.defaults
+        # 提交上一行，之后set()的值记入新的一行
+        with self.row_lock:
+            if self.row is not None:
+                self._commit(self.row)
+            self.row = row
+
+    def _commit(self, row):
+        """把一行数据加入内存中的数据并写入文件"""
+        if not self.opened:
+            with self.file_lock:
+                self._open()
+        self.series.append(row)
+        if self.async_write and not self.closed:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending.append(row)
+            if len(self.pending) >= self.batch_size:
+                self.wakeup.set()
+        elif self.binary:
+            with self.file_lock:
+                if not self.file.closed:
+                    self.file.write_rows([row])
+        else:
+            with open(self.filename, 'a', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(_csv_row(row))
+
+    # 按时间顺序返回内存中的各列数据 (numpy数组)
+    @property
+    def time_data(self):
+        return self.series.column('Time (s)')
+
+    @property
+    def tar_speed_data(self):
+        return self.series.column('Target Speed')
+
+    @property
+    def cur_pos_data(self):
+        return self.series.column('Current Position')
+
+    @property
+    def cur_speed_data(self):
+        return self.series.column('Current Speed')
+
+    @property
+    def tar_degree_data(self):
+        return self.series.column('Target Degree')
+
+    @property
+    def servo_pos_data(self):
+        return self.series.column('Servo Position')
+
+    def _writer_loop(self):
+        """写入线程，积累到batch_size行或每隔flush_interval写入一次"""
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """把队列中的数据全部写入文件"""
+        if not self.async_write:
+            return
+        with self.file_lock:
+            if self.file is None or self.file.closed:
+                return
+            rows = []
+            while self.pending:
+                rows.append(self.pending.popleft())
+            if not rows:
+                return
+            if self.binary:
+                self.file.write_rows(rows)  # 每批数据写成一个数据块
+            else:
+                self.writer.writerows([_csv_row(row) for row in rows])
+                self.file.flush()
+
+    def close(self):
+        """停止写入线程，写完剩余数据并关闭文件，可重复调用"""
+        if self.closed:
+            return
+        with self.row_lock:
+            if self.row is not None:
+                self._commit(self.row)  # 最后一行
+                self.row = None
+        self.closed = True
+        if self.async_write:
+            self.running = False
+            self.wakeup.set()
+            self.writer_thread.join(timeout=2.0)
+            self.flush()
+            if self.dropped:
+                print(f"数据记录: 磁盘写入积压，丢弃了 {self.dropped} 行")
+        if self.file is not None:
+            with self.file_lock:
+                self.file.close()
     
     def plot_data(self, show=True, save=True):
         """绘制记录的数据
@@ -78,7 +283,7 @@ class DataLogger:
             show: 是否显示图表
             save: 是否保存图表
         """
-        if len(self.time_data) == 0:
+        if len(self.series) == 0:
             print("没有数据可以绘制")
             return
             
@@ -115,7 +320,7 @@ class DataLogger:
         
         # 保存图表
         if save:
-            plot_filename = self.filename.replace('.csv', '.png')
+            plot_filename = os.path.splitext(self.filename)[0] + '.png'
             plt.savefig(plot_filename, dpi=300)  # 提高分辨率
             print(f"图表已保存为: {plot_filename}")
         
@@ -136,6 +341,7 @@ if __name__ == "__main__":
             tar_degree=np.sin(i/8) * 30  # 添加tar_degree测试数据
         )
         time.sleep(0.05)
+    logger.close()
     
     # 绘制数据
     logger.plot_data()
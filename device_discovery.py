@@ -0,0 +1,233 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import serial
+import serial.tools.list_ports
+
+from driver import ServoDriver
+
+# 上次找到的设备，按USB id保存，设备号变化后仍能找回
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'device_cache.json')
+
+Devices = namedtuple('Devices', ['camera', 'serial_port'])
+
+
+# pyserial的comports()在Linux上只列出固定几类设备名，不包括CH343驱动创建的 /dev/ttyCH343USB*（舵机串口）
+EXTRA_PORT_PATTERNS = ['/dev/ttyCH343USB*']
+
+
+def _sysfs_usb_id(path):
+    """从sysfs设备目录向上找到USB设备，返回 'vid:pid:序列号或USB位置'，不是USB设备时返回None"""
+    path = os.path.realpath(path)
+    while path != '/' and os.path.exists(path):
+        if os.path.exists(os.path.join(path, 'idVendor')):
+            def read(name):
+                try:
+                    with open(os.path.join(path, name)) as f:
+                        return f.read().strip()
+                except OSError:
+                    return None
+            return f"{read('idVendor')}:{read('idProduct')}:{read('serial') or os.path.basename(path)}"
+        path = os.path.dirname(path)
+    return None
+
+
+def camera_usb_id(index):
+    """
+    读取摄像头的USB id（仅Linux，通过sysfs）
+
+    Returns:
+        'vid:pid:序列号或USB位置'，无法获取时返回None
+    """
+    return _sysfs_usb_id(f'/sys/class/video4linux/video{index}/device')
+
+
+def serial_usb_id(port):
+    """
+    读取串口的USB id
+
+    Args:
+        port: serial.tools.list_ports.comports()返回的端口信息
+
+    Returns:
+        'vid:pid:序列号或USB位置'，不是USB串口时返回None
+    """
+    if port.vid is None:
+        return None
+    return f"{port.vid:04x}:{port.pid:04x}:{port.serial_number or port.location}"
+
+
+def candidate_ports():
+    """
+    可能连接舵机的串口：USB串口适配器，以及comports()列不出的CH343串口
+    不包括板载串口 (ttyS*、ttyAMA*、Jetson的调试串口)，探测时不会向它们发送数据
+
+    Returns:
+        {设备路径: USB id}
+    """
+    ports = {p.device: serial_usb_id(p) for p in serial.tools.list_ports.comports() if p.vid is not None}
+    for pattern in EXTRA_PORT_PATTERNS:
+        for device in sorted(glob.glob(pattern)):
+            if device not in ports:
+                usb_id = _sysfs_usb_id(f'/sys/class/tty/{os.path.basename(device)}/device')
+                ports[device] = usb_id or f'port:{device}'
+    return ports
+
+
+def probe_camera(index):
+    """打开摄像头并读取一帧，成功返回True"""
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            return False
+        ret, _ = cap.read()
+        return ret
+    finally:
+        cap.release()
+
+
+def probe_servo(port, servo_id=1, baudrate=None, timeout=0.05):
+    """向串口上的舵机发送ping，收到应答返回True"""
+    try:
+        driver = ServoDriver(timeout=timeout, port=port, baudrate=baudrate)
+    except (serial.SerialException, OSError):
+        return False
+    try:
+        for _ in range(2):  # 重试一次，避开串口刚打开时的杂散字节
+            if driver.ping(servo_id) is not None:
+                return True
+        return False
+    finally:
+        driver.close()
+
+
+def probe_all(tasks, timeout):
+    """
+    并行运行探测任务
+
+    Args:
+        tasks: [(key, probe, args), ...]
+        timeout: 最长等待时间 (s)，超时未返回的任务视为失败（卡住的摄像头不会拖慢启动）
+
+    Returns:
+        探测成功的key集合
+    """
+    results = {}
+
+    def run(key, probe, args):
+        try:
+            results[key] = probe(*args)
+        except Exception as e:
+            print(f"探测 {key} 出错: {e}")
+            results[key] = False
+
+    threads = [threading.Thread(target=run, args=task, daemon=True) for task in tasks]
+    for t in threads:
+        t.start()
+    deadline = time.perf_counter() + timeout
+    for t in threads:
+        t.join(max(0.0, deadline - time.perf_counter()))
+    return {key for key, ok in results.items() if ok}
+
+
+def load_cache(path=None):
+    try:
+        with open(path or CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=None):
+    path = path or CACHE_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+
+def _find_cached(entry, current, key):
+    """在当前设备中找到与缓存USB id相同的设备，返回其编号/路径"""
+    if not entry:
+        return None
+    for device, usb_id in current.items():
+        if usb_id == entry.get('usb_id'):
+            return device
+    return entry.get(key) if entry.get(key) in current else None
+
+
+def discover_devices(preferred_camera=0, camera_indices=range(4), servo_id=1, baudrate=None,
+                     use_cache=True, timeout=5.0):
+    """
+    查找摄像头和舵机串口
+    先只验证缓存中的设备，验证失败的再并行探测全部候选设备，不需要用户输入
+
+    Args:
+        preferred_camera: 多个摄像头可用时优先使用的编号
+        camera_indices: 候选摄像头编号
+        servo_id: 用于ping的舵机ID
+        baudrate: 串口波特率，None时使用driver中的默认值
+        use_cache: 是否读写缓存
+        timeout: 每轮探测的最长时间 (s)
+
+    Returns:
+        Devices(camera, serial_port)，没有找到的设备为None
+    """
+    start = time.perf_counter()
+    cameras = {i: camera_usb_id(i) or f'index:{i}' for i in camera_indices}
+    ports = candidate_ports()
+    cache = load_cache() if use_cache else {}
+
+    camera = _find_cached(cache.get('camera'), cameras, 'index')
+    port = _find_cached(cache.get('serial'), ports, 'port')
+    tasks = []
+    if camera is not None:
+        tasks.append((('camera', camera), probe_camera, (camera,)))
+    if port is not None:
+        tasks.append((('serial', port), probe_servo, (port, servo_id, baudrate)))
+    ok = probe_all(tasks, timeout) if tasks else set()
+    if ('camera', camera) not in ok:
+        camera = None
+    if ('serial', port) not in ok:
+        port = None
+    cached = [name for name, device in (('摄像头', camera), ('串口', port)) if device is not None]
+
+    # 缓存失效的设备全部并行探测
+    tasks = []
+    if camera is None:
+        tasks += [(('camera', i), probe_camera, (i,)) for i in cameras]
+    if port is None:
+        tasks += [(('serial', p), probe_servo, (p, servo_id, baudrate)) for p in ports]
+    if tasks:
+        ok = probe_all(tasks, timeout)
+        if camera is None:
+            found = [i for i in cameras if ('camera', i) in ok]
+            camera = preferred_camera if preferred_camera in found else (found[0] if found else None)
+        if port is None:
+            found = [p for p in ports if ('serial', p) in ok]
+            port = found[0] if found else None
+
+    if use_cache and (camera is not None or port is not None):
+        if camera is not None:
+            cache['camera'] = {'usb_id': cameras[camera], 'index': camera}
+        if port is not None:
+            cache['serial'] = {'usb_id': ports[port], 'port': port}
+        save_cache(cache)
+
+    elapsed = time.perf_counter() - start
+    print(f"设备查找耗时 {elapsed:.2f} s: 摄像头 {camera if camera is not None else '未找到'}, "
+          f"舵机串口 {port or '未找到'}" + (f" (缓存命中: {'、'.join(cached)})" if cached else ""))
+    return Devices(camera, port)
+
+
+if __name__ == "__main__":
+    # 列出所有候选设备并查找
+    for i in range(4):
+        print(f"摄像头 #{i}: USB id {camera_usb_id(i)}")
+    for device, usb_id in candidate_ports().items():
+        print(f"串口 {device}: USB id {usb_id}")
+    print(discover_devices())
@@ -1,14 +1,22 @@
 import serial
 import time
-import struct
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
 from pid import PID
-def configure_serial():
+from packet_encoder import PacketEncoder
+from packet_parser import PacketParser
+from latency_stats import LatencyStats
+def configure_serial(port=None, baudrate=None):
     """配置串口参数"""
     # 修改以下参数：
     # port: 串口设备路径，如'/dev/ttyUSB0'
     # baudrate: 波特率，如100000
-    port = '/dev/ttyCH343USB0'  # 修改此处设置串口设备
-    baudrate = 1000000      # 修改此处设置波特率
+    if port is None:
+        port = '/dev/ttyCH343USB0'  # 修改此处设置串口设备
+    if baudrate is None:
+        baudrate = 1000000      # 修改此处设置波特率
     
     return serial.Serial(
         port=port,
@@ -16,37 +24,269 @@ def configure_serial():
         timeout=1
     )
 class ServoDriver:
-    def __init__(self, timeout=0.1):
-        self.ser = configure_serial()
+    def __init__(self, timeout=0.1, async_mode=False, on_response=None, on_error=None, port=None, baudrate=None,
+                 status_return_level=1):
+        """
+        初始化舵机驱动
+        :param timeout: 应答超时时间 (s)
+        :param async_mode: 异步模式，指令进入发送队列后立即返回Future，由后台线程收发
+        :param on_response: 异步模式下收到应答的回调 on_response(servo_id, instruction, packet, rtt)，packet为StatusPacket
+        :param on_error: 异步模式下应答带错误或超时的回调 on_error(servo_id, instruction, error)，超时时error为None
+        :param port: 串口设备路径，为None时使用configure_serial中的默认设备（虚拟舵机见virtual_servo.py）
+        :param baudrate: 波特率，为None时使用默认值
+        :param status_return_level: 舵机的应答级别，0时只应答PING和READ，1时所有非广播指令都应答
+        """
+        self.ser = configure_serial(port, baudrate)
         self.ser.timeout = timeout
+        self.timeout = timeout
+        self.async_mode = async_mode
+        self.on_response = on_response
+        self.on_error = on_error
+        self.status_return_level = status_return_level
+        self.timeouts = 0
+        self.encoder = PacketEncoder()  # 预分配的指令包模板
+        self.parser = PacketParser()    # 应答包流式解析器
+        self.latency = LatencyStats()   # 按指令类型统计的收发耗时
+        self.last_sent = None           # 同步模式下最后一次发送的 (指令码, 发送时刻)
+
+        if async_mode:
+            self.tx_queue = queue.Queue()
+            self.pending = deque()  # 已发送、等待应答的请求，按发送顺序排列
+            self.pending_lock = threading.Lock()
+            self.first_byte_entry = None  # 已记录过首字节时间的请求
+            self.running = True
+            self.writer_thread = threading.Thread(target=self._writer_loop)
+            self.writer_thread.daemon = True
+            self.writer_thread.start()
+            self.reader_thread = threading.Thread(target=self._reader_loop)
+            self.reader_thread.daemon = True
+            self.reader_thread.start()
+
+    def send_packet(self, servo_id, instruction, params=[], replies=0):
+        """
+        发送指令包
+        :param replies: 期望的应答包数量（仅异步模式使用）。舵机会应答的指令必须给出，
+                        否则这个应答会被当成后面请求的应答；写数据请用write_data/reg_write
+        :return: 异步模式下返回Future，结果为应答的错误字节，超时为None
+        """
+        return self._send(self.encoder.encode, (servo_id, instruction, params), servo_id, instruction,
+                          [servo_id] * replies)
+
+    def _send(self, encode, args, servo_id, instruction, expect=(), payload=False, many=False):
+        """
+        编码并发送指令包
+        :param encode: 编码函数，encode(*args)返回指令包
+        :param expect: 期望应答的舵机ID列表，按应答顺序排列（仅异步模式使用）
+        :param payload: 为True时Future的结果为StatusPacket，否则为错误字节
+        :param many: 为True时Future的结果为与expect对应的StatusPacket列表
+        """
+        if self.async_mode:
+            # 在发送线程中编码，编码器的缓冲区只被一个线程使用
+            future = Future()
+            self.tx_queue.put((encode, args, instruction, expect, (payload, many), future))
+            return future
 
-    def send_packet(self, servo_id, instruction, params=[]):
-        length = len(params) + 2
-        packet = [0xFF, 0xFF, servo_id, length, instruction] + params
-        checksum = (~sum(packet[2:]) & 0xFF)
-        packet.append(checksum)
-        data_bytes = bytes(packet)
         try:
-            
-            self.ser.write(data_bytes)
-           
+            start = time.perf_counter()
+            self.ser.write(encode(*args))
+            self.latency.record(instruction, 'write', time.perf_counter() - start)
+            self.last_sent = (instruction, start)
         except KeyboardInterrupt:
             print("\n程序终止")
-    
+
+    def request(self, servo_id, instruction, params=[], replies=1):
+        """
+        发送需要应答的指令
+        同步模式下阻塞读取应答并返回错误字节，异步模式下立即返回Future
+        """
+        return self._request(self.encoder.encode, (servo_id, instruction, params), servo_id, instruction,
+                             [servo_id] * replies)
+
+    def _request(self, encode, args, servo_id, instruction, expect=None, payload=False, many=False):
+        """
+        发送指令并等待应答，参数含义与_send相同
+        :return: 同步模式下many为True时返回StatusPacket列表，payload为True时返回StatusPacket，
+                 否则返回错误字节；异步模式下返回结果相同的Future
+        """
+        if expect is None:
+            expect = [servo_id]
+        if self.async_mode:
+            return self._send(encode, args, servo_id, instruction, expect, payload, many)
+        self._send(encode, args, servo_id, instruction)
+        packets = self.read_replies(expect)
+        if many:
+            return packets
+        packet = packets[0]
+        if payload or packet is None:
+            return packet
+        return packet.error
+
+    def _writer_loop(self):
+        """异步模式的发送线程"""
+        while self.running:
+            try:
+                encode, args, instruction, expect, shape, future = self.tx_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if expect:
+                # 先登记再发送，避免应答比登记先到
+                # 同一请求的多个应答共享results列表，最后一个应答到达或超时时设置Future
+                results = [None] * len(expect)
+                with self.pending_lock:
+                    now = time.perf_counter()
+                    for i, sid in enumerate(expect):
+                        self.pending.append([sid, instruction, future, now, results, i, shape])
+            start = time.perf_counter()
+            try:
+                self.ser.write(encode(*args))
+            except Exception as e:
+                # 发送失败时撤销登记并把异常交给Future，线程继续处理后面的指令
+                with self.pending_lock:
+                    for entry in [entry for entry in self.pending if entry[2] is future]:
+                        self.pending.remove(entry)
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.latency.record(instruction, 'write', time.perf_counter() - start)
+            if not expect:
+                future.set_result(None)
+
+    def _reader_loop(self):
+        """异步模式的接收线程，解析应答包并与请求按顺序匹配"""
+        while self.running:
+            # 有多少读多少，没有数据时最多阻塞timeout
+            data = self.ser.read(self.ser.in_waiting or 1)
+            now = time.perf_counter()
+            head = None
+            if data:
+                with self.pending_lock:
+                    head = self.pending[0] if self.pending else None
+                if head is not None and head[5] == 0 and head is not self.first_byte_entry:
+                    # 请求的第一个应答开始到达
+                    self.first_byte_entry = head
+                    self.latency.record(head[1], 'first_byte', now - head[3])
+                self.parser.feed(data)
+            errors = self.parser.checksum_errors
+            packet = self.parser.next_packet()
+            while packet is not None:
+                self._dispatch(packet, now)
+                packet = self.parser.next_packet()
+            if self.parser.checksum_errors > errors and head is not None:
+                self.latency.record_checksum_error(head[1], self.parser.checksum_errors - errors)
+            self._expire(now)
+
+    def _dispatch(self, packet, now):
+        """把一个应答包交给等待它的请求"""
+        with self.pending_lock:
+            for index, entry in enumerate(self.pending):
+                if entry[0] in (packet.servo_id, 0xFE):
+                    break
+            else:
+                return  # 没有请求在等待该舵机的应答，丢弃
+            # 排在前面的请求的应答已经丢失，应答是按发送顺序返回的
+            lost = [self.pending.popleft() for _ in range(index)]
+            entry = self.pending.popleft()
+        for lost_entry in lost:
+            self._resolve(lost_entry, None)
+        self._resolve(entry, packet, now - entry[3])
+
+    def _expire(self, now):
+        """清理超时的请求"""
+        expired = []
+        with self.pending_lock:
+            while self.pending and now - self.pending[0][3] > self.timeout:
+                expired.append(self.pending.popleft())
+        for entry in expired:
+            self._resolve(entry, None)
+
+    def _resolve(self, entry, packet, rtt=None):
+        """记录一个应答（packet为None表示超时或丢失），并在需要时设置Future和调用回调"""
+        servo_id, instruction, future, _, results, i, (payload, many) = entry
+        results[i] = packet
+        if packet is None:
+            self.timeouts += 1
+            self.latency.record_timeout(instruction)
+            if self.on_error is not None:
+                self.on_error(servo_id, instruction, None)
+        else:
+            self.latency.record(instruction, 'rtt', rtt)
+            if self.on_response is not None:
+                self.on_response(packet.servo_id, instruction, packet, rtt)
+            if packet.error and self.on_error is not None:
+                self.on_error(packet.servo_id, instruction, packet.error)
+        if i == len(results) - 1:
+            if many:
+                future.set_result(results)
+            elif payload or packet is None:
+                future.set_result(packet)
+            else:
+                future.set_result(packet.error)
+
+    def read_replies(self, servo_ids):
+        """
+        同步模式下读取一组舵机的应答
+        :param servo_ids: 期望应答的舵机ID列表，0xFE表示接受任意舵机
+        :return: 与servo_ids对应的StatusPacket列表，超时的位置为None
+        """
+        instruction, sent_time = self.last_sent if self.last_sent is not None else (None, None)
+        first_byte = instruction is not None
+        errors = self.parser.checksum_errors
+        results = [None] * len(servo_ids)
+        waiting = len(servo_ids)
+        deadline = time.perf_counter() + self.timeout
+        while waiting:
+            packet = self.parser.next_packet()
+            if packet is None:
+                if time.perf_counter() > deadline:
+                    break
+                data = self.ser.read(self.ser.in_waiting or 1)
+                if data:
+                    if first_byte:
+                        self.latency.record(instruction, 'first_byte', time.perf_counter() - sent_time)
+                        first_byte = False
+                    self.parser.feed(data)
+                continue
+            for i, sid in enumerate(servo_ids):
+                if results[i] is None and sid in (packet.servo_id, 0xFE):
+                    results[i] = packet
+                    waiting -= 1
+                    if instruction is not None:
+                        self.latency.record(instruction, 'rtt', time.perf_counter() - sent_time)
+                    break
+            # 其他舵机的应答（例如之前超时的迟到应答）直接丢弃
+        self.timeouts += waiting
+        if instruction is not None:
+            for _ in range(waiting):
+                self.latency.record_timeout(instruction)
+            if self.parser.checksum_errors > errors:
+                self.latency.record_checksum_error(instruction, self.parser.checksum_errors - errors)
+        return results
+
+    def close(self):
+        """停止后台线程并关闭串口"""
+        if self.async_mode:
+            self.running = False
+            self.writer_thread.join(timeout=1.0)
+            self.reader_thread.join(timeout=1.0)
+        self.ser.close()
 
 
 
     def ping(self, servo_id):
-        self.send_packet(servo_id, 0x01)
+        """
+        PING舵机
+        :return: 应答的错误字节，超时为None；异步模式下返回Future
+        """
+        return self.request(servo_id, 0x01)
     def read_data(self, servo_id, address, length):
         """
         读取舵机内存数据
         :param servo_id: 舵机ID
         :param address: 读取起始地址
         :param length: 读取数据长度
+        :return: StatusPacket，数据在packet.params中，超时为None；异步模式下返回Future
         """
-        self.send_packet(servo_id, 0x02, [address, length])
-        return self.read_response()
+        return self._request(self.encoder.read_data, (servo_id, address, length), servo_id, 0x02, payload=True)
     
     def write_data(self, servo_id, address, data):
         """
@@ -54,14 +294,26 @@ class ServoDriver:
         :param servo_id: 舵机ID
         :param address: 写入起始地址
         :param data: 数据（列表）
+        :return: 应答的错误字节，超时或舵机不应答时为None；异步模式下返回Future
         """
-        self.send_packet(servo_id, 0x03, [address] + data)
+        return self._write(self.encoder.encode, (servo_id, 0x03, [address] + data), servo_id, 0x03)
     
     def reg_write(self, servo_id, address, data):
         """
         异步写入指令
+        :return: 与write_data相同
         """
-        self.send_packet(servo_id, 0x04, [address] + data)
+        return self._write(self.encoder.encode, (servo_id, 0x04, [address] + data), servo_id, 0x04)
+
+    def _write(self, encode, args, servo_id, instruction):
+        """
+        发送写类指令，参数含义与_send相同
+        舵机对非广播的写指令也会应答，需要登记（异步模式）或读掉（同步模式）这个应答，
+        否则它会被当成后面请求的应答；广播或应答级别为0时舵机不应答
+        """
+        if servo_id == 0xFE or self.status_return_level == 0:
+            return self._send(encode, args, servo_id, instruction)
+        return self._request(encode, args, servo_id, instruction)
     
     def action(self):
         """
@@ -76,51 +328,39 @@ class ServoDriver:
         :param length: 写入数据长度
         :param servo_data: 形如 [(id, [data...]), (id, [data...])]
         """
-        params = [address, length]
-        for sid, data in servo_data:
-            params.append(sid)
-            params.extend(data)
-        self.send_packet(0xFE, 0x83, params)
+        self._send(self.encoder.sync_write, (address, length, servo_data), 0xFE, 0x83)
     
     def sync_read(self, address, length, servo_ids):
         """
         同步读取多个舵机
+        :return: 与servo_ids对应的StatusPacket列表，超时的位置为None；异步模式下返回Future
         """
-        self.send_packet(0xFE, 0x82, [address, length] + servo_ids)
-        return self.read_response()
+        return self._request(self.encoder.encode, (0xFE, 0x82, [address, length] + servo_ids), 0xFE, 0x82,
+                             list(servo_ids), many=True)
     
     def recovery(self, servo_id):
         """
         恢复出厂设置
         """
-        self.send_packet(servo_id, 0x06)
-        return self.read_response()
+        return self.request(servo_id, 0x06)
     
     def reset(self, servo_id):
         """
         复位舵机
         """
-        self.send_packet(servo_id, 0x0A)
-        return self.read_response()
+        return self.request(servo_id, 0x0A)
 
-    def read_response(self):
-        header = self.ser.read(2)
-        if header != b'\xFF\xFF':
-            return None
-        data = self.ser.read(4)
-        if len(data) < 4:
-            return None
-        _, _, error = struct.unpack('BBB', data[:3])
-        return error
+    def read_response(self, servo_id=0xFE):
+        """读取一个应答，返回错误字节，超时返回None"""
+        packet = self.read_replies([servo_id])[0]
+        return None if packet is None else packet.error
 
     def move_degree(self, servo_id, degree, time, speed):
         max_degree=2248
         min_degree=1848
         
-        params = [0x2A, degree & 0xFF, degree >> 8, time & 0xFF, time >> 8, speed & 0xFF, speed >> 8]
-        self.send_packet(servo_id, 0x03, params)
-        
-        return self.read_response()
+        # 写目标位置(0x2A)：位置、时间、速度各两字节，低字节在前
+        return self._write(self.encoder.goal_position, (servo_id, degree, time, speed), servo_id, 0x03)
     
 
 if __name__ == '__main__':
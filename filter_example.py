@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import os
+from binary_log import load_log, EXTENSION as BINARY_EXTENSION
 from filter import LowPassFilter, MovingAverageFilter
 
 def apply_filters_to_csv(csv_file, cutoff_freq=5.0, sampling_rate=30.0, window_size=5, filter_order=4):
@@ -21,8 +22,8 @@ def apply_filters_to_csv(csv_file, cutoff_freq=5.0, sampling_rate=30.0, window_s
         return False
     
     try:
-        # 读取CSV数据
-        df = pd.read_csv(csv_file)
+        # 读取CSV或二进制日志（二进制日志通过numpy.memmap读取）
+        df = load_log(csv_file)
         
         # 检查必需的列
         required_columns = ['Time (s)', 'Target Speed', 'Current Position', 'Current Speed']
@@ -102,7 +103,7 @@ def apply_filters_to_csv(csv_file, cutoff_freq=5.0, sampling_rate=30.0, window_s
         plt.tight_layout()
         
         # 将图保存为图像
-        plot_filename = csv_file.replace('.csv', '_filtered.png')
+        plot_filename = os.path.splitext(csv_file)[0] + '_filtered.png'
         plt.savefig(plot_filename, dpi=300)
         print(f"滤波比较图已保存为: {plot_filename}")
         
@@ -115,7 +116,7 @@ def apply_filters_to_csv(csv_file, cutoff_freq=5.0, sampling_rate=30.0, window_s
         return False
 
 def list_data_files():
-    """列出数据目录中所有可用的CSV数据文件"""
+    """列出数据目录中所有可用的数据文件（CSV或二进制）"""
     # 获取数据目录路径
     data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
     
@@ -124,8 +125,8 @@ def list_data_files():
         os.makedirs(data_dir)
         print(f"已创建数据目录: {data_dir}")
     
-    # 列出数据目录中的所有CSV文件
-    data_files = [f for f in os.listdir(data_dir) if f.startswith('data_log_') and f.endswith('.csv')]
+    # 列出数据目录中的所有CSV和二进制日志文件
+    data_files = [f for f in os.listdir(data_dir) if f.startswith('data_log_') and f.endswith(('.csv', BINARY_EXTENSION))]
     
     if not data_files:
         print("未找到数据文件")
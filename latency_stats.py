@@ -0,0 +1,168 @@
+import bisect
+import threading
+
+# 指令码对应的名称
+INSTRUCTION_NAMES = {
+    0x01: 'ping',
+    0x02: 'read',
+    0x03: 'write',
+    0x04: 'reg_write',
+    0x05: 'action',
+    0x06: 'recovery',
+    0x0A: 'reset',
+    0x82: 'sync_read',
+    0x83: 'sync_write',
+}
+
+# 默认分桶上界 (s)：10us到约1s，每档是上一档的2^(1/4)倍（约19%）
+DEFAULT_BOUNDS = [10e-6 * 2 ** (k / 4) for k in range(67)]
+
+
+class LatencyHistogram:
+    """
+    固定分桶的耗时直方图
+    记录一次只需一次二分查找，内存占用固定，可以长时间运行
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        """
+        Args:
+            bounds: 递增的分桶上界 (s)，超过最后一个上界的值计入溢出桶
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """记录一个耗时 (s)"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """
+        估计分位数
+
+        Args:
+            q: 分位 (0-100)
+
+        Returns:
+            分位数所在桶的上界 (s)，落在溢出桶时返回最大值
+        """
+        if not self.count:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        """返回统计摘要，时间单位为毫秒"""
+        return {
+            'count': self.count,
+            'mean_ms': self.mean() * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+    def buckets(self):
+        """返回 [(上界, 次数), ...]，溢出桶的上界为None"""
+        return list(zip(self.bounds + [None], self.counts))
+
+
+class LatencyStats:
+    """
+    按指令类型统计串口收发耗时
+    每种指令记录 写入耗时、到收到第一个应答字节的时间、完整往返时间，以及超时和校验错误次数
+    """
+    METRICS = ('write', 'first_byte', 'rtt')
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.lock = threading.Lock()  # 异步模式下发送线程和接收线程同时记录
+        self.histograms = {}          # {指令名: {指标: LatencyHistogram}}
+        self.timeouts = {}            # {指令名: 次数}
+        self.checksum_errors = {}     # {指令名: 次数}
+
+    def _get(self, instruction):
+        name = INSTRUCTION_NAMES.get(instruction, f'0x{instruction:02X}')
+        entry = self.histograms.get(name)
+        if entry is None:
+            entry = {metric: LatencyHistogram(self.bounds) for metric in self.METRICS}
+            self.histograms[name] = entry
+            self.timeouts[name] = 0
+            self.checksum_errors[name] = 0
+        return name, entry
+
+    def record(self, instruction, metric, value):
+        """
+        记录一次耗时
+
+        Args:
+            instruction: 指令码
+            metric: 'write'、'first_byte' 或 'rtt'
+            value: 耗时 (s)
+        """
+        with self.lock:
+            self._get(instruction)[1][metric].add(value)
+
+    def record_timeout(self, instruction):
+        """记录一次应答超时或丢失"""
+        with self.lock:
+            name, _ = self._get(instruction)
+            self.timeouts[name] += 1
+
+    def record_checksum_error(self, instruction, n=1):
+        """记录等待该指令应答时发现的校验错误"""
+        with self.lock:
+            name, _ = self._get(instruction)
+            self.checksum_errors[name] += n
+
+    def snapshot(self):
+        """
+        返回当前统计，可在运行中查询
+
+        Returns:
+            {指令名: {'write': {...}, 'first_byte': {...}, 'rtt': {...}, 'timeouts': n, 'checksum_errors': n}}
+        """
+        with self.lock:
+            result = {}
+            for name, entry in self.histograms.items():
+                result[name] = {metric: hist.summary() for metric, hist in entry.items()}
+                result[name]['timeouts'] = self.timeouts[name]
+                result[name]['checksum_errors'] = self.checksum_errors[name]
+            return result
+
+    def print_stats(self, buckets=False):
+        """
+        打印统计数据
+
+        Args:
+            buckets: 是否同时打印往返时间的分桶计数
+        """
+        for name, s in self.snapshot().items():
+            parts = []
+            for metric in self.METRICS:
+                m = s[metric]
+                if m['count']:
+                    parts.append(f"{metric} 平均 {m['mean_ms']:.3f} / p50 {m['p50_ms']:.3f} / "
+                                 f"p99 {m['p99_ms']:.3f} / 最大 {m['max_ms']:.3f} ms")
+            print(f"串口 {name}: 发送 {s['write']['count']} 次, 超时 {s['timeouts']} 次, "
+                  f"校验错误 {s['checksum_errors']} 次; " + '; '.join(parts))
+            if buckets:
+                with self.lock:
+                    hist = self.histograms[name]['rtt']
+                    rows = [(bound, n) for bound, n in hist.buckets() if n]
+                for bound, n in rows:
+                    label = f"<= {bound * 1000:.3f} ms" if bound is not None else "溢出"
+                    print(f"    {label}: {n}")
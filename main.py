@@ -2,199 +2,193 @@ import cv2
 import time
 import math
 from driver import ServoDriver
-from pid import PID
+from device_discovery import discover_devices
+from cascade_controller import CascadeController, load_gains
 from data_logger import DataLogger
+from ball_detector import BallDetector, RED_HSV_RANGES
+from camera_grabber import FrameGrabber
+import clock
+from state_estimator import KalmanFilter
+from servo_commander import ServoCommander
+from servo_feedback import ServoFeedback
+from control_scheduler import ControlScheduler, LatestState
 
 
 # 全局变量存储上一帧信息
 prev_x = None
 prev_y = None
 prev_time = None
-count=0
 # 初始化驱动和PID控制器
-driver = ServoDriver()
-degree_pid = PID(Kp=0.22, Ki=0, Kd=0.01,lim=10000)  # 速度-角度PID参数
-pos_pid = PID(Kp=4, Ki=0, Kd=0.6,lim=30)  # 位置-速度PID参数
+# 并行查找摄像头和舵机串口，结果按USB id缓存，下次启动只验证缓存的设备
+devices = discover_devices(preferred_camera=0)
+driver = ServoDriver(port=devices.serial_port, async_mode=True)  # 异步模式，控制循环不等待串口应答
+commander = ServoCommander(driver)  # 合并同一周期内的重复指令
+feedback = ServoFeedback(driver, [1]).start()  # 后台轮询舵机当前位置
+# 位置-速度-角度级联控制和模式切换，PID参数见CascadeController，模式切换阈值见cascade_controller.PROFILES
+# 位置-速度PID (4, 0, 0.6)，速度-角度PID (0.22, 0, 0.01)，微调PID (0.05, 0, 0.005)
+GAINS_FILE = None  # autotune.py生成的参数文件，如 'data/tuned_gains.json'，None时使用默认参数
+gains = load_gains(GAINS_FILE) if GAINS_FILE else {}
+controller = CascadeController(target=0, table='main', **gains)
 
-# 微调PID控制器 - 更温和的参数用于精确定位
-fine_tune_pid = PID(Kp=0.05, Ki=0, Kd=0.005, lim=5)  # 微调PID参数
+# 初始化数据记录器
+data_logger = DataLogger(file_format='binary')
+# 附加日志通道，用于分析时序和控制过程
+CH_FRAME = data_logger.add_channel('Frame Seq', '<i4', '', '处理的帧序号')
+CH_DT = data_logger.add_channel('dt', '<f4', 's', '控制周期')
+CH_DETECT_TIME = data_logger.add_channel('Detect Time', '<f4', 's', '小球检测耗时')
+CH_CONTROL_TIME = data_logger.add_channel('Control Time', '<f4', 's', '检测之后到发送舵机指令的耗时')
+CH_LATENCY = data_logger.add_channel('Latency', '<f4', 's', '帧采集到发送舵机指令的时间')
+CH_ERROR = data_logger.add_channel('Position Error', '<f4', 'px', '目标位置减当前位置')
+CH_FINE_TUNE = data_logger.add_channel('Fine Tune Angle', '<f4', 'step', '精确定位模式的微调目标')
+CH_MODE = data_logger.add_channel('Mode', '<i1', '', '0 跟踪模式, 1 精准模式, 2 精准模式且已锁定')
+CH_SERVO_CMD = data_logger.add_channel('Servo Command', '<f4', 'step', '本周期实际发送的舵机目标')
 
-tar_pos = 0
+# 初始化小球检测器（找到小球后只处理ROI）
+detector = BallDetector(RED_HSV_RANGES)
 
-# 初始化状态变量
-status = False
-fine_tune_status = False
-precision_mode_count = 0  # 记录进入精准模式的次数
-precision_mode_locked = False  # 是否锁定在精准模式
+# 初始化位置/速度估计器，latency可设为相机加执行的延迟 (s) 以提前预测
+estimator = KalmanFilter('cv', latency=0.0)
 
-# 初始化数据记录器
-data_logger = DataLogger()
+# 定频控制：启用后PID级联在独立线程中按固定周期运行，与相机帧率解耦
+USE_CONTROL_SCHEDULER = False
+CONTROL_PERIOD = 0.01  # 控制周期 (s)
+latest_state = LatestState()
+
+def control_step(cur_pos, cur_speed, dt, timestamp=None):
+    """
+    运行一次位置-速度-角度级联控制和模式切换，并下发舵机指令
 
-def list_cameras():
-    """列出可用摄像头"""
-    for i in range(3):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            print(f"找到摄像头 #{i}")
-            cap.release()
+    Args:
+        cur_pos: 当前位置 (px，相对中心)
+        cur_speed: 当前速度 (px/s)
+        dt: 控制周期 (s)
+        timestamp: 状态对应的时刻 (s，clock.now()的时钟)，用于数据记录
+
+    Returns:
+        当前位置误差
+    """
+    out = controller.step((cur_pos, cur_speed), dt)
+    print(f'tar_speed:{out.tar_speed}, servo_angle:{out.goal}, 模式:{out.mode}')
+    if out.done:
+        print(f"######### 精确定位完成，误差: {controller.target - cur_pos:.2f} #########")
+    
+    # 记录数据，包括tar_degree
+    data_logger.log_data(out.tar_speed, cur_pos, cur_speed, out.tar_degree, feedback.position(1), timestamp)
+    data_logger.set(CH_DT, dt)
+    data_logger.set(CH_ERROR, controller.target - cur_pos)
+    data_logger.set(CH_MODE, controller.mode)
+    if out.fine_tune_angle is not None:
+        data_logger.set(CH_FINE_TUNE, out.fine_tune_angle)
+    
+    commander.request(1, out.goal, 0, out.speed)
+    
+    # 发送本周期最后请求的舵机目标
+    sent = commander.flush()
+    if 1 in sent:
+        data_logger.set(CH_SERVO_CMD, sent[1][0])
+    
+    return out.error
+
+def scheduled_control_step(dt):
+    """定频控制线程的每个周期：取外推到当前时刻的最新估计状态运行级联控制"""
+    now = clock.now()
+    state = latest_state.get(now)
+    if state is None:  # 还没有检测到小球或小球已丢失
+        return
+    cur_pos, cur_speed = state
+    control_step(cur_pos, cur_speed, dt, now)
+    data_logger.set(CH_LATENCY, clock.now() - latest_state.timestamp)
 
 def capture_test_image():
     """捕获测试图像"""
     # 声明使用全局变量
-    global prev_x, prev_y, prev_time, status, count, fine_tune_status
-    global precision_mode_count, precision_mode_locked
+    global prev_x, prev_y, prev_time
     
-    # 尝试打开所有可能的摄像头
-    for i in range(4):  # 尝试0-3号摄像头
-        cap = cv2.VideoCapture(0)
-        if cap.isOpened():
-            print(f"成功打开摄像头 #{i}")
-            # 设置摄像头分辨率
-            break
+    # 打开启动时找到的摄像头，没有找到时使用默认编号
+    camera_index = devices.camera if devices.camera is not None else 0
+    cap = cv2.VideoCapture(camera_index)
+    if cap.isOpened():
+        print(f"成功打开摄像头 #{camera_index}")
 
-    driver.move_degree(1, 2100, 0, 100)  # 控制ID为1的舵机
+    commander.move_now(1, 2100, 0, 100)  # 控制ID为1的舵机
     time.sleep(0.5)
+    
+    # 启动后台取帧线程，循环中总是处理最新一帧
+    grabber = FrameGrabber(cap).start()
+    
+    # 启动定频控制线程
+    scheduler = None
+    if USE_CONTROL_SCHEDULER:
+        scheduler = ControlScheduler(CONTROL_PERIOD, scheduled_control_step).start()
     while True:
-        ret, frame = cap.read()
+        ret, frame, frame_time, frame_seq = grabber.read()
         if not ret:
             print("无法获取画面")
             break
         
-        # 转换到HSV颜色空间
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        
-        # 定义红色的HSV范围
-        lower_red = (0, 120, 70)
-        upper_red = (10, 255, 255)
-        lower_red2 = (170, 120, 70)
-        upper_red2 = (180, 255, 255)
-        
-        # 创建红色掩码
-        mask1 = cv2.inRange(hsv, lower_red, upper_red)
-        mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        mask = cv2.bitwise_or(mask1, mask2)
+        # 检测小球（跟踪模式下只处理预测位置附近的ROI）
+        detect_start = time.perf_counter()
+        ball = detector.detect(frame)
+        detect_end = time.perf_counter()
         
-        # 查找轮廓
-        contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if len(contours) > 0:
-            # 找到最大轮廓
-            c = max(contours, key=cv2.contourArea)
+        if ball is not None:
+            ((x, y), radius) = ball
             
-            # 获取最小外接圆
-            ((x, y), radius) = cv2.minEnclosingCircle(c)
+            scale = 1
+            cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
+            cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
             
-            if radius > 10:  # 过滤小噪点
-
-                scale = 1
-                cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
-                cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
+            # 计算速度
+            global prev_x, prev_y, prev_time
+            current_time = frame_time  # 使用采集时刻计算速度
+            # 用状态估计器滤波位置并估计速度
+            est_x, est_speed = estimator.update(x, current_time)
+            
+            if prev_x is not None and prev_y is not None:
+                # 计算时间差
+                dt = current_time - prev_time
                 
-                # 计算速度
-                global prev_x, prev_y, prev_time
-                current_time = time.time()
+                # 使用估计器输出的速度 (像素/秒)
+                cur_speed = est_speed
                 
-                if prev_x is not None and prev_y is not None:
-                    # 计算位移
-                    dx = x - prev_x
-                    #dy = y - prev_y
-                    #distance = math.sqrt(dx*dx + dy*dy)
-                    distance=dx
-                    # 计算时间差
-                    dt = current_time - prev_time
-                    
-                    # 计算速度 (像素/秒)
-                    cur_speed = distance / dt if dt > 0 else 0
-                    
-                    # 显示速度和坐标（坐标保持原始值）
-                    cv2.putText(frame, f"Ball: ({int(x)}, {int(y)})", 
-                              (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                    cv2.putText(frame, f"Speed: {cur_speed:.1f} px/s", 
-                              (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                    
-                    cur_pos=x-335
-                    print(f'cur_pos:{cur_pos}')
-                    #位置闭环控制
-                    tar_speed=pos_pid.update(tar_pos,cur_pos,dt)
-                    print(tar_speed)
-                    
-                    # 角度闭环控制
-                    tar_degree = degree_pid.update(tar_speed, cur_speed, dt)
-                    
-                    # 记录数据，包括tar_degree
-                    data_logger.log_data(tar_speed, cur_pos, cur_speed, tar_degree)
-                    
-                    # 将控制输出映射到舵机角度
-                    servo_angle = 2100 +int(tar_degree )  # 2048为中心位置
-                    
-                    servo_angle = max(2000, min(2200, servo_angle))  # 限制在安全范围内
-                    servo_angle_tiny = 2100 +int(tar_degree/10 )
-                    servo_angle_tiny = max(2050, min(2150, servo_angle_tiny))
-                    driver.move_degree(1, servo_angle, 0, 500)  # 限制在安全范围内
-                    print(f'servo_angle:{servo_angle}')
-                    
-                    # 计算当前误差
-                    current_error = abs(tar_pos-cur_pos)
-                    
-                    # 检测是否应该退出精准模式
-                    if precision_mode_locked and current_error > 15:
-                        print("######### 误差过大，退出锁定精准模式 #########")
-                        precision_mode_locked = False
-                        precision_mode_count = 0
-                        status = False
-                    
-                    # 检测是否接近目标位置（速度小，位置接近）
-                    if not precision_mode_locked:  # 只有在未锁定精准模式时才检测是否进入精准模式
-                        if((abs(cur_speed)<50) and current_error<10):
-                            status=True
-                            precision_mode_count += 1  # 增加精准模式计数
-                            print(f"进入精准模式第 {precision_mode_count} 次")
-                            
-                            # 如果进入精准模式次数达到10次，锁定精准模式
-                            if precision_mode_count >= 10:
-                                precision_mode_locked = True
-                                print("######### 已锁定精准模式 #########")
-                        
-                        if((abs(cur_speed)>50) or current_error>10):
-                            status=False
-                            # 如果未锁定，则重置计数
-                            if not precision_mode_locked:
-                                precision_mode_count = 0
-                    
-                    # 显示当前模式和锁定状态
-                    mode_text = "精准模式" if status else "跟踪模式"
-                    lock_text = "已锁定" if precision_mode_locked else "未锁定"
-                    cv2.putText(frame, f"模式: {mode_text} ({lock_text})", 
-                              (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                    cv2.putText(frame, f"误差: {current_error:.2f}", 
-                              (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                    
-                    if(status):
-                        print("######### 进入精确定位模式 #########")
-                        # 使用微调PID进行更精确的控制
-                        fine_tune_degree = fine_tune_pid.update(tar_pos, cur_pos, dt)
-                        fine_tune_angle = 2100 + int(fine_tune_degree)
-                        fine_tune_angle = max(2050, min(2150, fine_tune_angle))  # 限制在更小的范围内
-                        
-                        print(f'微调角度: {fine_tune_angle}, 误差: {tar_pos-cur_pos:.2f}')
-                        driver.move_degree(1, fine_tune_angle, 0, 200)  # 使用更低的速度控制舵机
-                        count += 1
-                        fine_tune_status=True
-                        if(count>10 and fine_tune_status==True and abs(cur_speed)<10):
-                            
-                            print("######### 精确定位完成 #########")
-                            driver.move_degree(1, 2100, 0, 100)  # 使用更低的速度控制舵机
-                            print(f'误差: {tar_pos-cur_pos:.2f}')
-                    else:
-                        # 使用常规PID控制
-                        driver.move_degree(1, servo_angle, 0, 500)
-                    
-                    
+                # 显示速度和坐标（坐标保持原始值）
+                cv2.putText(frame, f"Ball: ({int(x)}, {int(y)})", 
+                          (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                cv2.putText(frame, f"Speed: {cur_speed:.1f} px/s", 
+                          (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
                 
-                # 更新上一帧信息
-                prev_x = x
-                prev_y = y
-                prev_time = current_time
+                cur_pos=est_x-335
+                print(f'cur_pos:{cur_pos}')
+                if scheduler is None:
+                    # 每帧运行一次级联控制
+                    current_error = control_step(cur_pos, cur_speed, dt, current_time)
+                    data_logger.set(CH_CONTROL_TIME, time.perf_counter() - detect_end)
+                    data_logger.set(CH_LATENCY, clock.now() - current_time)
+                else:
+                    # 由定频控制线程使用最新的估计状态
+                    latest_state.publish(cur_pos, cur_speed, current_time)
+                    current_error = abs(controller.target-cur_pos)
+                # 定频控制时记入控制线程最近记录的一行
+                data_logger.set(CH_FRAME, frame_seq)
+                data_logger.set(CH_DETECT_TIME, detect_end - detect_start)
+                
+                # 显示当前模式和锁定状态
+                mode_text = "精准模式" if controller.status else "跟踪模式"
+                lock_text = "已锁定" if controller.precision_mode_locked else "未锁定"
+                cv2.putText(frame, f"模式: {mode_text} ({lock_text})", 
+                          (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                cv2.putText(frame, f"误差: {current_error:.2f}", 
+                          (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                
+            
+            # 更新上一帧信息
+            prev_x = x
+            prev_y = y
+            prev_time = current_time
+    
+        else:
+            # 本帧未检测到小球，估计器继续外推
+            estimator.coast(frame_time)
         
         # 创建可调整大小的窗口并显示当前帧
         cv2.namedWindow('Camera Test', cv2.WINDOW_NORMAL)
@@ -217,13 +211,22 @@ def capture_test_image():
         #    print("已保存当前帧为 test_image.jpg")
         #    time.sleep(1)  # 防止连续保存
 
-    cap.release()
+    grabber.release()
+    if scheduler is not None:
+        scheduler.stop()
+        scheduler.print_stats()
+    print(f"丢弃的旧帧数: {grabber.dropped}")
+    print(f"舵机指令统计: {commander.stats()}")
+    feedback.stop()
+    print(f"舵机反馈统计: {feedback.stats()}")
+    driver.latency.print_stats()
     cv2.destroyAllWindows()
     
+    data_logger.close()  # 写完队列中的数据
+    
     # 绘制并保存数据图表
     print("正在生成数据图表...")
     data_logger.plot_data()
 
 if __name__ == "__main__":
-    list_cameras()
     capture_test_image()
@@ -0,0 +1,142 @@
+class PacketEncoder:
+    """
+    舵机协议指令包编码器
+    为每种指令预先分配bytearray模板，编码时只修改变化的字段并就地计算校验和，
+    返回指向内部缓冲区的memoryview，下一次编码同类指令前必须已经发送完毕
+    """
+    def __init__(self):
+        # 写目标位置：FF FF id 09 03 2A posL posH timeL timeH speedL speedH chk
+        self.goal_buf = bytearray([0xFF, 0xFF, 0, 9, 0x03, 0x2A, 0, 0, 0, 0, 0, 0, 0])
+        self.goal_view = memoryview(self.goal_buf)
+        self.goal_base = 9 + 0x03 + 0x2A  # 固定字段对校验和的贡献
+
+        # 读数据：FF FF id 04 02 addr len chk
+        self.read_buf = bytearray([0xFF, 0xFF, 0, 4, 0x02, 0, 0, 0])
+        self.read_view = memoryview(self.read_buf)
+
+        # 其他指令按参数个数缓存缓冲区
+        self.buffers = {}
+
+    def goal_position(self, servo_id, position, time, speed):
+        """
+        编码写目标位置指令（对应ServoDriver.move_degree）
+
+        Args:
+            servo_id: 舵机ID
+            position: 目标位置
+            time: 运行时间
+            speed: 运行速度
+        """
+        b = self.goal_buf
+        b[2] = servo_id
+        b[6] = p0 = position & 0xFF
+        b[7] = p1 = (position >> 8) & 0xFF
+        b[8] = t0 = time & 0xFF
+        b[9] = t1 = (time >> 8) & 0xFF
+        b[10] = s0 = speed & 0xFF
+        b[11] = s1 = (speed >> 8) & 0xFF
+        b[12] = ~(self.goal_base + servo_id + p0 + p1 + t0 + t1 + s0 + s1) & 0xFF
+        return self.goal_view
+
+    def read_data(self, servo_id, address, length):
+        """编码读数据指令"""
+        b = self.read_buf
+        b[2] = servo_id
+        b[5] = address
+        b[6] = length
+        b[7] = ~(4 + 0x02 + servo_id + address + length) & 0xFF
+        return self.read_view
+
+    def _buffer(self, n_params):
+        """取参数个数为n_params的缓冲区"""
+        entry = self.buffers.get(n_params)
+        if entry is None:
+            buf = bytearray(n_params + 6)
+            buf[0] = 0xFF
+            buf[1] = 0xFF
+            buf[3] = n_params + 2
+            entry = (buf, memoryview(buf))
+            self.buffers[n_params] = entry
+        return entry
+
+    def encode(self, servo_id, instruction, params=()):
+        """
+        编码任意指令
+
+        Args:
+            servo_id: 舵机ID
+            instruction: 指令码
+            params: 参数列表
+        """
+        n = len(params)
+        buf, view = self._buffer(n)
+        buf[2] = servo_id
+        buf[4] = instruction
+        buf[5:5 + n] = params
+        buf[-1] = ~(servo_id + n + 2 + instruction + sum(params)) & 0xFF
+        return view
+
+    def sync_write(self, address, length, servo_data):
+        """
+        编码同步写指令
+
+        Args:
+            address: 写入起始地址
+            length: 每个舵机的数据长度
+            servo_data: 形如 [(id, [data...]), (id, [data...])]
+        """
+        n = 2 + len(servo_data) * (length + 1)
+        buf, view = self._buffer(n)
+        buf[2] = 0xFE
+        buf[4] = 0x83
+        buf[5] = address
+        buf[6] = length
+        total = 0xFE + n + 2 + 0x83 + address + length
+        i = 7
+        for sid, data in servo_data:
+            buf[i] = sid
+            buf[i + 1:i + 1 + length] = data
+            total += sid + sum(data)
+            i += length + 1
+        buf[-1] = ~total & 0xFF
+        return view
+
+
+def legacy_packet(servo_id, instruction, params=[]):
+    """原有的列表拼接编码方式，用于对比"""
+    length = len(params) + 2
+    packet = [0xFF, 0xFF, servo_id, length, instruction] + params
+    checksum = (~sum(packet[2:]) & 0xFF)
+    packet.append(checksum)
+    return bytes(packet)
+
+
+if __name__ == "__main__":
+    # 对比原有编码方式与预分配模板的耗时
+    import timeit
+
+    encoder = PacketEncoder()
+    degree, t, speed = 2137, 0, 500
+
+    def legacy_move():
+        params = [0x2A, degree & 0xFF, degree >> 8, t & 0xFF, t >> 8, speed & 0xFF, speed >> 8]
+        return legacy_packet(1, 0x03, params)
+
+    assert bytes(encoder.goal_position(1, degree, t, speed)) == legacy_move()
+    assert bytes(encoder.read_data(1, 0x38, 2)) == legacy_packet(1, 0x02, [0x38, 2])
+    assert bytes(encoder.encode(1, 0x03, [0x2A, 1, 2])) == legacy_packet(1, 0x03, [0x2A, 1, 2])
+    assert bytes(encoder.sync_write(0x2A, 2, [(1, [1, 2]), (2, [3, 4])])) == \
+        legacy_packet(0xFE, 0x83, [0x2A, 2, 1, 1, 2, 2, 3, 4])
+
+    n = 200000
+    cases = [
+        ("写目标位置 原有", legacy_move),
+        ("写目标位置 模板", lambda: encoder.goal_position(1, degree, t, speed)),
+        ("读数据 原有", lambda: legacy_packet(1, 0x02, [0x38, 2])),
+        ("读数据 模板", lambda: encoder.read_data(1, 0x38, 2)),
+        ("通用指令 原有", lambda: legacy_packet(1, 0x03, [0x2A, 1, 2])),
+        ("通用指令 模板", lambda: encoder.encode(1, 0x03, [0x2A, 1, 2])),
+    ]
+    for name, fn in cases:
+        elapsed = timeit.timeit(fn, number=n)
+        print(f"{name}: {elapsed / n * 1e6:.3f} us/次")
@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+
+class StatusPacket(namedtuple('StatusPacket', ['servo_id', 'error', 'params'])):
+    """
+    舵机应答包
+    servo_id: 舵机ID，error: 错误状态字节，params: 数据（bytes，写指令的应答为空）
+    """
+    __slots__ = ()
+
+    def byte(self, offset=0):
+        """读取数据中的单字节"""
+        return self.params[offset]
+
+    def word(self, offset=0):
+        """读取数据中的双字节（低字节在前）"""
+        return self.params[offset] | (self.params[offset + 1] << 8)
+
+    def signed_word(self, offset=0, sign_bit=15):
+        """读取双字节，最高位sign_bit为方向位，返回带符号数值"""
+        value = self.word(offset)
+        if value & (1 << sign_bit):
+            return -(value & ((1 << sign_bit) - 1))
+        return value
+
+
+class PacketParser:
+    """
+    应答包流式解析器
+    每次喂入任意长度的字节，从中寻找 FF FF 包头，校验长度和校验和，
+    遇到丢字节、多余字节或校验错误时丢弃一个字节后重新寻找包头
+    """
+    HEADER = b'\xFF\xFF'
+
+    def __init__(self, max_params=128):
+        """
+        Args:
+            max_params: 应答包允许的最大数据长度，超过时视为长度字节损坏
+        """
+        self.max_length = max_params + 2
+        self.buf = bytearray()
+        self.checksum_errors = 0   # 校验和错误的包数
+        self.length_errors = 0     # 长度字节不合法的包数
+        self.discarded = 0         # 重新同步时丢弃的字节数
+
+    def reset(self):
+        """清空缓冲区中未解析的字节"""
+        self.discarded += len(self.buf)
+        self.buf.clear()
+
+    def feed(self, data):
+        """喂入新收到的字节"""
+        self.buf += data
+
+    def next_packet(self):
+        """
+        解析下一个完整的应答包
+
+        Returns:
+            StatusPacket，缓冲区中没有完整的包时返回None
+        """
+        buf = self.buf
+        while True:
+            start = buf.find(self.HEADER)
+            if start < 0:
+                # 保留末尾可能是半个包头的0xFF
+                keep = 1 if buf[-1:] == b'\xFF' else 0
+                self.discarded += len(buf) - keep
+                del buf[:len(buf) - keep]
+                return None
+            if start:
+                self.discarded += start
+                del buf[:start]
+            if len(buf) < 4:
+                return None
+
+            servo_id, length = buf[2], buf[3]
+            if servo_id == 0xFF:
+                # FF FF FF ...，包头前多了一个0xFF
+                self.discarded += 1
+                del buf[0]
+                continue
+            if length < 2 or length > self.max_length:
+                self.length_errors += 1
+                self.discarded += 1
+                del buf[0]
+                continue
+            end = 4 + length
+            if len(buf) < end:
+                return None
+
+            if (~sum(buf[2:end - 1]) & 0xFF) != buf[end - 1]:
+                self.checksum_errors += 1
+                self.discarded += 1
+                del buf[0]
+                continue
+
+            packet = StatusPacket(servo_id, buf[4], bytes(buf[5:end - 1]))
+            del buf[:end]
+            return packet
+
+    def parse(self, data):
+        """喂入字节并返回其中所有完整的应答包"""
+        self.feed(data)
+        packets = []
+        packet = self.next_packet()
+        while packet is not None:
+            packets.append(packet)
+            packet = self.next_packet()
+        return packets
+
+    def stats(self):
+        """返回解析统计"""
+        return {
+            'checksum_errors': self.checksum_errors,
+            'length_errors': self.length_errors,
+            'discarded': self.discarded,
+        }
+
+
+if __name__ == "__main__":
+    # 在注入丢字节、噪声和拆包的字节流上检查解析器能否重新同步
+    import random
+    import timeit
+
+    def status(servo_id, error, params=b''):
+        body = bytes([servo_id, len(params) + 2, error]) + bytes(params)
+        return b'\xFF\xFF' + body + bytes([~sum(body) & 0xFF])
+
+    random.seed(0)
+    sent = [status(random.randint(1, 3), 0, bytes(random.randrange(256) for _ in range(random.choice((0, 2, 6)))))
+            for _ in range(2000)]
+    stream = bytearray()
+    corrupted = 0
+    for pkt in sent:
+        pkt = bytearray(pkt)
+        r = random.random()
+        if r < 0.05:
+            del pkt[random.randrange(len(pkt))]   # 丢一个字节
+            corrupted += 1
+        elif r < 0.1:
+            stream += bytes(random.randrange(256) for _ in range(3))  # 包间噪声
+        stream += pkt
+
+    parser = PacketParser()
+    received = []
+    i = 0
+    while i < len(stream):
+        n = random.randint(1, 16)  # 随机拆包
+        received += parser.parse(stream[i:i + n])
+        i += n
+    expected = [StatusPacket(p[2], p[4], bytes(p[5:-1])) for p in sent]
+    false_packets = sum(1 for p in received if p not in expected)
+    print(f"发送 {len(sent)} 包, 损坏 {corrupted} 包, 解析得到 {len(received)} 包 (其中错误 {false_packets} 包), "
+          f"{parser.stats()}")
+
+    good = status(1, 0, b'\x10\x08')
+    parser = PacketParser()
+    n = 100000
+    elapsed = timeit.timeit(lambda: parser.parse(good), number=n)
+    print(f"解析单个读数据应答: {elapsed / n * 1e6:.3f} us/包")
@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import sys
 import os
+from binary_log import load_log, read_header, EXTENSION as BINARY_EXTENSION
 
 def plot_data_from_csv(csv_file):
     """Read data from CSV file and plot charts
@@ -15,8 +16,8 @@ def plot_data_from_csv(csv_file):
         return False
     
     try:
-        # Read CSV data
-        df = pd.read_csv(csv_file)
+        # Read CSV or binary log (binary logs are memory-mapped)
+        df = load_log(csv_file)
         
         # Check required columns
         required_columns = ['Time (s)', 'Target Speed', 'Current Position', 'Current Speed']
@@ -70,11 +71,18 @@ def plot_data_from_csv(csv_file):
             ax3.set_title('Degree Change Over Time', fontsize=14)
             ax3.grid(True)
             ax3.legend(loc='best', fontsize=11)
-        
+
+            # Servo feedback on a second axis, compare with Target Degree to see actuator lag
+            if 'Servo Position' in df.columns and df['Servo Position'].notna().any():
+                ax3b = ax3.twinx()
+                ax3b.plot(df['Time (s)'], df['Servo Position'], 'c-', label='Servo Position (feedback)', linewidth=1.5)
+                ax3b.set_ylabel('Servo Position', fontsize=12)
+                ax3b.legend(loc='lower right', fontsize=11)
+
         plt.tight_layout()
         
         # Save the plot
-        plot_filename = csv_file.replace('.csv', '_plot.png')
+        plot_filename = os.path.splitext(csv_file)[0] + '_plot.png'
         plt.savefig(plot_filename, dpi=300)
         print(f"Plot saved as: {plot_filename}")
         
@@ -86,8 +94,60 @@ def plot_data_from_csv(csv_file):
         print(f"Error: {str(e)}")
         return False
 
+def plot_channels(data_file, channels=None):
+    """Plot selected channels of a log file, one subplot per channel
+    
+    Args:
+        data_file: Path to CSV or binary log file
+        channels: List of channel names, None plots every channel except time
+    """
+    if not os.path.exists(data_file):
+        print(f"Error: File {data_file} does not exist")
+        return False
+    
+    try:
+        df = load_log(data_file)
+        # Units and descriptions come from the log header (the .json file next to a CSV log)
+        infos = {c['name']: c for c in read_header(data_file)['columns']}
+        
+        if channels is None:
+            channels = [name for name in df.columns if name != 'Time (s)']
+        missing = [name for name in channels if name not in df.columns]
+        if missing:
+            print(f"Error: Unknown channel(s): {', '.join(missing)}")
+            print("Available channels:")
+            for name in df.columns:
+                info = infos.get(name, {})
+                unit = f" [{info['unit']}]" if info.get('unit') else ''
+                description = f" - {info['description']}" if info.get('description') else ''
+                print(f"  {name}{unit}{description}")
+            return False
+        
+        fig, axes = plt.subplots(len(channels), 1, figsize=(12, 2.5 * len(channels) + 1), sharex=True, squeeze=False)
+        for ax, name in zip(axes[:, 0], channels):
+            info = infos.get(name, {})
+            ax.plot(df['Time (s)'], df[name], linewidth=1.5, label=name)
+            ax.set_ylabel(f"{name} ({info['unit']})" if info.get('unit') else name, fontsize=11)
+            if info.get('description'):
+                ax.set_title(info['description'], fontsize=11)
+            ax.grid(True)
+        axes[-1, 0].set_xlabel('Time (s)', fontsize=12)
+        plt.tight_layout()
+        
+        # Save the plot
+        plot_filename = os.path.splitext(data_file)[0] + '_channels.png'
+        plt.savefig(plot_filename, dpi=150)
+        print(f"Plot saved as: {plot_filename}")
+        
+        plt.show()
+        return True
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return False
+
 def list_data_files():
-    """List all CSV data files in the data directory"""
+    """List all data files (CSV or binary) in the data directory"""
     # Get data directory path
     data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
     
@@ -96,8 +156,8 @@ def list_data_files():
         os.makedirs(data_dir)
         print(f"Created data directory: {data_dir}")
     
-    # Get CSV files from data directory
-    data_files = [f for f in os.listdir(data_dir) if f.startswith('data_log_') and f.endswith('.csv')]
+    # Get CSV and binary log files from data directory
+    data_files = [f for f in os.listdir(data_dir) if f.startswith('data_log_') and f.endswith(('.csv', BINARY_EXTENSION))]
     
     if not data_files:
         print("No data files found")
@@ -117,6 +177,8 @@ def list_data_files():
     return data_files_with_path
 
 if __name__ == "__main__":
+    # Usage: python plot_data.py [file [channel ...]]
+    #   channel names select channels to plot, 'all' plots every channel
     # Get data directory path
     data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
     
@@ -128,7 +190,11 @@ if __name__ == "__main__":
             possible_path = os.path.join(data_dir, file_path)
             if os.path.exists(possible_path):
                 file_path = possible_path
-        plot_data_from_csv(file_path)
+        channels = sys.argv[2:]
+        if channels:
+            plot_channels(file_path, None if channels == ['all'] else channels)
+        else:
+            plot_data_from_csv(file_path)
     else:
         # List all data files
         data_files = list_data_files()
@@ -8,8 +8,15 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
 from PyQt5.QtCore import QTimer, pyqtSignal, QObject, Qt
 from PyQt5.QtGui import QFont
 from driver import ServoDriver
-from pid import PID
+from device_discovery import discover_devices
+from cascade_controller import CascadeController
 from data_logger import DataLogger
+from ball_detector import BallDetector, RED_HSV_RANGES
+from camera_grabber import FrameGrabber
+import clock
+from state_estimator import KalmanFilter
+from servo_commander import ServoCommander
+from servo_feedback import ServoFeedback
 
 # 创建一个信号类用于线程间通信
 class CommunicationSignals(QObject):
@@ -32,21 +39,36 @@ class MainWindow(QMainWindow):
         self.prev_x = None
         self.prev_y = None
         self.prev_time = None
-        self.count = 0
         self.tar_pos = 100  # 默认目标位置
-        self.status = False
-        self.fine_tune_status = False
-        self.precision_mode_count = 0
-        self.precision_mode_locked = False
         
         # 初始化驱动和PID控制器
-        self.driver = ServoDriver()
-        self.degree_pid = PID(Kp=0.22, Ki=0, Kd=0.01, lim=10000)  # 速度-角度PID参数
-        self.pos_pid = PID(Kp=4, Ki=0, Kd=0.6, lim=30)  # 位置-速度PID参数
-        self.fine_tune_pid = PID(Kp=0.05, Ki=0, Kd=0.005, lim=5)  # 微调PID参数
-        
-        # 初始化数据记录器
-        self.data_logger = DataLogger()
+        # 并行查找摄像头和舵机串口，结果按USB id缓存，下次启动只验证缓存的设备
+        self.devices = discover_devices(preferred_camera=2)
+        self.driver = ServoDriver(port=self.devices.serial_port, async_mode=True)  # 异步模式，控制循环不等待串口应答
+        self.commander = ServoCommander(self.driver)  # 合并同一周期内的重复指令
+        self.feedback = ServoFeedback(self.driver, [1]).start()  # 后台轮询舵机当前位置
+        # 位置-速度-角度级联控制和模式切换，PID参数: 位置-速度 (4, 0, 0.6)，速度-角度 (0.22, 0, 0.01)，微调 (0.05, 0, 0.005)
+        self.controller = CascadeController(pos_gains=(4, 0, 0.6, 30), degree_gains=(0.22, 0, 0.01, 10000),
+                                            fine_tune_gains=(0.05, 0, 0.005, 5), target=self.tar_pos, table='qt')
+        
+        # 初始化数据记录器，界面不绘制历史曲线，内存中只保留最近60秒（文件中是完整数据）
+        self.data_logger = DataLogger(file_format='binary', history_seconds=60)
+        # 附加日志通道，用于分析时序和控制过程
+        self.ch_frame = self.data_logger.add_channel('Frame Seq', '<i4', '', '处理的帧序号')
+        self.ch_dt = self.data_logger.add_channel('dt', '<f4', 's', '控制周期')
+        self.ch_detect_time = self.data_logger.add_channel('Detect Time', '<f4', 's', '小球检测耗时')
+        self.ch_control_time = self.data_logger.add_channel('Control Time', '<f4', 's', '检测之后到发送舵机指令的耗时')
+        self.ch_latency = self.data_logger.add_channel('Latency', '<f4', 's', '帧采集到发送舵机指令的时间')
+        self.ch_error = self.data_logger.add_channel('Position Error', '<f4', 'px', '目标位置减当前位置')
+        self.ch_fine_tune = self.data_logger.add_channel('Fine Tune Angle', '<f4', 'step', '精确定位模式的微调目标')
+        self.ch_mode = self.data_logger.add_channel('Mode', '<i1', '', '0 跟踪模式, 1 精准模式, 2 精准模式且已锁定')
+        self.ch_servo_cmd = self.data_logger.add_channel('Servo Command', '<f4', 'step', '本周期实际发送的舵机目标')
+        
+        # 初始化小球检测器（找到小球后只处理ROI）
+        self.detector = BallDetector(RED_HSV_RANGES)
+        
+        # 初始化位置/速度估计器，latency可设为相机加执行的延迟 (s) 以提前预测
+        self.estimator = KalmanFilter('cv', latency=0.0)
         
         # 连接信号到槽函数
         self.signals.update_position.connect(self.update_position_display)
@@ -161,6 +183,7 @@ class MainWindow(QMainWindow):
 
     def set_target(self, value):
         self.tar_pos = value
+        self.controller.target = value
         print(f'目标位置已设置为: {self.tar_pos}')
 
     def increase_target(self):
@@ -183,183 +206,129 @@ class MainWindow(QMainWindow):
         
     def reset_system(self):
         # 重置系统状态
-        self.driver.move_degree(1, 2100, 0, 100)
-        self.status = False
-        self.fine_tune_status = False
-        self.precision_mode_count = 0
-        self.precision_mode_locked = False
-        self.count = 0
+        self.commander.move_now(1, 2100, 0, 100)
+        self.controller.reset()
+        self.data_logger.flush()  # 重置时把已记录的数据写入文件
         
         # 更新UI
         self.update_mode_display('跟踪模式', '未锁定')
         print('系统已重置')
     
     def camera_processing_loop(self):
-        # 尝试打开摄像头
-        for i in range(4):  # 尝试0-3号摄像头
-            cap = cv2.VideoCapture(2)
-            if cap.isOpened():
-                print(f'成功打开摄像头 #{i}')
-                break
+        # 打开启动时找到的摄像头，没有找到时使用默认编号
+        camera_index = self.devices.camera if self.devices.camera is not None else 2
+        cap = cv2.VideoCapture(camera_index)
+        if cap.isOpened():
+            print(f'成功打开摄像头 #{camera_index}')
         
         if not cap.isOpened():
             print('无法打开摄像头')
             return
         
-        self.driver.move_degree(1, 2100, 0, 100)  # 控制ID为1的舵机
+        self.commander.move_now(1, 2100, 0, 100)  # 控制ID为1的舵机
         time.sleep(0.5)
         
+        # 启动后台取帧线程，循环中总是处理最新一帧
+        grabber = FrameGrabber(cap).start()
+        
         while True:
-            ret, frame = cap.read()
+            ret, frame, frame_time, frame_seq = grabber.read()
             if not ret:
                 print('无法获取画面')
                 break
             
-            # 转换到HSV颜色空间
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            
-            # 定义红色的HSV范围
-            lower_red = (0, 120, 70)
-            upper_red = (10, 255, 255)
-            lower_red2 = (170, 120, 70)
-            upper_red2 = (180, 255, 255)
-            
-            # 创建红色掩码
-            mask1 = cv2.inRange(hsv, lower_red, upper_red)
-            mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-            mask = cv2.bitwise_or(mask1, mask2)
+            # 检测小球（跟踪模式下只处理预测位置附近的ROI）
+            detect_start = time.perf_counter()
+            ball = self.detector.detect(frame)
+            detect_end = time.perf_counter()
             
-            # 查找轮廓
-            contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-            
-            if len(contours) > 0:
-                # 找到最大轮廓
-                c = max(contours, key=cv2.contourArea)
+            if ball is not None:
+                ((x, y), radius) = ball
+                
+                scale = 1
+                cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
+                cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
                 
-                # 获取最小外接圆
-                ((x, y), radius) = cv2.minEnclosingCircle(c)
+                # 计算速度
+                current_time = frame_time  # 使用采集时刻计算速度
+                # 用状态估计器滤波位置并估计速度
+                est_x, est_speed = self.estimator.update(x, current_time)
                 
-                if radius > 10:  # 过滤小噪点
-                    scale = 1
-                    cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
-                    cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
+                if self.prev_x is not None and self.prev_y is not None:
+                    # 计算时间差
+                    dt = current_time - self.prev_time
+                    
+                    # 使用估计器输出的速度 (像素/秒)
+                    cur_speed = est_speed
+                    
+                    # 显示速度和坐标
+                    cv2.putText(frame, f'Ball: ({int(x)}, {int(y)})', 
+                              (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                    cv2.putText(frame, f'Speed: {cur_speed:.1f} px/s', 
+                              (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
                     
-                    # 计算速度
-                    current_time = time.time()
+                    cur_pos = est_x - 320
+                    print(f'cur_pos:{cur_pos}')
                     
-                    if self.prev_x is not None and self.prev_y is not None:
-                        # 计算位移
-                        dx = x - self.prev_x
-                        distance = dx
-                        
-                        # 计算时间差
-                        dt = current_time - self.prev_time
-                        
-                        # 计算速度 (像素/秒)
-                        cur_speed = distance / dt if dt > 0 else 0
-                        
-                        # 显示速度和坐标
-                        cv2.putText(frame, f'Ball: ({int(x)}, {int(y)})', 
-                                  (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                        cv2.putText(frame, f'Speed: {cur_speed:.1f} px/s', 
-                                  (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                        
-                        cur_pos = x - 320
-                        print(f'cur_pos:{cur_pos}')
-                        
-                        # 更新UI上的位置和速度显示
-                        self.signals.update_position.emit(cur_pos)
-                        self.signals.update_speed.emit(cur_speed)
-                        
-                        # 位置闭环控制
-                        tar_speed = self.pos_pid.update(self.tar_pos, cur_pos, dt)
-                        print(tar_speed)
-                        
-                        # 角度闭环控制
-                        tar_degree = self.degree_pid.update(tar_speed, cur_speed, dt)
-                        
-                        # 记录数据，包括tar_degree
-                        self.data_logger.log_data(tar_speed, cur_pos, cur_speed, tar_degree)
-                        
-                        # 将控制输出映射到舵机角度
-                        servo_angle = 2100 + int(tar_degree)  # 2048为中心位置
-                        servo_angle = max(2000, min(2200, servo_angle))  # 限制在安全范围内
-                        servo_angle_tiny = 2100 + int(tar_degree/10)
-                        servo_angle_tiny = max(2050, min(2150, servo_angle_tiny))
-                        self.driver.move_degree(1, servo_angle, 0, 500)  # 限制在安全范围内
-                        print(f'servo_angle:{servo_angle}')
-                        
-                        # 计算当前误差
-                        current_error = abs(self.tar_pos - cur_pos)
-                        
-                        # 更新UI上的误差显示
-                        self.signals.update_error.emit(current_error)
-                        
-                        # 检测是否应该退出精准模式
-                        if self.precision_mode_locked and current_error > 15:
-                            print('######### 误差过大，退出锁定精准模式 #########')
-                            self.precision_mode_locked = False
-                            self.precision_mode_count = 0
-                            self.status = False
-                            
-                            # 更新UI上的模式显示
-                            self.signals.update_mode.emit('跟踪模式', '未锁定')
-                        
-                        # 检测是否接近目标位置（速度小，位置接近）
-                        if not self.precision_mode_locked:  # 只有在未锁定精准模式时才检测是否进入精准模式
-                            if((abs(cur_speed) < 50) and current_error < 10):
-                                self.status = True
-                                self.precision_mode_count += 1  # 增加精准模式计数
-                                print(f'进入精准模式第 {self.precision_mode_count} 次')
-                                
-                                # 如果进入精准模式次数达到10次，锁定精准模式
-                                if self.precision_mode_count >= 10:
-                                    self.precision_mode_locked = True
-                                    print('######### 已锁定精准模式 #########')
-                                    
-                                    # 更新UI上的模式显示
-                                    self.signals.update_mode.emit('精准模式', '已锁定')
-                            
-                            if((abs(cur_speed) > 50) or current_error > 10):
-                                self.status = False
-                                # 如果未锁定，则重置计数
-                                if not self.precision_mode_locked:
-                                    self.precision_mode_count = 0
-                                    
-                                    # 更新UI上的模式显示
-                                    self.signals.update_mode.emit('跟踪模式', '未锁定')
-                        
-                        # 显示当前模式和锁定状态
-                        mode_text = '精准模式' if self.status else '跟踪模式'
-                        lock_text = '已锁定' if self.precision_mode_locked else '未锁定'
-                        cv2.putText(frame, f'模式: {mode_text} ({lock_text})', 
-                                  (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                        cv2.putText(frame, f'误差: {current_error:.2f}', 
-                                  (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                        
-                        if(self.status):
-                            print('######### 进入精确定位模式 #########')
-                            # 使用微调PID进行更精确的控制
-                            fine_tune_degree = self.fine_tune_pid.update(self.tar_pos, cur_pos, dt)
-                            fine_tune_angle = 2100 + int(fine_tune_degree)
-                            fine_tune_angle = max(2050, min(2150, fine_tune_angle))  # 限制在更小的范围内
-                            
-                            print(f'微调角度: {fine_tune_angle}, 误差: {self.tar_pos-cur_pos:.2f}')
-                            self.driver.move_degree(1, fine_tune_angle, 0, 200)  # 使用更低的速度控制舵机
-                            self.count += 1
-                            self.fine_tune_status = True
-                            if(self.count > 10 and self.fine_tune_status == True and abs(cur_speed) < 10):
-                                print('######### 精确定位完成 #########')
-                                self.driver.move_degree(1, 2100, 0, 100)  # 使用更低的速度控制舵机
-                                print(f'误差: {self.tar_pos-cur_pos:.2f}')
-                        else:
-                            # 使用常规PID控制
-                            self.driver.move_degree(1, servo_angle, 0, 500)
+                    # 更新UI上的位置和速度显示
+                    self.signals.update_position.emit(cur_pos)
+                    self.signals.update_speed.emit(cur_speed)
                     
-                    # 更新上一帧信息
-                    self.prev_x = x
-                    self.prev_y = y
-                    self.prev_time = current_time
+                    # 级联控制和模式切换（阈值见cascade_controller.PROFILES['qt']）
+                    prev_mode = self.controller.mode
+                    out = self.controller.step((cur_pos, cur_speed), dt)
+                    print(f'tar_speed:{out.tar_speed}, servo_angle:{out.goal}')
+                    
+                    # 记录数据，包括tar_degree
+                    self.data_logger.log_data(out.tar_speed, cur_pos, cur_speed, out.tar_degree, self.feedback.position(1), current_time)
+                    self.data_logger.set(self.ch_frame, frame_seq)
+                    self.data_logger.set(self.ch_dt, dt)
+                    self.data_logger.set(self.ch_detect_time, detect_end - detect_start)
+                    self.data_logger.set(self.ch_error, self.controller.target - cur_pos)
+                    self.data_logger.set(self.ch_mode, out.mode)
+                    
+                    # 计算当前误差
+                    current_error = out.error
+                    
+                    # 显示当前模式和锁定状态
+                    mode_text = '精准模式' if self.controller.status else '跟踪模式'
+                    lock_text = '已锁定' if self.controller.precision_mode_locked else '未锁定'
+                    
+                    # 更新UI上的误差和模式显示
+                    self.signals.update_error.emit(current_error)
+                    if out.mode != prev_mode:
+                        print(f'######### {mode_text} ({lock_text}) #########')
+                        self.signals.update_mode.emit(mode_text, lock_text)
+                    
+                    cv2.putText(frame, f'模式: {mode_text} ({lock_text})', 
+                              (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                    cv2.putText(frame, f'误差: {current_error:.2f}', 
+                              (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                    
+                    if out.fine_tune_angle is not None:
+                        self.data_logger.set(self.ch_fine_tune, out.fine_tune_angle)
+                        print(f'微调角度: {out.fine_tune_angle}, 误差: {self.controller.target-cur_pos:.2f}')
+                    if out.done:
+                        print('######### 精确定位完成 #########')
+                    
+                    self.commander.request(1, out.goal, 0, out.speed)
+                
+                # 发送本帧最后请求的舵机目标
+                sent = self.commander.flush()
+                if self.prev_x is not None:
+                    if 1 in sent:
+                        self.data_logger.set(self.ch_servo_cmd, sent[1][0])
+                    self.data_logger.set(self.ch_control_time, time.perf_counter() - detect_end)
+                    self.data_logger.set(self.ch_latency, clock.now() - current_time)
+                
+                # 更新上一帧信息
+                self.prev_x = x
+                self.prev_y = y
+                self.prev_time = current_time
+        
+            else:
+                # 本帧未检测到小球，估计器继续外推
+                self.estimator.coast(frame_time)
             
             # 创建可调整大小的窗口并显示当前帧
             cv2.namedWindow('Camera Test', cv2.WINDOW_NORMAL)
@@ -369,7 +338,13 @@ class MainWindow(QMainWindow):
             if cv2.waitKey(1) == 27:
                 break
         
-        cap.release()
+        grabber.release()
+        print(f'丢弃的旧帧数: {grabber.dropped}')
+        print(f'舵机指令统计: {self.commander.stats()}')
+        self.feedback.stop()
+        print(f'舵机反馈统计: {self.feedback.stats()}')
+        self.driver.latency.print_stats()
+        self.data_logger.flush()  # 写完队列中的数据
         cv2.destroyAllWindows()
 
 def main():
@@ -1,9 +1,10 @@
 import serial
 import serial.tools.list_ports
 import time
+from device_discovery import discover_devices
 
 def list_serial_ports():
-    """列出所有可用串口"""
+    """列出所有可用串口，返回能ping通舵机的串口（不需要用户输入）"""
     ports = serial.tools.list_ports.comports()
     if not ports:
         print("没有找到可用串口")
@@ -13,21 +14,16 @@ def list_serial_ports():
     for i, port in enumerate(ports):
         print(f"{i+1}. {port.device} - {port.description}")
     
-    while True:
-        try:
-            choice = int(input("请选择要使用的串口编号："))
-            if 1 <= choice <= len(ports):
-                return ports[choice-1].device
-            print("输入错误，请输入有效编号")
-        except ValueError:
-            print("请输入数字")
+    # 并行ping各串口，结果与主程序共用缓存
+    return discover_devices(camera_indices=()).serial_port
 
-def configure_serial():
+def configure_serial(port=None):
     """配置串口参数"""
     # 修改以下参数：
     # port: 串口设备路径，如'/dev/ttyUSB0'
     # baudrate: 波特率，如100000
-    port = '/dev/ttyACM1'  # 修改此处设置串口设备
+    if port is None:
+        port = '/dev/ttyACM1'  # 修改此处设置串口设备
     baudrate = 1000000      # 修改此处设置波特率
     
     return serial.Serial(
@@ -78,6 +74,6 @@ def send_data(ser):
 
 
 if __name__ == "__main__":
-    ser = configure_serial()
+    ser = configure_serial(list_serial_ports())
     if ser:
         send_data(ser)
@@ -0,0 +1,121 @@
+from array import array
+
+import numpy as np
+
+
+class SeriesBuffer:
+    """
+    多列数值序列的内存缓存
+    每列存放在array('d')中（每个值8字节，不是装箱的float对象），按几何级数扩容；
+    指定window时为环形缓存，只保留最近window秒的数据，长时间运行内存占用不变
+    """
+    def __init__(self, names, window=None, time_column=0, capacity=1024):
+        """
+        Args:
+            names: 列名列表
+            window: 环形模式保留的时间长度 (s)，None时保留全部数据
+            time_column: 用于判断时间窗口的列号
+            capacity: 环形模式的初始容量 (行)，容量不足以容纳window秒的数据时翻倍
+        """
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.window = window
+        self.time_column = time_column
+        if window is None:
+            self.columns = [array('d') for _ in self.names]
+            self.capacity = 0
+        else:
+            self.columns = [array('d', bytes(8 * capacity)) for _ in self.names]
+            self.capacity = capacity
+        self.start = 0   # 最旧一行的位置（环形模式）
+        self.count = 0   # 当前保存的行数
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        """追加一行，row的值与names一一对应"""
+        if self.window is None:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+            self.count += 1
+            return
+
+        # 丢弃超出时间窗口的旧数据
+        t = row[self.time_column]
+        times = self.columns[self.time_column]
+        while self.count and t - times[self.start] > self.window:
+            self.start += 1
+            if self.start == self.capacity:
+                self.start = 0
+            self.count -= 1
+        if self.count == self.capacity:
+            self._grow()
+        pos = self.start + self.count
+        if pos >= self.capacity:
+            pos -= self.capacity
+        for column, value in zip(self.columns, row):
+            column[pos] = value
+        self.count += 1
+
+    def _grow(self):
+        """环形缓存已满但数据仍在时间窗口内，容量翻倍"""
+        extra = bytes(8 * max(self.capacity, 1))
+        for i, column in enumerate(self.columns):
+            ordered = column[self.start:] + column[:self.start]
+            ordered.frombytes(extra)
+            self.columns[i] = ordered
+        self.capacity = len(self.columns[0])
+        self.start = 0
+
+    def column(self, name):
+        """按时间顺序返回一列数据的副本 (numpy数组)"""
+        column = self.columns[self.index[name]]
+        data = np.array(column, dtype=np.float64)
+        if self.window is None:
+            return data
+        end = self.start + self.count
+        if end <= self.capacity:
+            return data[self.start:end]
+        return np.concatenate((data[self.start:], data[:end - self.capacity]))
+
+    def clear(self):
+        """清空数据"""
+        if self.window is None:
+            self.columns = [array('d') for _ in self.names]
+        self.start = 0
+        self.count = 0
+
+
+if __name__ == "__main__":
+    # 与Python列表比较追加耗时和内存
+    import time
+    import tracemalloc
+
+    n = 44000  # 一次较长运行的行数
+    names = ['t', 'a', 'b', 'c', 'd', 'e']
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    lists = [[] for _ in names]
+    for i in range(n):
+        for values, v in zip(lists, (i * 0.02, i * 1.5, i * 2.5, i * 3.5, i * 4.5, i * 5.5)):
+            values.append(v)
+    list_time = time.perf_counter() - start
+    list_mem = tracemalloc.get_traced_memory()[0]
+    del lists
+    tracemalloc.stop()
+
+    for window in (None, 60.0):
+        tracemalloc.start()
+        start = time.perf_counter()
+        buffer = SeriesBuffer(names, window=window)
+        for i in range(n):
+            buffer.append((i * 0.02, i * 1.5, i * 2.5, i * 3.5, i * 4.5, i * 5.5))
+        buffer_time = time.perf_counter() - start
+        buffer_mem = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"window={window}: {len(buffer)} 行, "
+              f"{buffer_time / n * 1e6:.2f} us/行, 内存 {buffer_mem / 1e6:.2f} MB")
+        del buffer
+    print(f"列表: {list_time / n * 1e6:.2f} us/行, 内存 {list_mem / 1e6:.2f} MB")
@@ -0,0 +1,132 @@
+import threading
+import time
+
+
+class ServoCommander:
+    """
+    舵机指令合并层
+    每个控制周期内同一舵机只保留最后一次请求的目标，
+    与上次已确认的目标相同时不再发送，并限制每个舵机的最大发送频率
+    """
+    def __init__(self, driver, max_rate=200):
+        """
+        初始化指令合并层
+
+        Args:
+            driver: ServoDriver对象
+            max_rate: 每个舵机的最大发送频率 (次/秒)，为None时不限制
+        """
+        self.driver = driver
+        self.min_interval = 0.0 if not max_rate else 1.0 / max_rate
+        self.lock = threading.RLock()  # 同步模式或应答已到达时回调会在flush()内执行
+        self.goals = {}       # 本周期待发送的目标 {servo_id: (degree, time, speed)}
+        self.acked = {}       # 最后一次被舵机确认的目标
+        self.in_flight = {}   # 已发送、尚未确认的目标
+        self.last_sent = {}   # 最后一次发送时间
+        self.sent = 0         # 实际发送次数
+        self.suppressed = 0   # 与已确认目标相同而未发送的次数
+        self.coalesced = 0    # 同一周期内被后续请求覆盖的次数
+        self.rate_limited = 0  # 因超过最大频率而推迟的次数
+
+    def request(self, servo_id, degree, time, speed):
+        """请求舵机转到目标位置，参数与ServoDriver.move_degree相同，实际发送在flush()中进行"""
+        with self.lock:
+            if servo_id in self.goals:
+                self.coalesced += 1
+            self.goals[servo_id] = (degree, time, speed)
+
+    def flush(self):
+        """
+        控制周期结束时调用，发送各舵机最后请求的目标
+
+        Returns:
+            本次实际发送的目标 {servo_id: (degree, time, speed)}
+        """
+        now = time.perf_counter()
+        sent = {}
+        with self.lock:
+            for servo_id, goal in list(self.goals.items()):
+                if goal == self.acked.get(servo_id) or goal == self.in_flight.get(servo_id):
+                    self.suppressed += 1
+                    del self.goals[servo_id]
+                    continue
+                if now - self.last_sent.get(servo_id, -1e9) < self.min_interval:
+                    # 超过最大频率，留到下一个周期再发
+                    self.rate_limited += 1
+                    continue
+                del self.goals[servo_id]
+                self.in_flight[servo_id] = goal
+                self.last_sent[servo_id] = now
+                self.sent += 1
+                sent[servo_id] = goal
+                result = self.driver.move_degree(servo_id, *goal)
+                if hasattr(result, 'add_done_callback'):
+                    result.add_done_callback(lambda future, sid=servo_id, g=goal: self._on_done(sid, g, future))
+                else:
+                    self._on_reply(servo_id, goal, result)
+        return sent
+
+    def _on_done(self, servo_id, goal, future):
+        """异步模式的Future完成回调，发送失败（Future带异常）按出错处理"""
+        self._on_reply(servo_id, goal, None if future.exception() is not None else future.result())
+
+    def _on_reply(self, servo_id, goal, error):
+        with self.lock:
+            if self.in_flight.get(servo_id) == goal:
+                del self.in_flight[servo_id]
+            if error == 0:
+                self.acked[servo_id] = goal
+            else:
+                # 超时或出错时不确定舵机的目标，下次必须重新发送
+                self.acked.pop(servo_id, None)
+
+    def move_now(self, servo_id, degree, time, speed):
+        """立即请求并发送，用于初始化和复位"""
+        self.request(servo_id, degree, time, speed)
+        self.flush()
+
+    def stats(self):
+        """返回发送统计"""
+        return {
+            'sent': self.sent,
+            'suppressed': self.suppressed,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+        }
+
+
+if __name__ == "__main__":
+    # 在虚拟舵机上检查：串口写入失败一次后，相同的目标仍会重新发送
+    from driver import ServoDriver
+    from virtual_servo import VirtualServoBus
+
+    class FailingSerial:
+        """第一次write抛出异常，其余操作交给真实串口"""
+        def __init__(self, ser):
+            self.ser = ser
+            self.failed = False
+
+        def write(self, data):
+            if not self.failed:
+                self.failed = True
+                raise OSError("模拟串口写入失败")
+            return self.ser.write(data)
+
+        def __getattr__(self, name):
+            return getattr(self.ser, name)
+
+    bus = VirtualServoBus(servo_ids=(1,)).start()
+    driver = ServoDriver(port=bus.port, async_mode=True)
+    driver.ser = FailingSerial(driver.ser)
+    commander = ServoCommander(driver, max_rate=None)
+    results = []
+    for _ in range(4):
+        commander.request(1, 2100, 0, 500)
+        results.append(commander.flush())
+        time.sleep(0.05)
+    print(f"各周期发送: {results}, 统计: {commander.stats()}")
+    assert results[0] == {1: (2100, 0, 500)} and results[1] == {1: (2100, 0, 500)}, "写入失败后没有重新发送"
+    assert results[2] == {} and commander.acked.get(1) == (2100, 0, 500), "重新发送后没有被确认"
+    print("写入失败后重新发送: 通过")
+    driver.close()
+    bus.stop()
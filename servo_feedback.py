@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import namedtuple
+
+import clock
+
+ADDR_PRESENT_POSITION = 0x38  # 当前位置，后面依次是当前速度(0x3A)和当前负载(0x3C)，各2字节
+
+ServoState = namedtuple('ServoState', ['servo_id', 'position', 'speed', 'load', 'timestamp'])
+ServoState.__doc__ = """
+舵机反馈状态
+position: 当前位置，speed: 当前速度 (步/s)，load: 当前负载，未读取的量为None，
+timestamp: 采样时刻 (clock.now())，取发送与应答的中点
+"""
+
+
+class ServoFeedback:
+    """
+    舵机反馈轮询
+    在后台线程中按固定频率读取舵机当前位置（可选速度和负载），
+    读指令经ServoDriver的异步发送队列与目标写指令交替发出，不阻塞控制循环
+    """
+    def __init__(self, driver, servo_ids, rate=100, read_speed=False, read_load=False):
+        """
+        初始化反馈轮询
+
+        Args:
+            driver: 异步模式的ServoDriver对象
+            servo_ids: 需要读取的舵机ID列表，多个舵机时使用同步读
+            rate: 轮询频率 (次/秒)
+            read_speed: 是否同时读取当前速度
+            read_load: 是否同时读取当前负载（需要连同速度一起读取）
+        """
+        if not driver.async_mode:
+            raise ValueError("ServoFeedback需要异步模式的ServoDriver，同步模式下读写会争用串口")
+        self.driver = driver
+        self.servo_ids = list(servo_ids)
+        self.period = 1.0 / rate
+        self.read_speed = read_speed or read_load
+        self.read_load = read_load
+        self.length = 6 if read_load else 4 if read_speed else 2
+
+        self.lock = threading.Lock()
+        self.states = {}        # 每个舵机最新的ServoState
+        self.in_flight = None   # 尚未返回的读请求
+        self.polls = 0          # 发出的读请求数
+        self.skipped = 0        # 上一次读请求未返回而跳过的周期数
+        self.missed = 0         # 没有应答的舵机次数
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """启动轮询线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True  # 设置为守护线程，随主线程退出
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止轮询线程"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while self.running:
+            self.poll()
+            next_time += self.period
+            remaining = next_time - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                next_time = time.perf_counter()
+
+    def poll(self):
+        """发出一次读请求，上一次请求还没有返回时跳过"""
+        if self.in_flight is not None and not self.in_flight.done():
+            self.skipped += 1
+            return
+        sent_time = clock.now()
+        if len(self.servo_ids) == 1:
+            future = self.driver.read_data(self.servo_ids[0], ADDR_PRESENT_POSITION, self.length)
+        else:
+            future = self.driver.sync_read(ADDR_PRESENT_POSITION, self.length, self.servo_ids)
+        self.in_flight = future
+        self.polls += 1
+        # 发送失败（Future带异常）按没有应答计入missed
+        future.add_done_callback(lambda f: self._on_reply(None if f.exception() is not None else f.result(), sent_time))
+
+    def _on_reply(self, result, sent_time):
+        timestamp = (sent_time + clock.now()) / 2
+        packets = result if isinstance(result, list) else [result]
+        with self.lock:
+            for servo_id, packet in zip(self.servo_ids, packets):
+                if packet is None or len(packet.params) < self.length:
+                    self.missed += 1
+                    continue
+                speed = packet.signed_word(2) if self.read_speed else None
+                load = packet.signed_word(4, sign_bit=10) if self.read_load else None
+                self.states[servo_id] = ServoState(servo_id, packet.word(0), speed, load, timestamp)
+
+    def get(self, servo_id):
+        """
+        返回舵机最新的反馈状态
+
+        Returns:
+            ServoState，还没有收到过应答时返回None
+        """
+        with self.lock:
+            return self.states.get(servo_id)
+
+    def position(self, servo_id):
+        """返回舵机最新的当前位置，没有反馈时返回None"""
+        state = self.get(servo_id)
+        return None if state is None else state.position
+
+    def stats(self):
+        """返回轮询统计"""
+        return {
+            'polls': self.polls,
+            'skipped': self.skipped,
+            'missed': self.missed,
+        }
+
+
+if __name__ == "__main__":
+    # 在虚拟舵机上边发目标边读反馈，观察执行滞后
+    from driver import ServoDriver
+    from virtual_servo import VirtualServoBus
+
+    bus = VirtualServoBus(servo_ids=(1,)).start()
+    driver = ServoDriver(port=bus.port, async_mode=True)
+    feedback = ServoFeedback(driver, [1], rate=200, read_speed=True).start()
+
+    start = clock.now()
+    goal = 2048
+    while clock.now() - start < 1.0:
+        goal = 2048 + (200 if int((clock.now() - start) * 4) % 2 else -200)
+        driver.move_degree(1, goal, 0, 1500)
+        state = feedback.get(1)
+        if state is not None:
+            print(f"t={state.timestamp - start:.3f}s 目标 {goal} 当前 {state.position} 速度 {state.speed}")
+        time.sleep(0.02)
+
+    feedback.stop()
+    print(f"反馈统计: {feedback.stats()}")
+    driver.close()
+    bus.stop()
@@ -0,0 +1,303 @@
+import argparse
+import math
+import os
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from cascade_controller import PROFILES, CascadeController
+from state_estimator import KalmanFilter
+
+G = 9810.0  # 重力加速度 (mm/s^2)
+STEP_ANGLE = 2 * math.pi / 4096  # 舵机每步对应的角度 (rad)
+
+SimResult = namedtuple('SimResult', ['time', 'position', 'servo', 'settle_time', 'overshoot', 'final_error'])
+SimResult.__doc__ = """
+一次仿真的结果
+time, position, servo: 每帧采集时刻、小球真实位置 (mm) 和舵机位置 (numpy数组)
+settle_time: 误差进入并保持在容差内的时刻 (s)，没有稳定时为None
+overshoot: 越过目标位置的最大距离 (mm)
+final_error: 结束时的误差绝对值 (mm)
+"""
+
+
+class BallBeam:
+    """
+    小球-轨道模型
+    实心球在倾斜轨道上滚动，加速度 5/7*g*sin(θ)，θ由舵机偏离水平位置的步数经连杆比例换算，
+    另有与速度成正比的滚动阻力；轨道两端为挡板
+    """
+    def __init__(self, beam_ratio=0.55, half_length=150.0, damping=0.3, center=2100, direction=1):
+        """
+        Args:
+            beam_ratio: 轨道倾角与舵机转角之比（连杆比例），默认值按实测日志拟合，约6 px/s^2每步
+            half_length: 轨道有效长度的一半 (mm)
+            damping: 滚动阻力系数 (1/s)
+            center: 轨道水平时的舵机位置
+            direction: 舵机位置增大时小球加速的方向 (1或-1)
+        """
+        self.beam_ratio = beam_ratio
+        self.half_length = half_length
+        self.damping = damping
+        self.center = center
+        self.direction = direction
+        self.reset()
+
+    def reset(self, position=0.0, speed=0.0):
+        self.position = position  # mm，相对轨道中心
+        self.speed = speed        # mm/s
+
+    def step(self, servo_position, dt):
+        """按舵机位置推进dt"""
+        angle = (servo_position - self.center) * STEP_ANGLE * self.beam_ratio * self.direction
+        acc = 5.0 / 7.0 * G * math.sin(angle) - self.damping * self.speed
+        self.speed += acc * dt
+        self.position += self.speed * dt
+        if abs(self.position) > self.half_length:
+            self.position = math.copysign(self.half_length, self.position)
+            self.speed = 0.0
+
+
+class SimServo:
+    """
+    舵机模型
+    以指令中的运行速度（不超过max_speed）向目标位置运动，并叠加一阶滞后
+    """
+    def __init__(self, position=2100, max_speed=3400, tau=0.03):
+        """
+        Args:
+            position: 初始位置
+            max_speed: 最大速度 (步/s)，指令速度为0时使用
+            tau: 一阶滞后时间常数 (s)
+        """
+        self.position = float(position)
+        self.goal = float(position)
+        self.max_speed = max_speed
+        self.speed_limit = max_speed
+        self.tau = tau
+
+    def command(self, goal, speed):
+        """下发目标位置和运行速度，与ServoDriver.move_degree的参数相同"""
+        self.goal = float(goal)
+        self.speed_limit = min(speed, self.max_speed) if speed else self.max_speed
+
+    def step(self, dt):
+        error = self.goal - self.position
+        speed = error / self.tau if self.tau > 0 else error / dt
+        limit = self.speed_limit
+        if speed > limit:
+            speed = limit
+        elif speed < -limit:
+            speed = -limit
+        move = speed * dt
+        self.position = self.goal if abs(move) >= abs(error) else self.position + move
+
+
+class SimCamera:
+    """
+    相机模型
+    按固定帧率采集小球位置，输出带高斯噪声的像素坐标，latency后才能被控制循环取到
+    """
+    def __init__(self, fps=30.0, latency=0.05, noise=1.0, px_per_mm=1.0, center_px=320, seed=None):
+        """
+        Args:
+            fps: 帧率
+            latency: 采集到控制循环取到帧的延迟，包括传输和检测 (s)
+            noise: 像素噪声标准差 (px)
+            px_per_mm: 像素与毫米的比例
+            center_px: 轨道中心的像素坐标
+            seed: 随机数种子
+        """
+        self.period = 1.0 / fps
+        self.latency = latency
+        self.noise = noise
+        self.px_per_mm = px_per_mm
+        self.center_px = center_px
+        self.rng = np.random.default_rng(seed)
+
+    def measure(self, position):
+        """返回小球位置 (mm) 对应的带噪声像素坐标"""
+        return self.center_px + position * self.px_per_mm + self.rng.normal(0.0, self.noise)
+
+
+def model_plant(model, center=2100, command_latency=0.005):
+    """
+    由system_id辨识的模型构造仿真对象（像素按1 px/mm当作毫米）
+
+    Args:
+        model: system_id.PlantModel
+        center: 控制器使用的舵机中心位置
+        command_latency: 仿真中舵机指令的延迟 (s)，从辨识的纯滞后中扣除
+
+    Returns:
+        (BallBeam, 相机延迟 (s))
+    """
+    beam = BallBeam(beam_ratio=abs(model.gain) / (5.0 / 7.0 * G * STEP_ANGLE),
+                    damping=max(0.0, model.damping),  # 辨识出的负阻尼是噪声，仿真中不使用
+                    center=center - model.bias / model.gain,
+                    direction=1 if model.gain > 0 else -1)
+    latency = max(0.0, model.delay_frames * model.frame_period - command_latency)
+    return beam, latency
+
+
+def add_sim_channels(logger):
+    """
+    在DataLogger上注册仿真记录的附加通道
+
+    Returns:
+        {名称: 通道号}
+    """
+    return {
+        'frame': logger.add_channel('Frame Seq', '<i4', '', '处理的帧序号'),
+        'dt': logger.add_channel('dt', '<f4', 's', '控制周期'),
+        'latency': logger.add_channel('Latency', '<f4', 's', '帧采集到发送舵机指令的时间'),
+        'error': logger.add_channel('Position Error', '<f4', 'px', '目标位置减当前位置'),
+        'fine_tune': logger.add_channel('Fine Tune Angle', '<f4', 'step', '精确定位模式的微调目标'),
+        'mode': logger.add_channel('Mode', '<i1', '', '0 跟踪模式, 1 精准模式, 2 精准模式且已锁定'),
+        'command': logger.add_channel('Servo Command', '<f4', 'step', '本周期实际发送的舵机目标'),
+        'true_position': logger.add_channel('True Position', '<f4', 'px', '仿真中小球的真实位置'),
+    }
+
+
+def simulate(controller=None, duration=10.0, target=0.0, initial_position=-120.0, plant=None, servo=None,
+             camera=None, estimator=None, command_latency=0.005, physics_dt=0.001, tolerance=3.0,
+             logger=None, seed=None):
+    """
+    闭环仿真：相机采样 -> 估计器 -> 级联控制 -> 舵机 -> 小球，按仿真时间运行，不等待真实时间
+
+    Args:
+        controller: CascadeController，None时使用默认参数
+        duration: 仿真时长 (s)
+        target: 目标位置 (mm，相对轨道中心)
+        initial_position: 小球初始位置 (mm)
+        plant, servo, camera: BallBeam、SimServo、SimCamera，None时使用默认参数
+        estimator: 位置/速度估计器，None时与main.py相同使用KalmanFilter('cv')
+        command_latency: 舵机指令从发送到生效的延迟 (s)
+        physics_dt: 物理仿真步长 (s)
+        tolerance: 判断稳定的误差容差 (mm)
+        logger: DataLogger，不为None时按实机相同的格式记录每个控制周期
+        seed: 相机噪声的随机数种子，camera为None时使用
+
+    Returns:
+        SimResult
+    """
+    controller = controller or CascadeController()
+    plant = plant or BallBeam()
+    servo = servo or SimServo(position=plant.center)
+    camera = camera or SimCamera(seed=seed)
+    estimator = estimator or KalmanFilter('cv', latency=0.0)
+    controller.target = target * camera.px_per_mm
+    plant.reset(initial_position)
+    channels = add_sim_channels(logger) if logger is not None else None
+    if logger is not None and logger.start_time is None:
+        logger.start(0.0)  # 日志时间即仿真时间
+
+    frames = deque()    # (取到时刻, 采集时刻, 像素坐标, 帧序号)
+    commands = deque()  # (生效时刻, 目标位置, 运行速度)
+    times, positions, servos = [], [], []
+    prev_time = None
+    next_frame = 0.0
+    seq = 0
+    t = 0.0
+    steps = int(round(duration / physics_dt))
+    for i in range(steps):
+        t = i * physics_dt
+        if t >= next_frame:
+            seq += 1
+            frames.append((t + camera.latency, t, camera.measure(plant.position), seq))
+            times.append(t)
+            positions.append(plant.position)
+            servos.append(servo.position)
+            next_frame += camera.period
+
+        while frames and frames[0][0] <= t:
+            _, capture_time, x, frame_seq = frames.popleft()
+            est_x, cur_speed = estimator.update(x, capture_time)
+            if prev_time is not None:
+                dt = capture_time - prev_time
+                cur_pos = est_x - camera.center_px
+                out = controller.step((cur_pos, cur_speed), dt)
+                commands.append((t + command_latency, out.goal, out.speed))
+                if logger is not None:
+                    logger.log_data(out.tar_speed, cur_pos, cur_speed, out.tar_degree, servo.position, capture_time)
+                    logger.set(channels['frame'], frame_seq)
+                    logger.set(channels['dt'], dt)
+                    logger.set(channels['latency'], t - capture_time)
+                    logger.set(channels['error'], controller.target - cur_pos)
+                    logger.set(channels['mode'], controller.mode)
+                    if out.fine_tune_angle is not None:
+                        logger.set(channels['fine_tune'], out.fine_tune_angle)
+                    logger.set(channels['command'], out.goal)
+                    logger.set(channels['true_position'], plant.position * camera.px_per_mm)
+            prev_time = capture_time
+
+        while commands and commands[0][0] <= t:
+            _, goal, speed = commands.popleft()
+            servo.command(goal, speed)
+
+        servo.step(physics_dt)
+        plant.step(servo.position, physics_dt)
+
+    times = np.array(times)
+    positions = np.array(positions)
+    errors = np.abs(positions - target)
+    outside = np.nonzero(errors > tolerance)[0]
+    if len(outside) == 0:
+        settle_time = 0.0
+    elif outside[-1] + 1 < len(times):
+        settle_time = float(times[outside[-1] + 1])
+    else:
+        settle_time = None
+    # 越过目标的距离，按初始位置所在的一侧计算
+    side = 1.0 if initial_position <= target else -1.0
+    overshoot = max(0.0, float(np.max((positions - target) * side))) if len(positions) else 0.0
+    final_error = float(errors[-1]) if len(errors) else float('nan')
+    return SimResult(times, positions, np.array(servos), settle_time, overshoot, final_error)
+
+
+if __name__ == "__main__":
+    # 用法: python simulator.py [--duration 10] [--target 0] [--initial -120] [--runs 1] [--model data/plant_model.json] [--no-log]
+    # 用main.py（或--table指定的程序）的控制参数运行仿真，结果以DataLogger格式保存在data目录，可用plot_data.py绘制
+    from data_logger import DataLogger
+
+    parser = argparse.ArgumentParser(description='小球-轨道闭环仿真')
+    parser.add_argument('--duration', type=float, default=10.0, help='仿真时长 (s)')
+    parser.add_argument('--target', type=float, default=0.0, help='目标位置 (mm)')
+    parser.add_argument('--initial', type=float, default=-120.0, help='小球初始位置 (mm)')
+    parser.add_argument('--runs', type=int, default=1, help='使用不同噪声种子运行的次数')
+    parser.add_argument('--fps', type=float, default=30.0, help='相机帧率')
+    parser.add_argument('--latency', type=float, default=0.05, help='相机延迟 (s)')
+    parser.add_argument('--noise', type=float, default=1.0, help='像素噪声标准差 (px)')
+    parser.add_argument('--table', default='main', choices=sorted(PROFILES), help='模式切换阈值表')
+    parser.add_argument('--model', default=None, help='system_id.py保存的模型文件，使用辨识的轨道参数和纯滞后')
+    parser.add_argument('--no-log', action='store_true', help='不保存日志')
+    args = parser.parse_args()
+
+    latency = args.latency
+    plant_model = None
+    if args.model:
+        from system_id import load_model
+        plant_model = load_model(args.model)
+        plant, latency = model_plant(plant_model)
+        print(f"模型: beam_ratio {plant.beam_ratio:.3f}, 水平位置 {plant.center:.1f}, 相机延迟 {latency * 1000:.0f} ms")
+
+    for run in range(args.runs):
+        logger = None
+        if not args.no_log:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            logger = DataLogger(filename=f"data_log_{timestamp}_sim{run}.blog", file_format='binary')
+        camera = SimCamera(fps=args.fps, latency=latency, noise=args.noise, seed=run)
+        start = time.perf_counter()
+        plant = model_plant(plant_model)[0] if plant_model else None
+        result = simulate(CascadeController(table=args.table), duration=args.duration, target=args.target, initial_position=args.initial,
+                          plant=plant, camera=camera, logger=logger)
+        elapsed = time.perf_counter() - start
+        settle = f"{result.settle_time:.2f} s" if result.settle_time is not None else "未稳定"
+        print(f"第 {run + 1} 次: 稳定时间 {settle}, 超调 {result.overshoot:.1f} mm, "
+              f"最终误差 {result.final_error:.2f} mm; 耗时 {elapsed * 1000:.0f} ms "
+              f"(实时的 {args.duration / elapsed:.0f} 倍)")
+        if logger is not None:
+            logger.close()
+            print(f"日志: {os.path.basename(logger.filename)}")
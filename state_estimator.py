@@ -0,0 +1,218 @@
+import numpy as np
+
+
+class AlphaBetaFilter:
+    """
+    alpha-beta滤波器
+    最简单的常速度模型估计器，用于平滑位置并估计速度
+    """
+    def __init__(self, alpha=0.7, beta=0.3, latency=0.0, max_coast=0.5):
+        """
+        初始化alpha-beta滤波器
+
+        Args:
+            alpha: 位置修正系数 (0-1)
+            beta: 速度修正系数 (0-2)
+            latency: 输出时向前预测的时间 (s)，用于补偿相机和执行延迟
+            max_coast: 丢失检测后最长外推时间 (s)，超过后重新初始化
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.latency = latency
+        self.max_coast = max_coast
+        self.reset()
+
+    def reset(self):
+        """重置滤波器状态"""
+        self.pos = None
+        self.speed = 0.0
+        self.time = None       # 最后一次状态对应的时间
+        self.last_update = None  # 最后一次有测量值的时间
+
+    def update(self, measured_pos, t):
+        """
+        输入一次位置测量
+
+        Args:
+            measured_pos: 测量位置
+            t: 测量时间 (s)
+
+        Returns:
+            (pos, speed)，已向前预测latency
+        """
+        if self.pos is None or t - self.last_update > self.max_coast:
+            self.reset()
+            self.pos = measured_pos
+        else:
+            dt = t - self.time
+            if dt > 0:
+                pred = self.pos + self.speed * dt
+                residual = measured_pos - pred
+                self.pos = pred + self.alpha * residual
+                self.speed = self.speed + self.beta / dt * residual
+        self.time = t
+        self.last_update = t
+        return self.output()
+
+    def coast(self, t):
+        """
+        没有测量值时外推到时间t
+
+        Returns:
+            (pos, speed)，丢失时间过长或未初始化时返回None
+        """
+        if self.pos is None or t - self.last_update > self.max_coast:
+            return None
+        dt = t - self.time
+        if dt > 0:
+            self.pos += self.speed * dt
+            self.time = t
+        return self.output()
+
+    def output(self):
+        """返回向前预测latency后的 (pos, speed)"""
+        return self.pos + self.speed * self.latency, self.speed
+
+
+class KalmanFilter:
+    """
+    位置/速度卡尔曼滤波器
+    支持常速度模型('cv'，状态[p, v])和常加速度模型('ca'，状态[p, v, a])
+    """
+    # 各模型默认的过程噪声谱密度
+    DEFAULT_PROCESS_NOISE = {'cv': 2e4, 'ca': 2e5}
+
+    def __init__(self, model='cv', process_noise=None, measurement_noise=1.0, latency=0.0, max_coast=0.5):
+        """
+        初始化卡尔曼滤波器
+
+        Args:
+            model: 'cv' 常速度模型，或 'ca' 常加速度模型
+            process_noise: 过程噪声谱密度，cv模型为加速度 (px^2/s^3)，ca模型为加加速度 (px^2/s^5)，
+                None时使用模型的默认值
+            measurement_noise: 位置测量噪声方差 (px^2)
+            latency: 输出时向前预测的时间 (s)，用于补偿相机和执行延迟
+            max_coast: 丢失检测后最长外推时间 (s)，超过后重新初始化
+        """
+        if model not in ('cv', 'ca'):
+            raise ValueError(f"未知的模型: {model}")
+        self.model = model
+        self.n = 2 if model == 'cv' else 3
+        self.q = self.DEFAULT_PROCESS_NOISE[model] if process_noise is None else process_noise
+        self.r = measurement_noise
+        self.latency = latency
+        self.max_coast = max_coast
+        self.reset()
+
+    def reset(self):
+        """重置滤波器状态"""
+        self.x = None
+        self.P = None
+        self.time = None
+        self.last_update = None
+
+    @property
+    def pos(self):
+        return None if self.x is None else self.x[0]
+
+    @property
+    def speed(self):
+        return 0.0 if self.x is None else self.x[1]
+
+    @property
+    def acc(self):
+        return 0.0 if self.x is None or self.n == 2 else self.x[2]
+
+    def transition(self, dt):
+        """状态转移矩阵F和过程噪声Q"""
+        if self.n == 2:
+            F = np.array([[1.0, dt],
+                          [0.0, 1.0]])
+            Q = self.q * np.array([[dt**3 / 3, dt**2 / 2],
+                                   [dt**2 / 2, dt]])
+        else:
+            F = np.array([[1.0, dt, dt**2 / 2],
+                          [0.0, 1.0, dt],
+                          [0.0, 0.0, 1.0]])
+            Q = self.q * np.array([[dt**5 / 20, dt**4 / 8, dt**3 / 6],
+                                   [dt**4 / 8, dt**3 / 3, dt**2 / 2],
+                                   [dt**3 / 6, dt**2 / 2, dt]])
+        return F, Q
+
+    def predict(self, t):
+        """把状态预测到时间t"""
+        dt = t - self.time
+        if dt > 0:
+            F, Q = self.transition(dt)
+            self.x = F @ self.x
+            self.P = F @ self.P @ F.T + Q
+            self.time = t
+
+    def update(self, measured_pos, t):
+        """
+        输入一次位置测量
+
+        Args:
+            measured_pos: 测量位置
+            t: 测量时间 (s)
+
+        Returns:
+            (pos, speed)，已向前预测latency
+        """
+        if self.x is None or t - self.last_update > self.max_coast:
+            # 初始化：位置取测量值，速度和加速度未知
+            self.x = np.zeros(self.n)
+            self.x[0] = measured_pos
+            self.P = np.diag([self.r] + [1e6] * (self.n - 1))
+            self.time = t
+        else:
+            self.predict(t)
+            # H = [1, 0, (0)]，直接写成分量形式
+            S = self.P[0, 0] + self.r
+            K = self.P[:, 0] / S
+            self.x = self.x + K * (measured_pos - self.x[0])
+            self.P = self.P - np.outer(K, self.P[0, :])
+        self.last_update = t
+        return self.output()
+
+    def coast(self, t):
+        """
+        没有测量值时外推到时间t
+
+        Returns:
+            (pos, speed)，丢失时间过长或未初始化时返回None
+        """
+        if self.x is None or t - self.last_update > self.max_coast:
+            return None
+        self.predict(t)
+        return self.output()
+
+    def output(self):
+        """返回向前预测latency后的 (pos, speed)"""
+        L = self.latency
+        pos = self.x[0] + self.x[1] * L + self.acc * L**2 / 2
+        speed = self.x[1] + self.acc * L
+        return float(pos), float(speed)
+
+
+if __name__ == "__main__":
+    # 用模拟轨迹比较原始差分速度与各估计器的误差
+    rng = np.random.default_rng(0)
+    fps = 30
+    t = np.arange(0, 10, 1 / fps) + rng.normal(0, 0.003, int(10 * fps))  # 帧间隔抖动
+    t.sort()
+    true_acc = 800 * np.sin(2 * np.pi * 0.3 * t)
+    true_speed = np.cumsum(np.r_[0, np.diff(t)] * true_acc)
+    true_pos = np.cumsum(np.r_[0, np.diff(t)] * true_speed)
+    measured = true_pos + rng.normal(0, 1.0, len(t))
+
+    raw_speed = np.r_[0, np.diff(measured) / np.diff(t)]
+    print(f"原始差分速度 RMS误差: {np.sqrt(np.mean((raw_speed - true_speed)[10:] ** 2)):.1f} px/s")
+
+    for name, est in (("alpha-beta", AlphaBetaFilter()),
+                      ("卡尔曼 cv", KalmanFilter('cv')),
+                      ("卡尔曼 ca", KalmanFilter('ca'))):
+        out = np.array([est.update(m, ti) for m, ti in zip(measured, t)])
+        pos_err = np.sqrt(np.mean((out[10:, 0] - true_pos[10:]) ** 2))
+        speed_err = np.sqrt(np.mean((out[10:, 1] - true_speed[10:]) ** 2))
+        print(f"{name}: 位置 RMS误差 {pos_err:.2f} px, 速度 RMS误差 {speed_err:.1f} px/s")
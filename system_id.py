@@ -0,0 +1,262 @@
+import argparse
+import glob
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from binary_log import read_log_columns
+from cascade_controller import PROFILES, TRACKING, CascadeController
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+MODEL_FILE = os.path.join(DATA_DIR, 'plant_model.json')
+
+PlantModel = namedtuple('PlantModel', ['gain', 'damping', 'bias', 'delay_frames', 'frame_period', 'r2'])
+PlantModel.__doc__ = """
+小球-轨道的离散模型: a[k] = gain * u[k - delay_frames] - damping * v[k] + bias
+a: 小球加速度 (px/s^2)，v: 速度 (px/s)，u: 舵机指令相对中心位置的步数
+gain: 每步舵机指令对应的加速度 (px/s^2)
+damping: 速度阻尼 (1/s)
+bias: 舵机在中心位置时的加速度 (px/s^2)，即轨道不水平带来的偏置
+delay_frames: 纯滞后的帧数，包括相机、检测、通信和舵机响应
+frame_period: 帧间隔 (s)
+r2: 拟合优度
+"""
+
+
+def load_model(path=MODEL_FILE):
+    """读取fit保存的模型文件，返回PlantModel"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return PlantModel(*(data[name] for name in PlantModel._fields))
+
+
+def _acceleration_kernel(half):
+    """
+    以2*half+1个点的二次多项式局部拟合求二阶导数的卷积核（Savitzky-Golay），对称窗口，不引入相位滞后
+    """
+    k = np.arange(-half, half + 1, dtype=np.float64)
+    A = np.column_stack((np.ones_like(k), k, k * k))
+    return 2.0 * np.linalg.pinv(A)[2]
+
+
+def _command(data, center, legacy_table=None):
+    """
+    舵机指令 (相对中心的步数)
+    有Servo Command列时使用实际发送的指令，没有发送的周期沿用上一次的指令。
+    旧日志只有Target Degree，legacy_table不为None时按该程序的阈值表回放CascadeController（目标位置为0）
+    重建指令：跟踪模式为 中心+int(Target Degree) 按阈值表限幅，精准模式和完成后为回放得到的微调指令；
+    回放使用默认的微调PID参数，与实际运行的参数不同时精准模式的指令只是近似
+
+    Returns:
+        (指令数组, 是否为回放重建的指令)，不能得到指令时指令数组为None
+    """
+    if 'Servo Command' in data:
+        command = np.asarray(data['Servo Command'], dtype=np.float64)
+        valid = ~np.isnan(command)
+        if valid.any():
+            last = np.maximum.accumulate(np.where(valid, np.arange(len(command)), 0))
+            command = command[last]
+            command[:np.argmax(valid)] = center
+            return command - center, False
+    if legacy_table is None or 'Target Degree' not in data:
+        return None, False
+    controller = CascadeController(table=legacy_table)
+    table = controller.table
+    t = np.asarray(data['Time (s)'], dtype=np.float64)
+    x = np.nan_to_num(np.asarray(data['Current Position'], dtype=np.float64))
+    v = np.nan_to_num(np.asarray(data['Current Speed'], dtype=np.float64))
+    degree = np.trunc(np.nan_to_num(np.asarray(data['Target Degree'], dtype=np.float64)))
+    # 跟踪模式的指令
+    command = np.clip(table.center + degree, table.center - table.track_limit, table.center + table.track_limit)
+    command[0] = table.center
+    for i in range(1, len(t)):
+        out = controller.step((x[i], v[i]), t[i] - t[i - 1])
+        if out.mode != TRACKING:
+            command[i] = out.goal
+    return command - center, True
+
+
+def _run_statistics(path, max_delay, half, center, min_samples, legacy_table=None):
+    """
+    计算一次运行在各个滞后帧数下的最小二乘统计量（进程池中运行）
+
+    Returns:
+        {'run', 'samples', 'frame_period', 'XtX' (max_delay+1, 3, 3), 'Xty' (max_delay+1, 3), 'yty', 'ysum'}，
+        不能拟合时为 {'run', 'skipped': 原因}
+    """
+    run = os.path.basename(path)
+    try:
+        data = read_log_columns(path)
+    except (OSError, ValueError) as e:
+        return {'run': run, 'skipped': f"读取失败: {e}"}
+    if 'Current Position' not in data:
+        return {'run': run, 'skipped': '缺少位置列'}
+    t = np.asarray(data['Time (s)'], dtype=np.float64)
+    x = np.asarray(data['Current Position'], dtype=np.float64)
+    n = len(x) - 2 * half - max_delay
+    if n < min_samples:
+        return {'run': run, 'skipped': f"数据太少 ({len(x)} 行)"}
+    u, legacy = _command(data, center, legacy_table)
+    if u is None:
+        if 'Target Degree' in data:
+            return {'run': run, 'skipped': '没有Servo Command列（旧日志需要 --legacy 回放重建指令）'}
+        return {'run': run, 'skipped': '缺少舵机指令列'}
+    # 按中位帧间隔当作等间隔采样
+    frame_period = float(np.median(np.diff(t)))
+    acc = np.convolve(x, _acceleration_kernel(half)[::-1], mode='valid') / frame_period ** 2
+    speed = np.gradient(x, frame_period)[half:len(x) - half]
+    u = u[half:len(x) - half]
+    # 所有滞后帧数使用同一组样本，R²可以相互比较
+    y = acc[max_delay:]
+    v = speed[max_delay:]
+    valid = ~(np.isnan(y) | np.isnan(v))
+    # 第d行为滞后d帧的指令 u[k - d]
+    lagged = u[np.arange(max_delay, len(u))[None, :] - np.arange(max_delay + 1)[:, None]]
+    X = np.stack((lagged, np.broadcast_to(-v, lagged.shape), np.ones(lagged.shape)), axis=-1)
+    X = X[:, valid]
+    y = y[valid]
+    if len(y) < min_samples:
+        return {'run': run, 'skipped': f"有效数据太少 ({len(y)} 行)"}
+    if np.ptp(X[0, :, 0]) == 0 or np.ptp(X[0, :, 1]) == 0:
+        return {'run': run, 'skipped': '舵机指令或小球速度没有变化'}
+    return {'run': run, 'samples': len(y), 'frame_period': frame_period, 'legacy': legacy,
+            'XtX': np.einsum('dni,dnj->dij', X, X), 'Xty': np.einsum('dni,n->di', X, y),
+            'yty': float(y @ y), 'ysum': float(y.sum())}
+
+
+def _solve(XtX, Xty, yty, ysum, samples):
+    """
+    由正规方程统计量对所有滞后帧数同时求解
+
+    Returns:
+        (系数 (max_delay+1, 3), R² (max_delay+1,))
+
+    Raises:
+        numpy.linalg.LinAlgError: 某个滞后帧数的正规方程奇异（数据不足以确定参数）
+    """
+    coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    sse = yty - 2 * np.einsum('di,di->d', coef, Xty) + np.einsum('di,dij,dj->d', coef, XtX, coef)
+    sst = yty - ysum * ysum / samples
+    return coef, 1.0 - sse / sst
+
+
+def fit(paths, max_delay=12, half=4, center=2100, min_samples=200, min_r2=0.2, workers=None, legacy_table=None):
+    """
+    从日志拟合模型，各文件在进程池中并行计算
+
+    Args:
+        paths: 日志文件列表（CSV或.blog）
+        max_delay: 搜索的最大滞后帧数
+        half: 求加速度的平滑窗口半宽 (帧)
+        center: 轨道水平时的舵机位置，用于把Servo Command换算为相对中心的步数
+        min_samples: 参与拟合的最少样本数
+        min_r2: 单次运行的R²不低于此值才参与合并拟合，排除检测丢失、小球被手拿开等数据
+        workers: 进程数，None时使用全部CPU
+        legacy_table: 没有Servo Command列的旧日志按此阈值表 (PROFILES中的名称) 回放重建指令，None时跳过旧日志
+
+    Returns:
+        (合并所有运行拟合的PlantModel，每次运行的结果列表)
+    """
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        stats = list(pool.map(_run_statistics, paths, [max_delay] * len(paths), [half] * len(paths),
+                              [center] * len(paths), [min_samples] * len(paths), [legacy_table] * len(paths),
+                              chunksize=8))
+
+    runs = []
+    used = []
+    for s in stats:
+        if 'skipped' in s:
+            runs.append(s)
+            continue
+        try:
+            coef, r2 = _solve(s['XtX'], s['Xty'], s['yty'], s['ysum'], s['samples'])
+        except np.linalg.LinAlgError:
+            runs.append({'run': s['run'], 'skipped': '正规方程奇异'})
+            continue
+        d = int(np.argmax(r2))
+        runs.append({'run': s['run'], 'samples': s['samples'], 'frame_period': s['frame_period'], 'legacy': s['legacy'],
+                     'delay_frames': d, 'gain': float(coef[d, 0]), 'damping': float(coef[d, 1]), 'bias': float(coef[d, 2]),
+                     'r2': float(r2[d])})
+        if r2[d] >= min_r2:
+            used.append(s)
+    if not used:
+        raise ValueError("没有可用于拟合的日志")
+
+    # 合并所有运行的正规方程，得到一个共同的模型（各运行的正规方程都非奇异，合并后也非奇异）
+    samples = sum(s['samples'] for s in used)
+    coef, r2 = _solve(sum(s['XtX'] for s in used), sum(s['Xty'] for s in used),
+                      sum(s['yty'] for s in used), sum(s['ysum'] for s in used), samples)
+    d = int(np.argmax(r2))
+    frame_period = float(np.median([s['frame_period'] for s in used]))
+    model = PlantModel(float(coef[d, 0]), float(coef[d, 1]), float(coef[d, 2]), d, frame_period, float(r2[d]))
+    return model, runs
+
+
+def save_model(model, runs, path=MODEL_FILE, **attrs):
+    """保存模型文件，attrs为附加的拟合参数"""
+    data = dict(model._asdict())
+    data['dead_time'] = model.delay_frames * model.frame_period
+    used = [r for r in runs if 'skipped' not in r and r['r2'] >= attrs.get('min_r2', 0.0)]
+    data['runs'] = len(used)
+    data['samples'] = sum(r['samples'] for r in used)
+    data.update(attrs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+if __name__ == "__main__":
+    # 用法: python system_id.py [文件...] [--max-delay 12] [--window 4] [--legacy main | --no-legacy]
+    #                           [--out data/plant_model.json]
+    # 不带文件时使用data目录中的全部日志；输出每次运行的拟合结果，合并拟合的模型保存为JSON，
+    # simulator.py --model 可以用它设置仿真模型。
+    # 没有Servo Command列的旧日志默认按main.py的阈值表回放重建指令（近似），--no-legacy 时只用带该列的日志
+    parser = argparse.ArgumentParser(description='从日志辨识舵机指令到小球加速度的模型')
+    parser.add_argument('files', nargs='*', help='日志文件，默认data目录中的全部 .csv/.blog')
+    parser.add_argument('--max-delay', type=int, default=12, help='搜索的最大滞后帧数')
+    parser.add_argument('--window', type=int, default=4, help='求加速度的平滑窗口半宽 (帧)')
+    parser.add_argument('--min-r2', type=float, default=0.2, help='参与合并拟合的单次运行最低R²')
+    parser.add_argument('--center', type=int, default=2100, help='轨道水平时的舵机位置')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认使用全部CPU')
+    parser.add_argument('--legacy', default='main', choices=sorted(PROFILES),
+                        help='没有Servo Command列的旧日志按该程序的阈值表回放重建指令')
+    parser.add_argument('--no-legacy', action='store_true', help='跳过没有Servo Command列的旧日志')
+    parser.add_argument('--out', default=MODEL_FILE, help='模型文件路径')
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(DATA_DIR, 'data_log_*.csv')) +
+                                 glob.glob(os.path.join(DATA_DIR, 'data_log_*.blog')))
+    legacy_table = None if args.no_legacy else args.legacy
+    start = time.perf_counter()
+    try:
+        model, runs = fit(paths, args.max_delay, args.window, args.center, min_r2=args.min_r2, workers=args.workers,
+                          legacy_table=legacy_table)
+    except ValueError as e:
+        hint = "去掉 --no-legacy 可回放重建旧日志的指令" if args.no_legacy else "检查data目录中的日志"
+        print(f"{e}：{hint}")
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'运行':<32} {'样本':>6} {'滞后(帧)':>8} {'增益':>8} {'阻尼':>8} {'偏置':>9} {'R²':>6}")
+    for r in runs:
+        if 'skipped' in r:
+            print(f"{r['run']:<32} 跳过: {r['skipped']}")
+        else:
+            print(f"{r['run'] + (' *' if r['legacy'] else ''):<32} {r['samples']:>6} {r['delay_frames']:>8} {r['gain']:>8.2f} "
+                  f"{r['damping']:>8.2f} {r['bias']:>9.1f} {r['r2']:>6.2f}")
+    fitted = [r for r in runs if 'skipped' not in r]
+    print(f"{len(paths)} 个文件，拟合 {len(fitted)} 个，耗时 {elapsed:.1f} s；单次运行 R² 中位数 "
+          f"{np.median([r['r2'] for r in fitted]):.2f}，{sum(r['r2'] >= args.min_r2 for r in fitted)} 个参与合并拟合")
+    legacy = sum(r['legacy'] for r in fitted)
+    if legacy:
+        print(f"警告: {legacy} 个旧日志 (*) 没有Servo Command列，按 '{legacy_table}' 阈值表和默认微调参数回放重建指令，"
+              f"精准模式的指令只是近似；--no-legacy 只用带该列的日志")
+    print(f"合并模型: a = {model.gain:.2f} * u[k-{model.delay_frames}] - ({model.damping:.2f}) * v + ({model.bias:.1f}), "
+          f"纯滞后 {model.delay_frames * model.frame_period * 1000:.0f} ms, R² {model.r2:.2f}")
+    save_model(model, runs, args.out, max_delay=args.max_delay, window=args.window, center=args.center,
+               min_r2=args.min_r2, legacy_table=legacy_table)
+    print(f"模型已保存到 {args.out}")
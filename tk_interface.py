@@ -6,8 +6,15 @@ import threading
 import tkinter as tk
 from tkinter import ttk, font
 from driver import ServoDriver
-from pid import PID
+from device_discovery import discover_devices
+from cascade_controller import CascadeController
 from data_logger import DataLogger
+from ball_detector import BallDetector, RED_HSV_RANGES
+from camera_grabber import FrameGrabber
+import clock
+from state_estimator import KalmanFilter
+from servo_commander import ServoCommander
+from servo_feedback import ServoFeedback
 import Jetson.GPIO as GPIO
 output_pin = 37  #J41_BOARD_PIN37---gpio12/GPIO.B26/SPI2_MOSI
  
@@ -33,23 +40,38 @@ class MainApplication(tk.Tk):
         self.prev_x = None
         self.prev_y = None
         self.prev_time = None
-        self.count = 0
         self.tar_pos_px = 0  # 默认目标位置(像素)
         self.tar_pos = self.px_to_mm(self.tar_pos_px)  # 默认目标位置(毫米)
-        self.status = False
-        self.fine_tune_status = False
-        self.precision_mode_count = 0
-        self.precision_mode_locked = False
         self.show_camera = False  # 不显示摄像头画面
         
         # 初始化驱动和PID控制器
-        self.driver = ServoDriver()
-        self.degree_pid = PID(Kp=0.22, Ki=0, Kd=0.01, lim=10000)  # 速度-角度PID参数
-        self.pos_pid = PID(Kp=4, Ki=0, Kd=0.6, lim=30)  # 位置-速度PID参数
-        self.fine_tune_pid = PID(Kp=0.05, Ki=0, Kd=0.005, lim=5)  # 微调PID参数
+        # 并行查找摄像头和舵机串口，结果按USB id缓存，下次启动只验证缓存的设备
+        self.devices = discover_devices(preferred_camera=0)
+        self.driver = ServoDriver(port=self.devices.serial_port, async_mode=True)  # 异步模式，控制循环不等待串口应答
+        self.commander = ServoCommander(self.driver)  # 合并同一周期内的重复指令
+        self.feedback = ServoFeedback(self.driver, [1]).start()  # 后台轮询舵机当前位置
+        # 位置-速度-角度级联控制和模式切换，PID参数: 位置-速度 (4, 0, 0.6)，速度-角度 (0.22, 0, 0.01)，微调 (0.05, 0, 0.005)
+        self.controller = CascadeController(pos_gains=(4, 0, 0.6, 30), degree_gains=(0.22, 0, 0.01, 10000),
+                                            fine_tune_gains=(0.05, 0, 0.005, 5), target=self.tar_pos_px, table='tk')
         
-        # 初始化数据记录器
-        self.data_logger = DataLogger()
+        # 初始化数据记录器，界面不绘制历史曲线，内存中只保留最近60秒（文件中是完整数据）
+        self.data_logger = DataLogger(file_format='binary', history_seconds=60)
+        # 附加日志通道，用于分析时序和控制过程
+        self.ch_frame = self.data_logger.add_channel('Frame Seq', '<i4', '', '处理的帧序号')
+        self.ch_dt = self.data_logger.add_channel('dt', '<f4', 's', '控制周期')
+        self.ch_detect_time = self.data_logger.add_channel('Detect Time', '<f4', 's', '小球检测耗时')
+        self.ch_control_time = self.data_logger.add_channel('Control Time', '<f4', 's', '检测之后到发送舵机指令的耗时')
+        self.ch_latency = self.data_logger.add_channel('Latency', '<f4', 's', '帧采集到发送舵机指令的时间')
+        self.ch_error = self.data_logger.add_channel('Position Error', '<f4', 'px', '目标位置减当前位置')
+        self.ch_fine_tune = self.data_logger.add_channel('Fine Tune Angle', '<f4', 'step', '精确定位模式的微调目标')
+        self.ch_mode = self.data_logger.add_channel('Mode', '<i1', '', '0 跟踪模式, 1 精准模式, 2 精准模式且已锁定')
+        self.ch_servo_cmd = self.data_logger.add_channel('Servo Command', '<f4', 'step', '本周期实际发送的舵机目标')
+        
+        # 初始化小球检测器（找到小球后只处理ROI），使用绿色小球时改为GREEN_HSV_RANGES
+        self.detector = BallDetector(RED_HSV_RANGES)
+        
+        # 初始化位置/速度估计器，latency可设为相机加执行的延迟 (s) 以提前预测
+        self.estimator = KalmanFilter('cv', latency=0.0)
         
         # 创建界面
         self.create_widgets()
@@ -166,6 +188,7 @@ class MainApplication(tk.Tk):
         try:
             self.tar_pos = self.target_var.get()  # 获取毫米值
             self.tar_pos_px = self.mm_to_px(self.tar_pos)  # 转换为像素值
+            self.controller.target = self.tar_pos_px
             print(f'目标位置已设置为: {self.tar_pos} mm ({self.tar_pos_px:.2f} px)')
         except tk.TclError:
             # 如果转换出错，重置为当前值
@@ -183,12 +206,9 @@ class MainApplication(tk.Tk):
     
     def reset_system(self):
         # 重置系统状态
-        self.driver.move_degree(1, 2100, 0, 100)
-        self.status = False
-        self.fine_tune_status = False
-        self.precision_mode_count = 0
-        self.precision_mode_locked = False
-        self.count = 0
+        self.commander.move_now(1, 2100, 0, 100)
+        self.controller.reset()
+        self.data_logger.flush()  # 重置时把已记录的数据写入文件
         print('系统已重置')
         
         # 更新UI
@@ -199,191 +219,127 @@ class MainApplication(tk.Tk):
         self.after(100, self.update_ui)  # 每100毫秒调用一次
     
     def camera_processing_loop(self):
-        # 尝试打开摄像头
-        for i in range(4):  # 尝试0-3号摄像头
-            cap = cv2.VideoCapture(0)  # 从原始代码中可以看出使用的是2号摄像头
-            if cap.isOpened():
-                print(f'成功打开摄像头 #{i}')
-                break
+        # 打开启动时找到的摄像头，没有找到时使用默认编号
+        camera_index = self.devices.camera if self.devices.camera is not None else 0
+        cap = cv2.VideoCapture(camera_index)
+        if cap.isOpened():
+            print(f'成功打开摄像头 #{camera_index}')
         
         if not cap.isOpened():
             print('无法打开摄像头')
             return
         
-        self.driver.move_degree(1, 2100, 0, 100)  # 控制ID为1的舵机
+        self.commander.move_now(1, 2100, 0, 100)  # 控制ID为1的舵机
         time.sleep(0.5)
         
+        # 启动后台取帧线程，循环中总是处理最新一帧
+        grabber = FrameGrabber(cap).start()
+        
         while True:
             try:
-                ret, frame = cap.read()
+                ret, frame, frame_time, frame_seq = grabber.read()
                 if not ret:
                     print('无法获取画面')
                     break
                 
-                # ##转换到HSV颜色空间
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                
-                # 定义红色的HSV范围
-                lower_red = (0, 120, 70)
-                upper_red = (10, 255, 255)
-                lower_red2 = (170, 120, 70)
-                upper_red2 = (180, 255, 255)
-                
-                # 创建红色掩码
-                mask1 = cv2.inRange(hsv, lower_red, upper_red)
-                mask2 = cv2.inRange(hsv, lower_red2, upper_red2)
-                mask = cv2.bitwise_or(mask1, mask2)
-#
-#
-                #
-                #
-                ## 查找轮廓
-                contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-                ## 转换到HSV颜色空间
-                #hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-#
-                ## 定义绿色的HSV范围（替换原来的红色范围）
-                #lower_green = (35, 50, 50)    # 色相(H)范围35-85
-                #upper_green = (85, 255, 255)
-#
-                ## 创建绿色掩码（删除原来的红色掩码）
-                #mask = cv2.inRange(hsv, lower_green, upper_green)
-#
-                ## 查找轮廓
-                #contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-
+                # 检测小球（跟踪模式下只处理预测位置附近的ROI）
+                detect_start = time.perf_counter()
+                ball = self.detector.detect(frame)
+                detect_end = time.perf_counter()
                 
-                if len(contours) > 0:
-                    # 找到最大轮廓
-                    c = max(contours, key=cv2.contourArea)
+                if ball is not None:
+                    ((x, y), radius) = ball
+                    
+                    scale = 1
+                    cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
+                    cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
                     
-                    # 获取最小外接圆
-                    ((x, y), radius) = cv2.minEnclosingCircle(c)
+                    # 计算速度
+                    current_time = frame_time  # 使用采集时刻计算速度
+                    # 用状态估计器滤波位置并估计速度
+                    est_x, est_speed = self.estimator.update(x, current_time)
                     
-                    if radius > 10:  # 过滤小噪点
-                        scale = 1
-                        cv2.circle(frame, (int(x*scale), int(y*scale)), int(radius*scale), (0, 255, 255), 2)
-                        cv2.circle(frame, (int(x*scale), int(y*scale)), 5*scale, (0, 0, 255), -1)
+                    if self.prev_x is not None and self.prev_y is not None and self.prev_time is not None:
+                        # 计算时间差
+                        dt = current_time - self.prev_time
                         
-                        # 计算速度
-                        current_time = time.time()
+                        # 使用估计器输出的速度 (像素/秒)
+                        cur_speed_px = est_speed
                         
-                        if self.prev_x is not None and self.prev_y is not None and self.prev_time is not None:
-                            # 计算位移
-                            dx = x - self.prev_x
-                            distance = dx
-                            
-                            # 计算时间差
-                            dt = current_time - self.prev_time
-                            
-                            # 计算速度 (像素/秒)
-                            cur_speed_px = distance / dt if dt > 0 else 0
-                            
-                            # 显示速度和坐标
-                            cv2.putText(frame, f'Ball: ({int(x)}, {int(y)})', 
-                                      (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                            cv2.putText(frame, f'Speed: {cur_speed_px:.1f} px/s', 
-                                      (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                            
-                            cur_pos_px = x - 320
-                            cur_pos = self.px_to_mm(cur_pos_px)  # 转换为毫米
-                            cur_speed = self.px_to_mm(cur_speed_px)  # 转换为毫米/秒
-                            
-                            print(f'cur_pos:{cur_pos_px} px ({cur_pos:.2f} mm)')
-                            
-                            # 更新UI
-                            self.after(10, lambda: self.update_position_display(cur_pos))
-                            self.after(10, lambda: self.update_speed_display(cur_speed))
-                            
-                            # 位置闭环控制 (使用像素值进行PID计算)
-                            tar_speed = self.pos_pid.update(self.tar_pos_px, cur_pos_px, dt)
-                            print(f'tar_speed:{tar_speed}')
-                            
-                            # 角度闭环控制
-                            tar_degree = self.degree_pid.update(tar_speed, cur_speed_px, dt)
-                            
-                            # 记录数据
-                            self.data_logger.log_data(tar_speed, cur_pos_px, cur_speed_px, tar_degree)
-                            
-                            # 将控制输出映射到舵机角度
-                            servo_angle = 2100 + int(tar_degree)  # 2048为中心位置
-                            servo_angle = max(2000, min(2200, servo_angle))  # 限制在安全范围内
-                            servo_angle_tiny = 2100 + int(tar_degree/10)
-                            servo_angle_tiny = max(2050, min(2150, servo_angle_tiny))
-                            
-                            print(f'servo_angle:{servo_angle}')
-                            
-                            # 计算当前误差
-                            current_error_px = abs(self.tar_pos_px - cur_pos_px)
-                            current_error = abs(self.tar_pos - cur_pos)  # 毫米误差
-                            
-                            # 更新UI
-                            self.after(10, lambda: self.update_error_display(current_error))
-                            
-                            # 检测是否应该退出精准模式
-                            if self.precision_mode_locked and current_error_px > 10:
-                                print('######### 误差过大，退出锁定精准模式 #########')
-                                self.precision_mode_locked = False
-                                self.precision_mode_count = 0
-                                self.status = False
-                                
-                                # 更新UI
-                                self.after(10, lambda: self.update_mode_display('跟踪模式', '未锁定'))
-                            
-                            # 检测是否接近目标位置
-                            if not self.precision_mode_locked:
-                                if((abs(cur_speed_px) < 50) and current_error_px < 8):
-                                    self.status = True
-                                    self.precision_mode_count += 1
-                                    print(f'进入精准模式第 {self.precision_mode_count} 次')
-                                    
-                                    # 如果进入精准模式次数达到10次，锁定精准模式
-                                    if self.precision_mode_count >= 10:
-                                        self.precision_mode_locked = True
-                                        print('######### 已锁定精准模式 #########')
-                                        self.after(5, lambda: self.update_mode_display('精准模式', '已锁定'))
-                                
-                                if((abs(cur_speed_px) > 50) or current_error_px > 10):
-                                    self.status = False
-                                    # 如果未锁定，则重置计数
-                                    if not self.precision_mode_locked:
-                                        self.precision_mode_count = 0
-                                        self.after(10, lambda: self.update_mode_display('跟踪模式', '未锁定'))
-                            
-                            # 显示当前模式和锁定状态
-                            mode_text = '精准模式' if self.status else '跟踪模式'
-                            lock_text = '已锁定' if self.precision_mode_locked else '未锁定'
-                            cv2.putText(frame, f'模式: {mode_text} ({lock_text})', 
-                                      (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                            cv2.putText(frame, f'误差: {current_error_px:.2f} px ({current_error:.2f} mm)', 
-                                      (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
-                            
-                            if(self.status):
-                                print('######### 进入精确定位模式 #########')
-                                # 使用微调PID进行更精确的控制
-                                fine_tune_degree = self.fine_tune_pid.update(self.tar_pos_px, cur_pos_px, dt)
-                                fine_tune_angle = 2100 + int(fine_tune_degree)
-                                fine_tune_angle = max(2080, min(2120, fine_tune_angle))
-                                
-                                print(f'微调角度: {fine_tune_angle}, 误差: {self.tar_pos-cur_pos:.2f} mm')
-                                self.driver.move_degree(1, fine_tune_angle, 0, 200)
-                                self.count += 1
-                                self.fine_tune_status = True
-
-                                if(self.count > 10 and self.fine_tune_status == True and abs(cur_speed_px) <5 and current_error < 3):
-                                    print('######### 精确定位完成 #########')
-                                    self.driver.move_degree(1, 2100, 0, 100)
-                                    
-                                    GPIO.output(output_pin, GPIO.HIGH)
-                                    print(f'误差: {self.tar_pos-cur_pos:.2f} mm')
-                            else:
-                                # 使用常规PID控制
-                                self.driver.move_degree(1, servo_angle, 0, 500)
+                        # 显示速度和坐标
+                        cv2.putText(frame, f'Ball: ({int(x)}, {int(y)})', 
+                                  (10*20, 60*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                        cv2.putText(frame, f'Speed: {cur_speed_px:.1f} px/s', 
+                                  (10*20, 90*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                        
+                        cur_pos_px = est_x - 320
+                        cur_pos = self.px_to_mm(cur_pos_px)  # 转换为毫米
+                        cur_speed = self.px_to_mm(cur_speed_px)  # 转换为毫米/秒
+                        
+                        print(f'cur_pos:{cur_pos_px} px ({cur_pos:.2f} mm)')
                         
-                        # 更新上一帧信息
-                        self.prev_x = x
-                        self.prev_y = y
-                        self.prev_time = current_time
+                        # 更新UI
+                        self.after(10, lambda: self.update_position_display(cur_pos))
+                        self.after(10, lambda: self.update_speed_display(cur_speed))
+                        
+                        # 级联控制和模式切换 (使用像素值计算，阈值见cascade_controller.PROFILES['tk'])
+                        prev_mode = self.controller.mode
+                        out = self.controller.step((cur_pos_px, cur_speed_px), dt)
+                        print(f'tar_speed:{out.tar_speed}, servo_angle:{out.goal}')
+                        
+                        # 记录数据
+                        self.data_logger.log_data(out.tar_speed, cur_pos_px, cur_speed_px, out.tar_degree, self.feedback.position(1), current_time)
+                        self.data_logger.set(self.ch_frame, frame_seq)
+                        self.data_logger.set(self.ch_dt, dt)
+                        self.data_logger.set(self.ch_detect_time, detect_end - detect_start)
+                        self.data_logger.set(self.ch_error, self.tar_pos_px - cur_pos_px)
+                        self.data_logger.set(self.ch_mode, out.mode)
+                        
+                        # 计算当前误差
+                        current_error_px = out.error
+                        current_error = abs(self.tar_pos - cur_pos)  # 毫米误差
+                        
+                        # 显示当前模式和锁定状态
+                        mode_text = '精准模式' if self.controller.status else '跟踪模式'
+                        lock_text = '已锁定' if self.controller.precision_mode_locked else '未锁定'
+                        
+                        # 更新UI
+                        self.after(10, lambda: self.update_error_display(current_error))
+                        if out.mode != prev_mode:
+                            print(f'######### {mode_text} ({lock_text}) #########')
+                            self.after(10, lambda: self.update_mode_display(mode_text, lock_text))
+                        
+                        cv2.putText(frame, f'模式: {mode_text} ({lock_text})', 
+                                  (10*20, 120*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                        cv2.putText(frame, f'误差: {current_error_px:.2f} px ({current_error:.2f} mm)', 
+                                  (10*20, 150*20), cv2.FONT_HERSHEY_SIMPLEX, 0.8*2, (0, 255, 0), 2*2)
+                        
+                        if out.fine_tune_angle is not None:
+                            self.data_logger.set(self.ch_fine_tune, out.fine_tune_angle)
+                            print(f'微调角度: {out.fine_tune_angle}, 误差: {self.tar_pos-cur_pos:.2f} mm')
+                        if out.done:
+                            print('######### 精确定位完成 #########')
+                            GPIO.output(output_pin, GPIO.HIGH)
+                            print(f'误差: {self.tar_pos-cur_pos:.2f} mm')
+                        
+                        self.commander.request(1, out.goal, 0, out.speed)
+                    
+                    # 发送本帧最后请求的舵机目标
+                    sent = self.commander.flush()
+                    if self.prev_x is not None:
+                        if 1 in sent:
+                            self.data_logger.set(self.ch_servo_cmd, sent[1][0])
+                        self.data_logger.set(self.ch_control_time, time.perf_counter() - detect_end)
+                        self.data_logger.set(self.ch_latency, clock.now() - current_time)
+                    
+                    # 更新上一帧信息
+                    self.prev_x = x
+                    self.prev_y = y
+                    self.prev_time = current_time
+            
+                else:
+                    # 本帧未检测到小球，估计器继续外推
+                    self.estimator.coast(frame_time)
                 
                 # 仅当需要显示摄像头画面时才显示
                 if self.show_camera:
@@ -397,7 +353,13 @@ class MainApplication(tk.Tk):
                 print(f'处理帧时出错: {e}')
                 continue
         
-        cap.release()
+        grabber.release()
+        print(f'丢弃的旧帧数: {grabber.dropped}')
+        print(f'舵机指令统计: {self.commander.stats()}')
+        self.feedback.stop()
+        print(f'舵机反馈统计: {self.feedback.stats()}')
+        self.driver.latency.print_stats()
+        self.data_logger.flush()  # 写完队列中的数据
         cv2.destroyAllWindows()
     
     def update_position_display(self, position):
@@ -415,6 +377,9 @@ class MainApplication(tk.Tk):
 def main():
     app = MainApplication()
     app.mainloop()
+    # 窗口关闭后停止舵机反馈轮询，写完剩余数据并关闭日志文件
+    app.feedback.stop()
+    app.data_logger.close()
 
 if __name__ == '__main__':
     main()
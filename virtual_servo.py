@@ -0,0 +1,250 @@
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+from packet_parser import PacketParser
+
+# 控制表地址（与舵机内存表一致）
+ADDR_ID = 0x05
+ADDR_GOAL_POSITION = 0x2A   # 目标位置，2字节
+ADDR_GOAL_TIME = 0x2C       # 运行时间，2字节
+ADDR_GOAL_SPEED = 0x2E      # 运行速度，2字节
+ADDR_PRESENT_POSITION = 0x38  # 当前位置，2字节
+ADDR_PRESENT_SPEED = 0x3A   # 当前速度，2字节，bit15为方向位
+ADDR_PRESENT_LOAD = 0x3C    # 当前负载，2字节，bit10为方向位
+ADDR_VOLTAGE = 0x3E
+ADDR_TEMPERATURE = 0x3F
+ADDR_MOVING = 0x42
+
+
+class VirtualServo:
+    """
+    单个虚拟舵机
+    保存256字节的内存表，按目标位置和运行速度匀速运动
+    """
+    def __init__(self, servo_id, position=2048, max_speed=3400):
+        """
+        Args:
+            servo_id: 舵机ID
+            position: 初始位置
+            max_speed: 运行速度为0时使用的最大速度 (步/s)
+        """
+        self.servo_id = servo_id
+        self.initial_position = position
+        self.max_speed = max_speed
+        self.reset()
+
+    def reset(self):
+        """恢复上电状态"""
+        self.memory = bytearray(256)
+        self.memory[ADDR_ID] = self.servo_id
+        self.memory[ADDR_VOLTAGE] = 120
+        self.memory[ADDR_TEMPERATURE] = 30
+        self.position = float(self.initial_position)
+        self.speed = 0.0
+        self.time = time.perf_counter()
+        self._write_word(ADDR_GOAL_POSITION, self.initial_position)
+        self.registered = None  # reg_write暂存的 (address, data)
+
+    def _word(self, address):
+        return self.memory[address] | (self.memory[address + 1] << 8)
+
+    def _write_word(self, address, value):
+        self.memory[address] = value & 0xFF
+        self.memory[address + 1] = (value >> 8) & 0xFF
+
+    def advance(self, now):
+        """把位置推进到now时刻"""
+        dt = now - self.time
+        self.time = now
+        goal = self._word(ADDR_GOAL_POSITION)
+        speed = self._word(ADDR_GOAL_SPEED) or self.max_speed
+        error = goal - self.position
+        step = speed * dt
+        if abs(error) <= step:
+            self.speed = error / dt if dt > 0 else 0.0
+            self.position = float(goal)
+        else:
+            self.speed = speed if error > 0 else -speed
+            self.position += self.speed * dt
+
+        position = int(round(self.position))
+        self._write_word(ADDR_PRESENT_POSITION, position)
+        speed_value = min(int(abs(self.speed)), 0x7FFF)
+        self._write_word(ADDR_PRESENT_SPEED, speed_value | (0x8000 if self.speed < 0 else 0))
+        self.memory[ADDR_MOVING] = 1 if position != goal else 0
+
+    def read(self, address, length, now):
+        """读取内存表"""
+        self.advance(now)
+        return bytes(self.memory[address:address + length])
+
+    def write(self, address, data, now):
+        """写入内存表，先推进到当前时刻，新的目标从now开始生效"""
+        self.advance(now)
+        self.memory[address:address + len(data)] = data
+
+
+class VirtualServoBus:
+    """
+    虚拟舵机总线
+    在伪终端上模拟一组舵机，支持 ping/读/写/异步写/执行/同步读/同步写/复位 指令，
+    ServoDriver(port=bus.port) 即可像真实串口一样连接
+    """
+    def __init__(self, servo_ids=(1, 2), latency=0.0002, baudrate=1000000):
+        """
+        Args:
+            servo_ids: 总线上的舵机ID
+            latency: 舵机收到指令到开始应答的处理延迟 (s)
+            baudrate: 模拟的波特率，按每字节10位计算传输时间，为None时不模拟传输时间
+        """
+        self.servos = {sid: VirtualServo(sid) for sid in servo_ids}
+        self.latency = latency
+        self.byte_time = 0.0 if not baudrate else 10.0 / baudrate
+        self.parser = PacketParser()  # 指令包与应答包格式相同，第5字节为指令码
+        self.received = 0   # 收到的指令包数
+        self.replied = 0    # 发出的应答包数
+
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.slave = slave
+        self.port = os.ttyname(slave)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """启动模拟线程"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止模拟并关闭伪终端"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _run(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            data = os.read(self.master, 4096)
+            arrived = time.perf_counter()
+            self.parser.feed(data)
+            packet = self.parser.next_packet()
+            while packet is not None:
+                self.received += 1
+                # 指令包在总线上的传输时间
+                self._wait_until(arrived + (len(packet.params) + 6) * self.byte_time)
+                self._handle(packet.servo_id, packet.error, packet.params)
+                packet = self.parser.next_packet()
+
+    def _wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > 0.001:
+            time.sleep(remaining - 0.001)
+        while time.perf_counter() < deadline:
+            pass
+
+    def _reply(self, servo_id, params=b'', error=0):
+        body = bytes([servo_id, len(params) + 2, error]) + bytes(params)
+        packet = b'\xFF\xFF' + body + bytes([~sum(body) & 0xFF])
+        self._wait_until(time.perf_counter() + self.latency)
+        os.write(self.master, packet)
+        self._wait_until(time.perf_counter() + len(packet) * self.byte_time)
+        self.replied += 1
+
+    def _handle(self, servo_id, instruction, params):
+        now = time.perf_counter()
+        broadcast = servo_id == 0xFE
+        targets = list(self.servos.values()) if broadcast else \
+            [self.servos[servo_id]] if servo_id in self.servos else []
+
+        if instruction == 0x82:  # 同步读，按ID顺序逐个应答
+            address, length = params[0], params[1]
+            for sid in params[2:]:
+                if sid in self.servos:
+                    self._reply(sid, self.servos[sid].read(address, length, time.perf_counter()))
+            return
+        if instruction == 0x83:  # 同步写，不应答
+            address, length = params[0], params[1]
+            for i in range(2, len(params), length + 1):
+                servo = self.servos.get(params[i])
+                if servo is not None:
+                    servo.write(address, params[i + 1:i + 1 + length], now)
+            return
+
+        for servo in targets:
+            reply = b''
+            if instruction == 0x02:
+                reply = servo.read(params[0], params[1], now)
+            elif instruction == 0x03:
+                servo.write(params[0], params[1:], now)
+            elif instruction == 0x04:
+                servo.registered = (params[0], params[1:])
+            elif instruction == 0x05:
+                if servo.registered is not None:
+                    servo.write(*servo.registered, now)
+                    servo.registered = None
+            elif instruction in (0x06, 0x0A):
+                servo.reset()
+            elif instruction != 0x01:
+                self._reply(servo.servo_id, error=0x08)  # 未知指令
+                continue
+            if not broadcast:
+                self._reply(servo.servo_id, reply)
+
+
+if __name__ == "__main__":
+    # 用虚拟舵机测试ServoDriver的往返延迟和吞吐量
+    import statistics
+    from driver import ServoDriver
+
+    bus = VirtualServoBus(servo_ids=(1, 2)).start()
+    n = 500
+
+    driver = ServoDriver(port=bus.port)
+    for name, command in (("写目标位置", lambda: driver.move_degree(1, 2100, 0, 1000)),
+                          ("读当前位置", lambda: driver.read_data(1, ADDR_PRESENT_POSITION, 2)),
+                          ("同步读两个舵机", lambda: driver.sync_read(ADDR_PRESENT_POSITION, 2, [1, 2]))):
+        rtts = []
+        for _ in range(n):
+            start = time.perf_counter()
+            command()
+            rtts.append(time.perf_counter() - start)
+        rtts.sort()
+        print(f"同步模式 {name}: 平均 {statistics.mean(rtts) * 1e6:.0f} us, "
+              f"p50 {rtts[n // 2] * 1e6:.0f} us, p99 {rtts[int(n * 0.99)] * 1e6:.0f} us, "
+              f"{n / sum(rtts):.0f} 次/s")
+    driver.latency.print_stats()
+    print(f"超时 {driver.timeouts} 次, 当前位置 {driver.read_data(1, ADDR_PRESENT_POSITION, 2).word()}")
+    driver.close()
+
+    # 异步模式保持window个未应答的指令，总线始终有指令在处理
+    rtts = []
+    driver = ServoDriver(port=bus.port, async_mode=True, on_response=lambda sid, ins, packet, rtt: rtts.append(rtt))
+    for window in (1, 4, 16):
+        rtts.clear()
+        futures = []
+        start = time.perf_counter()
+        for i in range(n):
+            if len(futures) >= window:
+                futures.pop(0).result()
+            futures.append(driver.move_degree(1 + i % 2, 2000 + i % 100, 0, 1000))
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        rtts.sort()
+        print(f"异步模式 窗口{window} 写目标位置: {n / elapsed:.0f} 次/s, "
+              f"往返 p50 {rtts[len(rtts) // 2] * 1e6:.0f} us, 超时 {driver.timeouts} 次")
+    driver.latency.print_stats(buckets=True)
+    driver.close()
+    bus.stop()